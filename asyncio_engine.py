@@ -0,0 +1,170 @@
+# Author:     Kevin Koshiol
+# Filename:   asyncio_engine.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains an asyncio engine for my Server class, selected with the
+"asyncio" or "uvloop" backend. Instead of Server's own poll loop, clients are
+served by asyncio Protocol/Transport objects: transports buffer output, tell
+the protocol when to pause and resume writing, and can pause reading. Server
+keeps calling newClient/received/disconnected exactly as with the poll loop.
+Timers, background tasks, and coroutines can be scheduled on the engine's
+event loop (Server.getEventLoop()).
+'''
+
+import logging
+
+try:
+   import asyncio
+except ImportError:
+   try:
+      import trollius as asyncio # Backport for Python 2
+   except ImportError:
+      asyncio = None
+
+try:
+   import uvloop
+except ImportError:
+   uvloop = None
+
+# Backend names served by this engine instead of Server's poll loop
+ENGINES = ("asyncio", "uvloop")
+
+class ClientProtocol(asyncio.Protocol if asyncio else object):
+   '''Protocol of one client connection; passes every event to the engine.'''
+
+   def __init__(self, engine):
+      '''
+      Constructor: Sets up an unconnected protocol.
+      Argument engine[AsyncioEngine]: Engine serving the connection
+      '''
+      self.engine = engine
+      self.transport = None
+      self.fd = -1
+      self.writePaused = False
+
+   def connection_made(self, transport):
+      self.transport = transport
+      self.fd = transport.get_extra_info("socket").fileno()
+      self.engine.connectionMade(self)
+
+   def data_received(self, data):
+      self.engine.dataReceived(self, data)
+
+   def connection_lost(self, exc):
+      self.engine.connectionLost(self)
+
+   def pause_writing(self):
+      self.writePaused = True
+
+   def resume_writing(self):
+      self.writePaused = False
+
+class AsyncioEngine:
+   '''
+   AsyncioEngine runs an asyncio event loop serving a listening socket. It
+   identifies clients by socket file descriptor, like Server does, and calls
+   back into Server for every connection, read, and disconnection.
+   '''
+
+   def __init__(self, name, connected, received, lost):
+      '''
+      Constructor: Creates the event loop.
+      Arguments:
+      -name[string]: "asyncio" for the standard loop, "uvloop" for uvloop
+      -connected[function]: Called with (fd, address) for a new client
+      -received[function]: Called with (fd, data) when data arrives
+      -lost[function]: Called with (fd) when a client has disconnected
+      '''
+      if asyncio is None:
+         raise ImportError("asyncio engine requires asyncio "
+            "(pip install trollius on Python 2)")
+      if name == "uvloop":
+         if uvloop is None:
+            raise ImportError("uvloop engine requires uvloop")
+         self.__loop = uvloop.new_event_loop()
+      else:
+         self.__loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(self.__loop)
+      self.__connected = connected
+      self.__received = received
+      self.__lost = lost
+      self.__protocols = {} # key: Client ID; Value: ClientProtocol
+      self.__closing = set() # Client IDs closed but not yet disconnected
+
+   def run(self, sock):
+      '''
+      Serves clients connecting to a listening socket until the loop stops.
+      Argument sock[socket]: Bound, listening socket
+      '''
+      server = self.__loop.run_until_complete(self.__loop.create_server(
+         lambda: ClientProtocol(self), sock=sock))
+      try:
+         self.__loop.run_forever()
+      finally:
+         server.close()
+         self.__loop.close()
+
+   def getLoop(self):
+      '''Returns the engine's asyncio event loop'''
+      return self.__loop
+
+   def connectionMade(self, protocol):
+      '''Registers a new client and calls back into the server.'''
+      self.__protocols[protocol.fd] = protocol
+      self.__connected(protocol.fd,
+         protocol.transport.get_extra_info("peername"))
+
+   def dataReceived(self, protocol, data):
+      '''Passes received data on to the server.'''
+      if protocol.fd not in self.__closing:
+         self.__received(protocol.fd, data)
+
+   def connectionLost(self, protocol):
+      '''Unregisters a client and calls back into the server.'''
+      del self.__protocols[protocol.fd]
+      self.__closing.discard(protocol.fd)
+      self.__lost(protocol.fd)
+
+   def isOpen(self, clientID):
+      '''Returns whether a client is connected and not being closed'''
+      return clientID in self.__protocols and clientID not in self.__closing
+
+   def write(self, clientID, data):
+      '''
+      Writes data to a client; the transport buffers what can't be sent yet.
+      Arguments:
+      -clientID[int]: ID of client
+      -data[string]: Data to write
+      '''
+      self.__protocols[clientID].transport.write(data)
+
+   def getBufferedBytes(self, clientID):
+      '''Returns number of bytes the transport has yet to send to a client'''
+      protocol = self.__protocols.get(clientID)
+      if protocol is None:
+         return 0
+      return protocol.transport.get_write_buffer_size()
+
+   def isWritePaused(self, clientID):
+      '''Returns whether a client's transport asked to pause writing'''
+      return self.__protocols[clientID].writePaused
+
+   def close(self, clientID):
+      '''
+      Closes a client's transport once its buffered output has been sent. The
+      server is called back when the connection is lost.
+      Argument clientID[int]: ID of client
+      '''
+      if self.isOpen(clientID):
+         self.__closing.add(clientID)
+         self.__protocols[clientID].transport.close()
+
+   def pauseReading(self, clientID):
+      '''Stops reading from a client until resumeReading is called.'''
+      self.__protocols[clientID].transport.pause_reading()
+
+   def resumeReading(self, clientID):
+      '''Resumes reading from a client.'''
+      self.__protocols[clientID].transport.resume_reading()
@@ -0,0 +1,66 @@
+# Author:     Kevin Koshiol
+# Filename:   clock.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains the monotonic clock Server measures rates and timers
+with. Python 3 has time.monotonic(); on Python 2 the kernel's
+CLOCK_MONOTONIC is read through ctypes. Where neither is available the wall
+clock is used, but only its forward steps are counted, so the time returned
+never goes back when the wall clock is set back.
+'''
+
+import time
+import ctypes
+import ctypes.util
+
+# clock_gettime() clock ID of CLOCK_MONOTONIC (Linux)
+CLOCK_MONOTONIC = 1
+
+class Timespec(ctypes.Structure):
+   '''struct timespec, as filled in by clock_gettime()'''
+   _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def loadClockGettime():
+   '''
+   Returns [function]: clock_gettime() of the C library (librt on older
+   glibc); None if it can't be loaded or has no monotonic clock
+   '''
+   for name in (None, ctypes.util.find_library("rt"),
+         ctypes.util.find_library("c")):
+      try:
+         clockGettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+      except (OSError, AttributeError):
+         continue
+      clockGettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+      clockGettime.restype = ctypes.c_int
+      if clockGettime(CLOCK_MONOTONIC, ctypes.byref(Timespec())) == 0:
+         return clockGettime
+   return None
+
+def kernelMonotonic():
+   '''Returns [float]: Seconds on CLOCK_MONOTONIC'''
+   spec = Timespec()
+   if clockGettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+      raise OSError(ctypes.get_errno(), "clock_gettime failed")
+   return spec.tv_sec + spec.tv_nsec * 1e-9
+
+# Last wall clock reading and seconds counted up to it
+wallState = [time.time(), 0.0]
+
+def wallMonotonic():
+   '''
+   Returns [float]: Seconds the wall clock has stepped forward since this
+   module was loaded; steps back are not counted
+   '''
+   now = time.time()
+   wallState[1] += max(0.0, now - wallState[0])
+   wallState[0] = now
+   return wallState[1]
+
+if hasattr(time, "monotonic"):
+   monotonic = time.monotonic
+else:
+   clockGettime = loadClockGettime()
+   monotonic = kernelMonotonic if clockGettime else wallMonotonic
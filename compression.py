@@ -0,0 +1,57 @@
+# Author:     Kevin Koshiol
+# Filename:   compression.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my CompressionGroup class, a streaming deflate context
+which Server shares among compressing clients whose output streams have been
+the same, so a line broadcast to many of them is compressed once.
+'''
+
+import zlib
+
+# Raw deflate streams, without zlib headers or checksums
+WBITS = -zlib.MAX_WBITS
+
+class CompressionGroup:
+   '''
+   CompressionGroup compresses the output of its member clients with one
+   persistent compressor. Every output batch is sync-flushed, so the
+   receivers can inflate all of it at once, and the next batch still
+   refers back to earlier ones.
+   A group is split when its members are sent different batches: every part
+   continues on a copy of the compressor. Groups are joined again by ending
+   a batch with a full flush, which is a restart point of the stream: later
+   output refers to nothing before it, so members can continue on any one
+   of the compressors. A context takes about 256 KB.
+   '''
+
+   def __init__(self, level, compressor=None):
+      '''
+      Constructor: Sets up a group without members.
+      Arguments:
+      -level[int]: Compression level, 0 (none) to 9 (best)
+      -compressor[object](optional): Compressor to continue from; default
+      starts a new stream
+      '''
+      self.level = level
+      self.compressor = compressor or zlib.compressobj(level, zlib.DEFLATED,
+         WBITS)
+      self.members = set() # Client IDs
+
+   def copy(self):
+      '''Returns [CompressionGroup]: New group continuing this stream'''
+      return CompressionGroup(self.level, self.compressor.copy())
+
+   def compress(self, data, restart=False):
+      '''
+      Compresses one output batch.
+      Arguments:
+      -data[string]: Batch of output
+      -restart[bool](optional): End with a full flush, so the members may
+      continue on another group's compressor
+      Returns [string]: Compressed data
+      '''
+      mode = zlib.Z_FULL_FLUSH if restart else zlib.Z_SYNC_FLUSH
+      return self.compressor.compress(data) + self.compressor.flush(mode)
@@ -0,0 +1,199 @@
+# Author:     Kevin Koshiol
+# Filename:   event_backends.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains the event notification backends my Server class can run
+on. Every backend has the same small interface:
+-register(fd, events)
+-modify(fd, events)
+-unregister(fd)
+-poll(timeout) returns a list of (fd, events)
+-close()
+Events are a mask of the backend's READ, WRITE, and ERROR attributes. Those
+attributes are the native flags of the underlying mechanism, so the event loop
+never has to translate a mask.
+'''
+
+import math
+import select
+
+try:
+   import selectors
+except ImportError:
+   try:
+      import selectors2 as selectors # Backport for Python 2
+   except ImportError:
+      try:
+         from trollius import selectors # Shipped with the asyncio backport
+      except ImportError:
+         selectors = None
+
+class PollBackend:
+   '''Level-triggered backend on select.poll(); the default.'''
+   READ = select.POLLIN
+   WRITE = select.POLLOUT
+   ERROR = select.POLLHUP | select.POLLERR | select.POLLNVAL
+   edgeTriggered = False
+
+   def __init__(self):
+      '''Constructor: Creates the poll object.'''
+      self.__poll = select.poll()
+
+   def register(self, fd, events):
+      '''Watches a file descriptor for a mask of events.'''
+      self.__poll.register(fd, events)
+
+   def modify(self, fd, events):
+      '''Changes the mask of events watched for a file descriptor.'''
+      self.__poll.modify(fd, events)
+
+   def unregister(self, fd):
+      '''Stops watching a file descriptor.'''
+      self.__poll.unregister(fd)
+
+   def poll(self, timeout=None):
+      '''
+      Waits for events.
+      Argument timeout[float](optional): seconds to wait; None waits forever
+      Returns [list]: (fd, events) pairs
+      '''
+      if timeout is not None:
+         # Rounded up, so a timer due in under 1 ms isn't polled for at once
+         timeout = int(math.ceil(timeout * 1000))
+      return self.__poll.poll(timeout)
+
+   def close(self):
+      '''Releases the backend; poll objects hold no resources.'''
+      pass
+
+class EpollBackend:
+   '''
+   Backend on Linux epoll. Costs O(ready) per wait instead of O(registered).
+   In edge-triggered mode an fd is only reported when new data arrives, so
+   the event loop must read and write until the socket would block.
+   '''
+   READ = getattr(select, "EPOLLIN", 0)
+   WRITE = getattr(select, "EPOLLOUT", 0)
+   ERROR = getattr(select, "EPOLLHUP", 0) | getattr(select, "EPOLLERR", 0)
+
+   def __init__(self, edgeTriggered=False):
+      '''
+      Constructor: Creates the epoll object.
+      Argument edgeTriggered[bool](optional): use edge-triggered notification
+      '''
+      self.__epoll = select.epoll()
+      self.edgeTriggered = edgeTriggered
+      self.__flags = select.EPOLLET if edgeTriggered else 0
+
+   def register(self, fd, events):
+      '''Watches a file descriptor for a mask of events.'''
+      self.__epoll.register(fd, events | self.__flags)
+
+   def modify(self, fd, events):
+      '''
+      Changes the mask of events watched for a file descriptor. Modifying
+      re-arms the fd, so an edge-triggered event is reported again if the fd
+      is still ready.
+      '''
+      self.__epoll.modify(fd, events | self.__flags)
+
+   def unregister(self, fd):
+      '''Stops watching a file descriptor.'''
+      self.__epoll.unregister(fd)
+
+   def poll(self, timeout=None):
+      '''
+      Waits for events.
+      Argument timeout[float](optional): seconds to wait; None waits forever
+      Returns [list]: (fd, events) pairs
+      '''
+      if timeout is None:
+         timeout = -1
+      else:
+         # Whole milliseconds, rounded up (Python 2 truncates)
+         timeout = math.ceil(timeout * 1000) / 1000.0
+      return self.__epoll.poll(timeout)
+
+   def close(self):
+      '''Closes the epoll file descriptor.'''
+      self.__epoll.close()
+
+class SelectorsBackend:
+   '''
+   Portable fallback on the selectors module (selectors2 or trollius's on
+   Python 2), which picks the best mechanism of the platform. Errors are
+   reported as read or write readiness; the following recv or send then
+   fails. Selectors can't watch a file descriptor for nothing, so one given
+   an empty mask is taken out of the selector until it is given events
+   again.
+   '''
+   READ = 1 # selectors.EVENT_READ
+   WRITE = 2 # selectors.EVENT_WRITE
+   ERROR = 0
+   edgeTriggered = False
+
+   def __init__(self):
+      '''Constructor: Creates the default selector.'''
+      if selectors is None:
+         raise ImportError("selectors backend requires the selectors module "
+            "(pip install selectors2 or trollius on Python 2)")
+      self.__selector = selectors.DefaultSelector()
+      self.__unwatched = set() # Registered fds with an empty mask
+
+   def register(self, fd, events):
+      '''Watches a file descriptor for a mask of events.'''
+      if events:
+         self.__selector.register(fd, events)
+      else:
+         self.__unwatched.add(fd)
+
+   def modify(self, fd, events):
+      '''Changes the mask of events watched for a file descriptor.'''
+      if fd in self.__unwatched:
+         if events:
+            self.__unwatched.discard(fd)
+            self.__selector.register(fd, events)
+      elif events:
+         self.__selector.modify(fd, events)
+      else:
+         self.__selector.unregister(fd)
+         self.__unwatched.add(fd)
+
+   def unregister(self, fd):
+      '''Stops watching a file descriptor.'''
+      if fd in self.__unwatched:
+         self.__unwatched.discard(fd)
+      else:
+         self.__selector.unregister(fd)
+
+   def poll(self, timeout=None):
+      '''
+      Waits for events.
+      Argument timeout[float](optional): seconds to wait; None waits forever
+      Returns [list]: (fd, events) pairs
+      '''
+      return [(key.fd, mask) for key, mask in self.__selector.select(timeout)]
+
+   def close(self):
+      '''Closes the selector.'''
+      self.__selector.close()
+
+def createBackend(name):
+   '''
+   Returns a new backend by name:
+   -"poll": select.poll(), level-triggered
+   -"epoll": epoll, level-triggered
+   -"epoll-et": epoll, edge-triggered
+   -"selectors": selectors.DefaultSelector()
+   '''
+   if name == "poll":
+      return PollBackend()
+   elif name == "epoll":
+      return EpollBackend()
+   elif name == "epoll-et":
+      return EpollBackend(edgeTriggered=True)
+   elif name == "selectors":
+      return SelectorsBackend()
+   raise ValueError("Unknown event backend: " + str(name))
@@ -0,0 +1,258 @@
+# Author:     Kevin Koshiol
+# Filename:   framing.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my LineFramer class which splits a stream of received data
+into newline-terminated messages, and my BinaryFramer class which splits it
+into length-prefixed frames. They are used by both IRCServer and IRCClient.
+A connection starts with lines. A client may switch it to frames by sending
+the NEGOTIATE line; the server answers with the same line, and every byte
+after those lines, both ways, is a frame. The COMPRESS line is negotiated
+the same way, and every byte after it is compressed.
+'''
+
+import struct
+
+# Frame header: payload length, frame type
+FRAME_HEADER = struct.Struct("!Ic")
+# Frame types
+FRAME_NAME = "N" # Name claimed by a client, or accepted by the server
+FRAME_CHAT = "M" # Chat line or command; relayed chat line
+FRAME_SYSTEM = "S" # Notice from the server
+MAX_FRAME = 65536 # Max payload bytes of a frame
+# Line switching a connection from lines to frames
+NEGOTIATE = "\x00frames 1"
+# Line switching a connection to raw deflate streams (wbits -15), both ways;
+# it must come before NEGOTIATE
+COMPRESS = "\x00deflate 1"
+# Keepalive sent by the server to a quiet client (a line, or a system frame)
+# and the client's answer (a line, or a chat frame)
+PING = "\x00ping"
+PONG = "\x00pong"
+
+def encodeFrame(kind, payload):
+   '''
+   Returns [string]: A frame's wire data
+   Arguments:
+   -kind[string]: Frame type
+   -payload[string]: Frame payload
+   '''
+   return FRAME_HEADER.pack(len(payload), kind) + payload
+
+class LineFramer:
+   '''
+   LineFramer buffers received data in a preallocated bytearray. Sockets read
+   straight into the free space at its end (recv_into), and complete messages
+   are taken off the front by moving an offset instead of slicing the buffer,
+   so every byte is copied once on the way in and once on the way out.
+   Typical use:
+      count = sock.recv_into(framer.getWritable())
+      framer.commit(count)
+      for message in framer.messages():
+         ...
+   '''
+
+   def __init__(self, fragmentSize=0, bufferSize=4096):
+      '''
+      Constructor: Sets up an empty buffer.
+      Arguments:
+      -fragmentSize[int](optional): Once this many bytes are buffered
+      without a newline, they are returned as a piece of the message; a
+      message whose newline has arrived is returned whole. Default 0 waits
+      for the newline no matter how long the message is
+      -bufferSize[int](optional): Initial buffer capacity in bytes
+      '''
+      self.__fragmentSize = fragmentSize
+      self.__buffer = bytearray(max(bufferSize, fragmentSize, 1))
+      self.__start = 0 # First byte not yet returned as a message
+      self.__scan = 0 # First byte not yet searched for a newline
+      self.__end = 0 # End of received data
+
+   def getWritable(self, size=0):
+      '''
+      Returns a writable memoryview of the free space after the buffered data.
+      Buffered data is moved to the front of the buffer only when less than
+      half of the buffer is free, and the buffer grows when it is full.
+      Argument size[int](optional): Minimum free space wanted in bytes
+      Returns [memoryview]: Free space to receive into; call commit afterwards
+      '''
+      capacity = len(self.__buffer)
+      size = max(size, 1)
+      if capacity - self.__end < max(size, capacity // 2) and self.__start:
+         self.__compact()
+      if capacity - self.__end < size:
+         # A new buffer, as views handed out earlier pin the old one's size
+         self.__buffer = self.__buffer + bytearray(max(size, capacity))
+      return memoryview(self.__buffer)[self.__end:]
+
+   def commit(self, count):
+      '''
+      Marks bytes written into the view from getWritable as received.
+      Argument count[int]: Number of bytes written
+      '''
+      self.__end += count
+
+   def feed(self, data):
+      '''
+      Copies received data into the buffer; for data not read from a socket.
+      Argument data[string]: Received data
+      '''
+      view = self.getWritable(len(data))
+      view[:len(data)] = data
+      self.commit(len(data))
+
+   def pending(self):
+      '''Returns number of buffered bytes not yet returned as messages.'''
+      return self.__end - self.__start
+
+   def getPendingData(self):
+      '''Returns [string]: Buffered data not yet returned as messages'''
+      return bytes(self.__buffer[self.__start:self.__end])
+
+   def nextMessage(self):
+      '''
+      Pops the next message from the buffer.
+      Returns [string]: Message without its newline; a fragment if the
+      fragment size has been buffered without a newline; None if no message
+      is complete
+      '''
+      buf = self.__buffer
+      fragmentSize = self.__fragmentSize
+      index = buf.find(b"\n", self.__scan, self.__end)
+      if index >= 0:
+         message = bytes(buf[self.__start:index])
+         self.__start = self.__scan = index + 1
+      elif fragmentSize and self.pending() >= fragmentSize:
+         # Message too big and still unfinished: return a portion of it
+         stop = self.__start + fragmentSize
+         message = bytes(buf[self.__start:stop])
+         self.__start = stop
+         self.__scan = self.__end # Rest has no newline either
+      else:
+         self.__scan = self.__end # Nothing up to here needs searching again
+         return None
+      if self.__start == self.__end:
+         self.__start = self.__scan = self.__end = 0 # Empty: rewind for free
+      return message
+
+   def messages(self):
+      '''
+      Generator popping every complete message from the buffer in one pass.
+      '''
+      message = self.nextMessage()
+      while message is not None:
+         yield message
+         message = self.nextMessage()
+
+   def __compact(self):
+      '''Moves buffered data to the front of the buffer.'''
+      pending = self.pending()
+      self.__buffer[:pending] = self.__buffer[self.__start:self.__end]
+      self.__scan -= self.__start
+      self.__start = 0
+      self.__end = pending
+
+class BinaryFramer:
+   '''
+   BinaryFramer buffers received frames in a preallocated bytearray, like
+   LineFramer, but finds every frame from its header instead of scanning
+   for newlines. The buffer grows to fit the frame being received, so a
+   frame arrives whole however long it is (up to the max frame size).
+   Messages are (type, payload) pairs:
+      count = sock.recv_into(framer.getWritable())
+      framer.commit(count)
+      for kind, payload in framer.messages():
+         ...
+   '''
+
+   def __init__(self, maxFrame=MAX_FRAME, bufferSize=4096):
+      '''
+      Constructor: Sets up an empty buffer.
+      Arguments:
+      -maxFrame[int](optional): Max payload bytes of a frame
+      -bufferSize[int](optional): Initial buffer capacity in bytes
+      '''
+      self.__maxFrame = maxFrame
+      self.__buffer = bytearray(max(bufferSize, FRAME_HEADER.size))
+      self.__start = 0 # First byte of the next frame
+      self.__end = 0 # End of received data
+      self.__frameSize = FRAME_HEADER.size # Bytes the next frame needs
+
+   def getWritable(self, size=0):
+      '''
+      Returns a writable memoryview of the free space after the buffered
+      data, with room for at least the rest of the frame being received.
+      Argument size[int](optional): Minimum free space wanted in bytes
+      Returns [memoryview]: Free space to receive into; call commit afterwards
+      '''
+      capacity = len(self.__buffer)
+      size = max(size, self.__frameSize - self.pending(), 1)
+      if capacity - self.__end < max(size, capacity // 2) and self.__start:
+         self.__compact()
+      if capacity - self.__end < size:
+         self.__buffer = self.__buffer + bytearray(max(size, capacity))
+      return memoryview(self.__buffer)[self.__end:]
+
+   def commit(self, count):
+      '''
+      Marks bytes written into the view from getWritable as received.
+      Argument count[int]: Number of bytes written
+      '''
+      self.__end += count
+
+   def feed(self, data):
+      '''
+      Copies received data into the buffer; for data not read from a socket.
+      Argument data[string]: Received data
+      '''
+      view = self.getWritable(len(data))
+      view[:len(data)] = data
+      self.commit(len(data))
+
+   def pending(self):
+      '''Returns number of buffered bytes not yet returned as frames.'''
+      return self.__end - self.__start
+
+   def getPendingData(self):
+      '''Returns [string]: Buffered data not yet returned as frames'''
+      return bytes(self.__buffer[self.__start:self.__end])
+
+   def nextMessage(self):
+      '''
+      Pops the next frame from the buffer.
+      Returns [tuple]: (type, payload); None if no frame is complete
+      Raises [ValueError]: if a frame is longer than the max frame size
+      '''
+      if self.pending() < FRAME_HEADER.size:
+         return None
+      length, kind = FRAME_HEADER.unpack_from(self.__buffer, self.__start)
+      if length > self.__maxFrame:
+         raise ValueError("Frame of %d bytes is too long" % length)
+      self.__frameSize = FRAME_HEADER.size + length
+      if self.pending() < self.__frameSize:
+         return None
+      start = self.__start + FRAME_HEADER.size
+      payload = bytes(self.__buffer[start:start + length])
+      self.__start = start + length
+      self.__frameSize = FRAME_HEADER.size
+      if self.__start == self.__end:
+         self.__start = self.__end = 0 # Empty: rewind for free
+      return kind, payload
+
+   def messages(self):
+      '''
+      Generator popping every complete frame from the buffer in one pass.
+      '''
+      message = self.nextMessage()
+      while message is not None:
+         yield message
+         message = self.nextMessage()
+
+   def __compact(self):
+      '''Moves buffered data to the front of the buffer.'''
+      pending = self.pending()
+      self.__buffer[:pending] = self.__buffer[self.__start:self.__end]
+      self.__start = 0
+      self.__end = pending
@@ -0,0 +1,387 @@
+# Author:     Kevin Koshiol
+# Filename:   irc_bench.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my load generator and benchmark for IRCServer's relay
+path. It starts an IRCServer on a free port over loopback, connects simulated
+clients which register names and send chat lines carrying timestamps, and
+reports:
+-accept rate: connections greeted per second
+-registration rate: names accepted per second
+-relay rate: chat lines delivered to clients per second
+-fan-out latency percentiles (p50/p99/p999) from send to delivery
+-wire bytes received by the clients, and the server's CPU seconds, which
+show the bandwidth and CPU cost of compression (--compress)
+Every scenario prints one JSON object per line, so results of two server
+versions (--server-dir) can be compared by a script.
+
+Usage:
+   python2 irc_bench.py [--scenario NAME ...] [--clients N] [--rate R]
+      [--duration S] [--backend B] [--workers W] [--server-dir DIR]
+      [--connect-timeout S] [--drain S] [--compress]
+'''
+
+import os
+import sys
+import time
+import json
+import errno
+import signal
+import socket
+import select
+import argparse
+import tempfile
+import subprocess
+
+from irc_client import IRCClient
+
+# Scenario parameters; clients and rate can be scaled from the command line
+# -clients: number of connected clients
+# -senders: number of clients sending chat lines
+# -rate: chat lines per second per sender
+# -slow: fraction of clients which stop reading once registered
+SCENARIOS = {
+   "connect_storm": dict(clients=500, senders=0, rate=0, slow=0.0),
+   "idle_heavy": dict(clients=500, senders=5, rate=20, slow=0.0),
+   "chatty_sender": dict(clients=50, senders=1, rate=1000, slow=0.0),
+   "slow_consumers": dict(clients=100, senders=1, rate=500, slow=0.1),
+}
+SCENARIO_ORDER = ["connect_storm", "idle_heavy", "chatty_sender",
+   "slow_consumers"]
+GREETING = "Hello, what's your name?"
+BENCH_TAG = "bench"
+
+class LoadClient(IRCClient):
+   '''LoadClient is one simulated chat client driven by LoadGenerator.'''
+
+   def __init__(self, index, addr, compress=False):
+      '''
+      Constructor: Starts a non-blocking connect to the server.
+      Arguments:
+      -index[int]: Client number; the client's name is "b<index>"
+      -addr[tuple]: Server address
+      -compress[bool](optional): Compress the connection
+      '''
+      IRCClient.__init__(self)
+      self.index = index
+      self.name = "b" + str(index)
+      self.startConnect(addr)
+      if compress:
+         self.requestCompression()
+      self.slow = False
+      self.connected = False
+      self.greeted = None # Time the greeting arrived
+      self.registered = None # Time the client saw its own name accepted
+      self.closed = False
+      self.sequence = 0
+
+class LoadGenerator:
+   '''
+   LoadGenerator drives many LoadClients from one poll loop, so a single
+   process can simulate thousands of connections.
+   '''
+
+   def __init__(self, addr, compress=False):
+      '''
+      Constructor: Sets up an empty generator.
+      Arguments:
+      -addr[tuple]: Server address
+      -compress[bool](optional): Compress every client's connection
+      '''
+      self.addr = addr
+      self.compress = compress
+      self.poll = select.poll()
+      self.clients = {} # key: Socket fd; Value: LoadClient
+      self.latencies = []
+      self.delivered = 0
+
+   def connect(self, count, timeout):
+      '''
+      Connects and registers clients, waiting until every client has seen
+      its name accepted or the timeout has passed.
+      Arguments:
+      -count[int]: Number of clients
+      -timeout[float]: Max seconds to wait
+      Returns [tuple]: (start time, list of clients)
+      '''
+      start = time.time()
+      clients = []
+      for index in range(count):
+         client = LoadClient(index, self.addr, self.compress)
+         self.clients[client.sock.fileno()] = client
+         self.poll.register(client.sock, select.POLLOUT)
+         clients.append(client)
+      deadline = start + timeout
+      while time.time() < deadline and \
+            not all(client.registered or client.closed for client in clients):
+         self.step(0.05)
+      return start, clients
+
+   def step(self, timeout):
+      '''
+      Handles one poll wake-up for every client.
+      Argument timeout[float]: Seconds to wait for events
+      '''
+      for fd, event in self.poll.poll(timeout * 1000):
+         client = self.clients[fd]
+         if event & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+            self.close(client)
+            continue
+         if event & select.POLLOUT:
+            if not client.connected:
+               client.connected = True
+            self.flush(client)
+         if event & select.POLLIN:
+            self.read(client)
+
+   def read(self, client):
+      '''Reads and handles every line waiting for a client.'''
+      lines = client.receive()
+      if client.disconnected:
+         self.close(client)
+         return
+      now = time.time()
+      for line in lines:
+         # Relayed chat lines are "name::bench <sequence> <time sent>"
+         fields = line.split(":", 2)
+         if len(fields) == 3 and fields[2].startswith(BENCH_TAG):
+            self.delivered += 1
+            self.latencies.append(now - float(fields[2].split()[2]))
+         elif line == GREETING:
+            client.greeted = now
+            self.send(client, client.name)
+         elif line.startswith(client.name + ":") and \
+               line.endswith(" Connected"):
+            client.registered = now
+            if client.slow:
+               self.poll.modify(client.sock, 0) # Never read again
+      if client.hasPending():
+         self.flush(client) # Keepalive answers
+
+   def send(self, client, line):
+      '''Queues a line for a client and writes what the socket accepts.'''
+      client.send(line)
+      self.flush(client)
+
+   def flush(self, client):
+      '''Writes a client's pending output; watches POLLOUT until done.'''
+      if client.closed or not client.connected:
+         return
+      try:
+         done = client.flush()
+      except socket.error:
+         self.close(client)
+         return
+      events = 0 if client.slow and client.registered else select.POLLIN
+      if not done:
+         events |= select.POLLOUT
+      self.poll.modify(client.sock, events)
+
+   def sendChat(self, client):
+      '''Sends one timestamped chat line from a client.'''
+      client.sequence += 1
+      self.send(client, " ".join([BENCH_TAG, str(client.sequence),
+         repr(time.time())]))
+
+   def close(self, client):
+      '''Closes a client's connection.'''
+      if not client.closed:
+         client.closed = True
+         self.poll.unregister(client.sock)
+         client.close()
+
+   def closeAll(self):
+      '''Closes every client's connection.'''
+      for client in self.clients.values():
+         self.close(client)
+
+def findPortOffset():
+   '''Returns an IRCServer port offset whose port is currently free.'''
+   sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+   sock.bind(("127.0.0.1", 0))
+   port = sock.getsockname()[1]
+   sock.close()
+   return port - 164 # IRCServer.PORT_NUMBER
+
+def startServer(backend, workers, serverDir):
+   '''
+   Starts an IRCServer in a child process.
+   Arguments:
+   -backend[string]: Event backend
+   -workers[int]: Number of worker processes
+   -serverDir[string]: Directory holding the server version to measure
+   Returns [tuple]: (process, server address)
+   '''
+   offset = findPortOffset()
+   code = "; ".join([
+      "import sys",
+      "sys.path.insert(0, %r)" % serverDir,
+      "from irc_server import IRCServer",
+      # Versions older than the backend argument only run on poll
+      "server = IRCServer(%d, '127.0.0.1'%s)" % (offset,
+         "" if backend == "poll" else ", backend=%r" % backend),
+      "server.setWorkers(%d)" % workers if workers > 1 else "pass",
+      "server.start()"])
+   env = dict(os.environ, HOME=tempfile.mkdtemp(prefix="irc_bench"))
+   process = subprocess.Popen([sys.executable, "-c", code], env=env,
+      stderr=open(os.devnull, "w"))
+   addr = ("127.0.0.1", offset + 164)
+   deadline = time.time() + 10
+   while time.time() < deadline:
+      probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      if probe.connect_ex(addr) == 0:
+         probe.close()
+         return process, addr
+      probe.close()
+      time.sleep(0.05)
+   process.kill()
+   raise RuntimeError("Server did not start listening on " + str(addr))
+
+def percentile(values, fraction):
+   '''Returns the value at a fraction (0-1) of a sorted list; 0 if empty.'''
+   if not values:
+      return 0.0
+   return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def rate(count, first, last):
+   '''Returns events per second between two times; 0 if unmeasurable.'''
+   if count and last > first:
+      return count / (last - first)
+   return 0.0
+
+def runScenario(name, options):
+   '''
+   Runs one scenario against a new server.
+   Arguments:
+   -name[string]: Scenario name
+   -options[Namespace]: Command line options
+   Returns [dict]: Results
+   '''
+   params = dict(SCENARIOS[name])
+   if options.clients:
+      params["clients"] = options.clients
+   if options.rate:
+      params["rate"] = options.rate
+   process, addr = startServer(options.backend, options.workers,
+      options.server_dir)
+   generator = LoadGenerator(addr, options.compress)
+   try:
+      slowCount = int(params["clients"] * params["slow"])
+      start, clients = generator.connect(params["clients"],
+         options.connect_timeout)
+      greeted = [c.greeted for c in clients if c.greeted]
+      registered = [c.registered for c in clients if c.registered]
+      # Slow consumers are the last clients; they stop reading from here on
+      for client in clients[len(clients) - slowCount:]:
+         client.slow = True
+         if client.registered and not client.closed:
+            generator.poll.modify(client.sock, 0)
+      generator.latencies = []
+      generator.delivered = 0
+      senders = [c for c in clients[:params["senders"]] if c.registered]
+      sent = 0
+      relayStart = time.time()
+      if senders and params["rate"]:
+         interval = 1.0 / params["rate"]
+         nextSend = relayStart
+         end = relayStart + options.duration
+         while time.time() < end:
+            now = time.time()
+            while nextSend <= now:
+               for sender in senders:
+                  if not sender.closed:
+                     generator.sendChat(sender)
+                     sent += 1
+               nextSend += interval
+            generator.step(max(0.0, min(nextSend, end) - time.time()))
+      readers = [c for c in clients if c.registered and not c.slow]
+      expected = sent * len(readers)
+      drainEnd = time.time() + options.drain
+      while generator.delivered < expected and time.time() < drainEnd:
+         generator.step(0.05)
+      relayEnd = time.time()
+      # Slow consumers the server gave up on see their connection reset
+      slowDropped = 0
+      for client in clients[len(clients) - slowCount:]:
+         try:
+            while client.sock.recv(65536):
+               pass
+         except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+               slowDropped += 1
+            continue
+         slowDropped += 1
+      latencies = sorted(generator.latencies)
+      result = {
+         "scenario": name,
+         "backend": options.backend,
+         "workers": options.workers,
+         "compress": options.compress,
+         "clients": params["clients"],
+         "senders": len(senders),
+         "rate": params["rate"],
+         "connected": len(greeted),
+         "registered": len(registered),
+         "accept_per_sec": round(rate(len(greeted), start,
+            max(greeted or [start])), 1),
+         "registered_per_sec": round(rate(len(registered), start,
+            max(registered or [start])), 1),
+         "sent": sent,
+         "delivered": generator.delivered,
+         "expected": expected,
+         "relayed_per_sec": round(rate(generator.delivered, relayStart,
+            relayEnd), 1),
+         "latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "p999": round(percentile(latencies, 0.999) * 1000, 3),
+            "max": round((latencies[-1] if latencies else 0.0) * 1000, 3),
+         },
+         "slow_consumers": slowCount,
+         "slow_dropped": slowDropped,
+         "wire_bytes_in": sum(c.receivedBytes for c in clients),
+         "wire_bytes_out": sum(c.sentBytes for c in clients),
+      }
+   finally:
+      generator.closeAll()
+      process.terminate()
+      # The server's CPU time over the whole scenario, startup included
+      usage = os.wait4(process.pid, 0)[2]
+      process.returncode = -signal.SIGTERM
+   result["server_cpu_sec"] = round(usage.ru_utime + usage.ru_stime, 3)
+   return result
+
+def main(argv):
+   '''Parses the command line and runs the chosen scenarios.'''
+   parser = argparse.ArgumentParser(description="Benchmark IRCServer's "
+      "relay path over loopback; prints one JSON object per scenario.")
+   parser.add_argument("--scenario", action="append", choices=SCENARIO_ORDER,
+      help="scenario to run (repeatable); default runs all")
+   parser.add_argument("--clients", type=int, default=0,
+      help="number of clients, overriding the scenario's")
+   parser.add_argument("--rate", type=float, default=0,
+      help="lines per second per sender, overriding the scenario's")
+   parser.add_argument("--duration", type=float, default=5.0,
+      help="seconds of sending per scenario")
+   parser.add_argument("--connect-timeout", type=float, default=30.0,
+      help="max seconds to wait for clients to connect and register")
+   parser.add_argument("--drain", type=float, default=5.0,
+      help="max seconds to wait for deliveries after sending")
+   parser.add_argument("--backend", default="poll",
+      help="server event backend")
+   parser.add_argument("--workers", type=int, default=1,
+      help="server worker processes")
+   parser.add_argument("--compress", action="store_true",
+      help="compress every client's connection")
+   parser.add_argument("--server-dir",
+      default=os.path.dirname(os.path.abspath(__file__)),
+      help="directory of the server version to measure")
+   options = parser.parse_args(argv)
+   for name in options.scenario or SCENARIO_ORDER:
+      print(json.dumps(runScenario(name, options), sort_keys=True))
+      sys.stdout.flush()
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,420 @@
+# Author:     Kevin Koshiol
+# Filename:   irc_client.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my IRCClient class, the client side of the chat protocol
+without any GUI, for bots, bridges, probes and load generators. IRCGUI and
+irc_bench are built on it. IRCClientProtocol serves asyncio programs.
+Run as a program, it pipes stdin into the room and prints the room to stdout:
+   python2 irc_client.py HOST PORT [--name NAME] [--stay] [--frames]
+      [--compress]
+'''
+
+import os
+import sys
+import zlib
+import errno
+import socket
+import select
+import argparse
+import collections
+
+import framing
+import compression
+
+from framing import LineFramer, BinaryFramer
+from asyncio_engine import asyncio
+
+class IRCClient:
+   '''
+   IRCClient is one connection to an IRCServer. Lines to send are queued
+   and written together by flush, so many lines cost one system call.
+   Received data is split into lines by a LineFramer, or into frames by a
+   BinaryFramer once the connection has switched to frames (requestFrames).
+   A compressed connection (requestCompression) deflates every flush and
+   inflates every read; receivedBytes and sentBytes count wire bytes.
+   Keepalives from the server (framing.PING) are not returned as messages;
+   their answer is queued, to be written by the next flush.
+   The socket may be blocking (connect) or non-blocking (startConnect); with
+   a non-blocking socket, receive and flush never wait, and the caller
+   watches the socket (fileno) for readiness.
+   Typical blocking use:
+      client = IRCClient()
+      client.connect("localhost", 164)
+      client.send("bot")
+      client.flush()
+      for line in client.lines():
+         ...
+   '''
+   READ_SIZE = 65536 # Bytes asked for by each read
+   MAX_FRAME = 1048576 # Max payload bytes of a frame from the server
+
+   def __init__(self):
+      '''Constructor: Sets up an unconnected client.'''
+      self.sock = None
+      self.framer = LineFramer()
+      self.disconnected = False # Server closed the connection
+      self.framed = False # Lines are sent as frames
+      self.__switching = False # Waiting for the server to switch to frames
+      self.__deflater = None # Compressor of output once compression is asked
+      self.__inflater = None # Decompressor of input once the server agreed
+      self.__compressing = False # Waiting for the server to compress
+      self.__rawBuffer = None # Compressed input is read into this
+      self.receivedBytes = 0
+      self.sentBytes = 0
+      self.__output = collections.deque() # Lines waiting to be written
+      self.__head = None # Unsent tail of a partly written batch
+
+   def connect(self, host, port, timeout=None):
+      '''
+      Connects a blocking socket to a server.
+      Arguments:
+      -host[string]: Server's address
+      -port[int]: Server's port
+      -timeout[float](optional): Seconds to wait for the connection
+      '''
+      self.sock = socket.create_connection((host, port), timeout)
+      self.sock.settimeout(None)
+
+   def startConnect(self, addr):
+      '''
+      Starts connecting a non-blocking socket; the connection is made once
+      the socket is writable (see finishConnect).
+      Argument addr[tuple]: Server's (ip, port)
+      Raises [socket.error]: if connecting failed right away
+      '''
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.sock.setblocking(False)
+      error = self.sock.connect_ex(addr)
+      if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+         raise socket.error(error, os.strerror(error))
+
+   def finishConnect(self):
+      '''
+      Checks the outcome of startConnect once the socket is writable.
+      Raises [socket.error]: if the connection failed
+      '''
+      error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+      if error:
+         raise socket.error(error, os.strerror(error))
+
+   def fileno(self):
+      '''Returns the socket's file descriptor, for poll or io_add_watch'''
+      return self.sock.fileno()
+
+   def requestFrames(self):
+      '''
+      Switches the connection to length-prefixed frames (see framing).
+      Lines sent from now on are sent as frames; received data is split into
+      frames once the server has answered. Call before sending the name.
+      '''
+      self.__output.append(framing.NEGOTIATE + "\n")
+      self.framed = True
+      self.__switching = True
+
+   def requestCompression(self, level=6):
+      '''
+      Compresses the connection both ways with raw deflate streams (see
+      framing.COMPRESS). Output queued so far is sent uncompressed, then
+      every flush is compressed; received data is inflated once the server
+      has answered. Call before requestFrames and before sending the name.
+      Argument level[int](optional): Compression level, 1 to 9
+      Raises [ValueError]: if frames have been requested already
+      '''
+      if self.framed:
+         raise ValueError("Compression must be requested before frames")
+      data = "".join(self.__output) + framing.COMPRESS + "\n"
+      self.__output.clear()
+      if self.__head:
+         data = self.__head.tobytes() + data
+      self.__head = memoryview(data)
+      self.__deflater = zlib.compressobj(level, zlib.DEFLATED,
+         compression.WBITS)
+      self.__compressing = True
+
+   def send(self, line, kind=framing.FRAME_CHAT):
+      '''
+      Queues a line; call flush to write it. Appends newline character, or
+      sends the line as a frame once frames have been requested.
+      Arguments:
+      -line[string]: Line without newline
+      -kind[string](optional): Frame type; framing.FRAME_NAME for the name
+      '''
+      if self.framed:
+         self.__output.append(framing.encodeFrame(kind, line))
+      else:
+         self.__output.append(line + "\n")
+
+   def sendLines(self, lines):
+      '''
+      Queues many lines; call flush to write them.
+      Argument lines[iterable]: Lines without newlines
+      '''
+      if self.framed:
+         self.__output.extend(framing.encodeFrame(framing.FRAME_CHAT, line)
+            for line in lines)
+      else:
+         self.__output.extend(line + "\n" for line in lines)
+
+   def hasPending(self):
+      '''Returns whether queued output is waiting to be written'''
+      return bool(self.__output or self.__head)
+
+   def flush(self):
+      '''
+      Writes queued lines, joined into one buffer. A blocking socket writes
+      all of it; a non-blocking socket writes what fits without waiting.
+      Returns [bool]: True if nothing is left to write
+      Raises [socket.error]: if the connection failed
+      '''
+      if self.__output:
+         data = "".join(self.__output)
+         self.__output.clear()
+         if self.__deflater:
+            data = self.__deflater.compress(data) + \
+               self.__deflater.flush(zlib.Z_SYNC_FLUSH)
+         if self.__head:
+            data = self.__head.tobytes() + data
+         self.__head = memoryview(data)
+      if not self.__head:
+         return True
+      if self.sock.gettimeout() != 0.0:
+         self.sock.sendall(self.__head.tobytes())
+         self.sentBytes += len(self.__head)
+         self.__head = None
+         return True
+      try:
+         sent = self.sock.send(self.__head)
+      except socket.error as e:
+         if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return False
+         raise
+      self.sentBytes += sent
+      self.__head = self.__head[sent:] if sent < len(self.__head) else None
+      return self.__head is None
+
+   def receive(self):
+      '''
+      Receives data and returns the complete lines. A blocking socket waits
+      for one read; a non-blocking socket reads until it would block, and a
+      socket with a timeout (settimeout) returns nothing once it expires.
+      Sets disconnected once the server has closed the connection.
+      Returns [list]: Received lines without newlines (frame payloads)
+      '''
+      return [text for kind, text in self.receiveMessages()]
+
+   def receiveMessages(self):
+      '''
+      Receives data like receive, and returns the complete messages with
+      their types.
+      Returns [list]: (type, text) pairs; type is the frame type, or None
+      for a line
+      '''
+      blocking = self.sock.gettimeout() != 0.0
+      while not self.disconnected:
+         inflater = self.__inflater
+         if inflater:
+            view = self.__rawBuffer
+         else:
+            view = self.framer.getWritable(IRCClient.READ_SIZE)
+         try:
+            count = self.sock.recv_into(view, len(view))
+         except socket.timeout:
+            break # Nothing arrived yet; the connection is still up
+         except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+               break
+            count = 0
+         if not count:
+            self.disconnected = True
+            break
+         self.receivedBytes += count
+         if inflater:
+            try:
+               self.framer.feed(inflater.decompress(view[:count].tobytes()))
+            except zlib.error:
+               self.disconnected = True # Corrupt stream
+               break
+         else:
+            self.framer.commit(count)
+         if blocking or count < len(view):
+            break # Socket drained
+      messages = []
+      message = self.nextMessage()
+      while message is not None:
+         messages.append(message)
+         message = self.nextMessage()
+      return messages
+
+   def nextMessage(self):
+      '''
+      Pops the next message received already. Switches to frames, or to
+      compressed input, when the server answers requestFrames or
+      requestCompression, and answers keepalives.
+      Returns [tuple]: (type, text) as from receiveMessages; None if no
+      message is complete
+      '''
+      message = self.framer.nextMessage()
+      if message is None:
+         return None
+      if isinstance(self.framer, BinaryFramer):
+         if message == (framing.FRAME_SYSTEM, framing.PING):
+            self.send(framing.PONG)
+            return self.nextMessage()
+         return message
+      if message == framing.PING:
+         self.send(framing.PONG)
+         return self.nextMessage()
+      if self.__switching and message == framing.NEGOTIATE:
+         self.__switching = False
+         framer = BinaryFramer(IRCClient.MAX_FRAME)
+         framer.feed(self.framer.getPendingData())
+         self.framer = framer
+         return self.nextMessage()
+      if self.__compressing and message == framing.COMPRESS:
+         self.__compressing = False
+         self.__inflater = zlib.decompressobj(compression.WBITS)
+         self.__rawBuffer = memoryview(bytearray(IRCClient.READ_SIZE))
+         pending = self.framer.getPendingData()
+         self.framer = LineFramer()
+         try:
+            self.framer.feed(self.__inflater.decompress(pending))
+         except zlib.error:
+            self.disconnected = True
+            return None
+         return self.nextMessage()
+      return None, message
+
+   def lines(self):
+      '''
+      Generator of received lines, until the server closes the connection.
+      With a non-blocking socket, it only yields what has arrived already.
+      '''
+      while not self.disconnected:
+         received = self.receive()
+         if self.hasPending():
+            self.flush() # Keepalive answers
+         if not received and self.sock.gettimeout() == 0.0:
+            return
+         for line in received:
+            yield line
+
+   def close(self):
+      '''Closes the connection.'''
+      if self.sock is not None:
+         self.sock.close()
+         self.sock = None
+
+class IRCClientProtocol(asyncio.Protocol if asyncio else object):
+   '''
+   IRCClientProtocol is the asyncio version of IRCClient:
+      connect = loop.create_connection(
+         lambda: IRCClientProtocol(onLine), host, port)
+      transport, client = loop.run_until_complete(connect)
+      client.sendLines(["bot", "hello"])
+   '''
+
+   def __init__(self, onLine, onLost=None):
+      '''
+      Constructor: Sets up an unconnected protocol.
+      Arguments:
+      -onLine[function]: Called with every received line
+      -onLost[function](optional): Called when the connection is lost
+      '''
+      self.onLine = onLine
+      self.onLost = onLost
+      self.transport = None
+      self.framer = LineFramer()
+
+   def connection_made(self, transport):
+      self.transport = transport
+
+   def data_received(self, data):
+      self.framer.feed(data)
+      for line in self.framer.messages():
+         if line == framing.PING:
+            self.send(framing.PONG)
+         else:
+            self.onLine(line)
+
+   def connection_lost(self, exc):
+      if self.onLost:
+         self.onLost()
+
+   def send(self, line):
+      '''Writes a line. Appends newline character.'''
+      self.transport.write(line + "\n")
+
+   def sendLines(self, lines):
+      '''Writes many lines with one write.'''
+      self.transport.write("".join(line + "\n" for line in lines))
+
+   def close(self):
+      '''Closes the connection once written lines have been sent.'''
+      self.transport.close()
+
+def main():
+   '''
+   Pipes stdin into the room and prints the room to stdout. Without --stay,
+   the connection is shut down for writing once stdin has ended and every
+   line has been sent, and the room is printed until the server closes it.
+   '''
+   parser = argparse.ArgumentParser(description="IRC command line client")
+   parser.add_argument("host")
+   parser.add_argument("port", type=int)
+   parser.add_argument("--name", help="name to use; else the first line of "
+      "stdin answers the server's question")
+   parser.add_argument("--stay", action="store_true",
+      help="keep printing the room after stdin has ended")
+   parser.add_argument("--frames", action="store_true",
+      help="use length-prefixed frames instead of lines")
+   parser.add_argument("--compress", action="store_true",
+      help="compress the connection")
+   args = parser.parse_args()
+
+   client = IRCClient()
+   client.connect(args.host, args.port)
+   client.sock.setblocking(False)
+   if args.compress:
+      client.requestCompression()
+   if args.frames:
+      client.requestFrames()
+   if args.name:
+      client.send(args.name, framing.FRAME_NAME)
+   stdin = sys.stdin.fileno()
+   inputFramer = LineFramer()
+   poll = select.poll()
+   poll.register(client.fileno(), select.POLLIN)
+   poll.register(stdin, select.POLLIN)
+   reading = True
+   shutDown = False
+   while not client.disconnected:
+      if not (reading or args.stay or shutDown or client.hasPending()):
+         client.sock.shutdown(socket.SHUT_WR)
+         shutDown = True
+      for fd, event in poll.poll():
+         if fd == stdin:
+            data = os.read(stdin, IRCClient.READ_SIZE)
+            if not data:
+               reading = False
+               poll.unregister(stdin)
+               if inputFramer.pending():
+                  data = "\n" # Last line had no newline
+            inputFramer.feed(data)
+            client.sendLines(inputFramer.messages())
+         elif event & select.POLLIN or event & (select.POLLHUP |
+               select.POLLERR):
+            lines = client.receive()
+            if lines:
+               sys.stdout.write("\n".join(lines) + "\n")
+               sys.stdout.flush()
+      events = select.POLLIN
+      if not client.flush():
+         events |= select.POLLOUT
+      poll.modify(client.fileno(), events)
+   client.close()
+
+if __name__ == "__main__":
+   main()
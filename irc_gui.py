@@ -14,12 +14,34 @@ import gtk
 import sys
 import socket
 import gobject
+import threading
+
+from irc_client import IRCClient
 
 class IRCGUI:
-   '''IRCGUI provides a user interface for my IRC Client'''
+   '''
+   IRCGUI provides a user interface for my IRC Client, an IRCClient driven
+   by the GTK main loop. Messages are shown in one TextView; only the most
+   recent lines are kept.
+   '''
+   MAX_LINES = 1000 # Default number of message lines kept
+   CONNECT_TIMEOUT = 10000 # Milliseconds to wait for a connection
    
-   def __init__(self):
-      '''Constructor: Sets up all widgets, window, and socket'''
+   def __init__(self, maxLines=MAX_LINES, compress=False, frames=True):
+      '''
+      Constructor: Sets up all widgets, window, and socket
+      Arguments:
+      -maxLines[int](optional): Number of message lines kept; older lines
+      are trimmed
+      -compress[bool](optional): Compress the connection; the server must
+      run on a poll style backend
+      -frames[bool](optional): Switch the connection to frames; False keeps
+      lines, for servers which don't support frames
+      '''
+      self.maxLines = maxLines
+      self.compress = compress
+      self.frames = frames
+      gobject.threads_init() # Host names are resolved on a thread
       
       # Connection Window
       self.connectWindow = gtk.Window(gtk.WINDOW_TOPLEVEL)
@@ -67,15 +89,25 @@ class IRCGUI:
       self.window.set_title("IRC Client")
       
       self.scrollbox = gtk.ScrolledWindow()
+      self.scrollbox.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
       self.scrollbox.show()
       
       self.windowBox = gtk.VBox(False, 0)
       self.windowBox.show()
       
-      self.messages = gtk.VBox(False, 0)
+      self.buffer = gtk.TextBuffer()
+      # Stays at the end of the buffer as text is inserted (right gravity)
+      self.endMark = self.buffer.create_mark("end",
+         self.buffer.get_end_iter(), False)
+      self.messages = gtk.TextView(self.buffer)
+      self.messages.set_editable(False)
+      self.messages.set_cursor_visible(False)
+      self.messages.set_wrap_mode(gtk.WRAP_WORD_CHAR)
+      self.messages.set_left_margin(5)
+      self.messages.set_right_margin(5)
       self.messages.show()
       
-      self.scrollbox.add_with_viewport(self.messages)
+      self.scrollbox.add(self.messages)
       
       self.editBox = gtk.HBox(False, 0)
       self.editBox.show()
@@ -101,50 +133,103 @@ class IRCGUI:
       self.window.add(self.windowBox)
       #self.window.show()
       
-      self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-      self.dataBuffer = ""
+      self.client = None
+      self.connectWatch = None
+      self.connectTimer = None
+      self.writeWatch = None
    
    def makeConnection(self, widget, data=None):
       '''
       Takes data from IP and Port fields and attempts to make a connection to
-      the server specified in these fields.
+      the server specified in these fields. The host name is resolved on a
+      thread, so the window keeps responding.
+      '''
+      if not self.connectButton.get_sensitive():
+         return # Connecting already, or fields not filled in
+      self.connectButton.set_sensitive(False)
+      host = self.connectIPBox.get_text()
+      port = int(self.connectPortBox.get_text())
+      resolver = threading.Thread(target=self.resolve, args=(host, port))
+      resolver.daemon = True
+      resolver.start()
+   
+   def resolve(self, host, port):
+      '''
+      Resolver thread: looks a host up, then hands the address back to the
+      GTK main loop.
       '''
-      ip = ""
       try:
-         ip = socket.gethostbyname(self.connectIPBox.get_text())
+         ip = socket.gethostbyname(host)
       except Exception as e:
-         fail = gtk.MessageDialog(None, 0, gtk.MESSAGE_ERROR, gtk.BUTTONS_OK,
-            "Failed to resolve host\n" + str(e))
-         fail.run()
-         fail.destroy()
+         gobject.idle_add(self.connectFailed, "Failed to resolve host\n" +
+            str(e))
          return
-      port = int(self.connectPortBox.get_text())
-      self.connectTo((ip, port))
+      gobject.idle_add(self.connectTo, (ip, port))
+   
+   def connectFailed(self, message):
+      '''Shows why connecting failed and lets the user try again.'''
+      if self.client:
+         self.client.close()
+         self.client = None
+      fail = gtk.MessageDialog(None, 0, gtk.MESSAGE_ERROR, gtk.BUTTONS_OK,
+         message)
+      fail.run()
+      fail.destroy()
+      self.changedText(None)
+      return False
    
    def changedText(self, widget, data=None):
       sensitive = len(self.connectIPBox.get_text()) > 0 and \
          len(self.connectPortBox.get_text()) > 0 and \
          self.connectPortBox.get_text().isdigit() and \
-         int(self.connectPortBox.get_text()) > 0
+         int(self.connectPortBox.get_text()) > 0 and \
+         self.client is None
       self.connectButton.set_sensitive(sensitive)
    
    def connectTo(self, addr):
+      '''
+      Starts a non-blocking connect; the main loop watches for the socket to
+      become writable (connected) or for the timeout.
+      Argument addr[tuple]: Server's (ip, port)
+      '''
+      self.client = IRCClient()
       try:
-         self.socket.settimeout(1)
-         self.socket.connect(addr)
-      except Exception as e:
-         fail = gtk.MessageDialog(None, 0, gtk.MESSAGE_ERROR, gtk.BUTTONS_OK,
-            "Failed to connect\n" + str(e))
-         fail.run()
-         fail.destroy()
-         return
+         self.client.startConnect(addr)
+      except socket.error as e:
+         return self.connectFailed("Failed to connect\n" + str(e))
+      self.connectWatch = gobject.io_add_watch(self.client.fileno(),
+         gobject.IO_OUT | gobject.IO_ERR | gobject.IO_HUP, self.connected)
+      self.connectTimer = gobject.timeout_add(IRCGUI.CONNECT_TIMEOUT,
+         self.connectTimedOut)
+      return False
+   
+   def connectTimedOut(self):
+      '''Gives up on a connect which has taken too long.'''
+      gobject.source_remove(self.connectWatch)
+      self.connectTimer = None
+      return self.connectFailed("Failed to connect\ntimed out")
+   
+   def connected(self, source, condition):
+      '''Finishes connecting once the socket is writable.'''
+      gobject.source_remove(self.connectTimer)
+      self.connectTimer = None
+      try:
+         self.client.finishConnect()
+      except socket.error as e:
+         return self.connectFailed("Failed to connect\n" + str(e))
       self.connectWindow.hide()
       self.window.show()
       self.entry.grab_focus()
-      self.socket.setblocking(False)
-      gobject.io_add_watch (self.socket.fileno(), gobject.IO_IN, self.read)
-      gobject.io_add_watch (self.socket.fileno(), gobject.IO_ERR, self.disconnect)
-      gobject.io_add_watch (self.socket.fileno(), gobject.IO_HUP, self.disconnect)
+      if self.compress:
+         self.client.requestCompression()
+      if self.frames:
+         self.client.requestFrames()
+      self.flush()
+      fileno = self.client.fileno()
+      gobject.io_add_watch (fileno, gobject.IO_IN, self.read)
+      gobject.io_add_watch (fileno, gobject.IO_ERR, self.disconnect)
+      gobject.io_add_watch (fileno, gobject.IO_HUP, self.disconnect)
+      return False
    
    def disconnect(self, source=None, condition=None):
       dia = gtk.MessageDialog(None, 0, gtk.MESSAGE_ERROR, gtk.BUTTONS_OK,
@@ -158,43 +243,64 @@ class IRCGUI:
       self.entry.set_text("")
       self.entry.grab_focus()
       if message.strip():
-         self.socket.sendall(message + "\n")
+         self.client.send(message)
+         self.flush()
+   
+   def flush(self, source=None, condition=None):
+      '''
+      Writes queued lines; what the socket can't take yet is written when it
+      becomes writable.
+      '''
+      try:
+         done = self.client.flush()
+      except socket.error:
+         self.disconnect()
+      if done:
+         self.writeWatch = None
+      elif self.writeWatch is None:
+         self.writeWatch = gobject.io_add_watch(self.client.fileno(),
+            gobject.IO_OUT, self.flush)
+      return not done
    
    def read(self, source, condition):
-      data = self.socket.recv(256)
-      if not data:
+      '''
+      Reads until the socket would block, then shows every complete line
+      received as one batch.
+      '''
+      self.add_messages([message.strip() for message in
+         self.client.receive()])
+      if self.client.disconnected:
          self.disconnect()
-      self.dataBuffer += data
-      
-      message = self.getNextMessage()
-      while message:
-         self.add_message(message)
-         message = self.getNextMessage()
+      elif self.client.hasPending():
+         self.flush() # Keepalive answers
       return True
    
    def getNextMessage(self):
-      msg = ""
-      if '\n' in self.dataBuffer:
-         index = self.dataBuffer.find('\n')
-         msg = self.dataBuffer[:index + 1]
-         self.dataBuffer = self.dataBuffer[index + 1:]
-      return msg.strip()
+      msg = self.client.nextMessage()
+      if msg is None:
+         return ""
+      return msg[1].strip()
    
    def add_message(self, message):
-      if (not message):
+      self.add_messages([message])
+   
+   def add_messages(self, messages):
+      '''
+      Appends lines to the message view with one insert, trims the oldest
+      lines past maxLines, and scrolls to the end once.
+      Argument messages[list]: Lines without newlines
+      '''
+      messages = [message for message in messages if message]
+      if not messages:
          return
-      tbox = gtk.HBox(False, 0)
-      tbox.set_border_width(5)
-      tbox.show()
-      
-      text = gtk.Label(message)
-      text.set_line_wrap(True)
-      tbox.pack_start(text, False, True, 0)
-      text.show()
-      
-      self.messages.pack_start(tbox, False, True, 0)
-      adj = self.scrollbox.get_vadjustment()
-      adj.set_value(adj.get_upper())
+      self.buffer.insert(self.buffer.get_end_iter(),
+         "\n".join(messages) + "\n")
+      # Every line ends with a newline, so the last buffer line is empty
+      excess = self.buffer.get_line_count() - 1 - self.maxLines
+      if excess > 0:
+         self.buffer.delete(self.buffer.get_start_iter(),
+            self.buffer.get_iter_at_line(excess))
+      self.messages.scroll_mark_onscreen(self.endMark)
    
    def delete_event(self, widget, event, data=None):
       return False
@@ -207,5 +313,6 @@ class IRCGUI:
       gtk.main()
 
 if __name__ == "__main__":
-   base = IRCGUI()
+   base = IRCGUI(compress="--compress" in sys.argv[1:],
+      frames="--lines" not in sys.argv[1:])
    base.main()
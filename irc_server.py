@@ -8,9 +8,20 @@ This file contains my IRCServer class which extends my Server class. It
 overrides all Server methods necessary handling the various events which an
 event-driven server puts out.
 '''
+import os
+import time
+import zlib
 import logging
+import binascii
+import collections
+
+import framing
+import log_writer
 
 from select_tcpserver import *
+from framing import LineFramer, BinaryFramer
+from scrollback import Scrollback
+from operator import itemgetter
 
 class IRCServer(Server):
    '''
@@ -21,11 +32,57 @@ class IRCServer(Server):
    -newClient(self)
    -received(self)
    -disconnected(self)
+   Named clients may also send commands:
+   -/join #channel: joins a channel
+   -/part #channel: leaves a channel
+   -/msg #channel message: sends a message to the members of a channel
+   -/msg name message: sends a message to one user, wherever connected
+   -/whois name: tells where a user is connected
+   -/names [#channel]: lists users, a page at a time
+   -/more: sends the next page of a listing
+   Recently relayed lines can be kept as scrollback (setScrollback; off by
+   default) and replayed to every client once its name has been accepted.
+   With several workers (Server.setWorkers), workers relay chat lines to each
+   other over the bus, and every name is claimed from the one worker which
+   owns it, so all workers share one room and one set of names.
+   Servers on other hosts (or ports) can be linked into one network
+   (Server.setLinkPort, Server.addLink). Chat lines and names are flooded
+   over the links; every message carries its origin server and a sequence
+   number, so copies arriving over redundant links are dropped. Two servers
+   giving out one name at the same time keep the older claim.
+   On a restart (Server.setRestartSignal), clients keep their names,
+   channels and unfinished lines in the new process.
+   Clients talk in newline-terminated lines, unless they switch their
+   connection to length-prefixed frames (see framing.NEGOTIATE). Frames are
+   never cut into fragments, and chat lines are relayed to every client in
+   its own format. A client sending the framing.COMPRESS line first has its
+   connection compressed both ways (Server.startCompression).
+   Idle clients (Server.setIdleTimeout) are sent the framing.PING line,
+   which they answer with framing.PONG.
    '''
    PORT_NUMBER = 164
    FRAGMENT_SIZE = 256
+   # Bus message types; every bus message is "<type> <arguments>"
+   BUS_RELAY = "M" # M <line>: chat line for the receiver's clients
+   BUS_CLAIM = "C" # C <claim ID> <name>: asks the name's owner for a name
+   BUS_ACCEPT = "A" # A <claim ID>: owner gave the name to the claimant
+   BUS_REJECT = "R" # R <claim ID>: name is already taken
+   BUS_NAME = "N" # N <name>: a client of the sender took a name
+   BUS_QUIT = "Q" # Q <name>: the sender's client released a name
+   BUS_CHANNEL = "H" # H <channel> <line>: line for the receiver's members
+   BUS_PRIVATE = "P" # P <name key> <line>: line for the client using a name
+   # Link messages are "<type> <origin> <sequence> <arguments>", reusing the
+   # bus types M and H; names are N <owner> <time> <name> and Q <owner> <name>.
+   # Private lines, P <origin> <sequence> <name key> <line>, are not flooded
+   # but passed along the links each name was learned over; a line seen
+   # already is dropped, so a stale route can't pass it around in a loop
+   LINK_HELLO = "S" # S <server ID> <key>: first message on a link
+   CHANNEL_PREFIX = "#"
+   CHANNEL_LENGTH = 32 # Max channel name length, prefix included
+   NAMES_PAGE = 100 # Names per /names or /more reply
+   PRIVATE_SEEN = 4096 # Private lines passed on over links remembered
    
-   def __init__(self, portOffset=0, interface="0.0.0.0"):
+   def __init__(self, portOffset=0, interface="0.0.0.0", backend="poll"):
       '''
       Constructor: Sets up server.
       Arguments:
@@ -33,14 +90,65 @@ class IRCServer(Server):
       no offset
       -interface[string](optional): Bind to this interface address; default
       is all interfaces
+      -backend[string](optional): Event backend passed on to Server; default
+      is "poll"
       '''
       self.__portOffset = portOffset
       self.__interface = interface
-      Server.__init__(self, "IRC Server", self.getPortNumber(), interface)
+      Server.__init__(self, "IRC Server", self.getPortNumber(), interface,
+         backend)
       logging.info("IRC Server Started on (" + interface + "," +
          str(self.getPortNumber()) + ")")
       self.__clientIDs = {} # key: Client ID; Value: Client Name
-      self.__msgBuffer = {} # key: Client ID; Value: Receved data
+      self.__nameIndex = {} # key: Name key (lowercase); Value: Client ID
+      self.__msgBuffer = {} # key: Client ID; Value: Framer of received data
+      self.__framed = set() # Client IDs which switched to frames
+      self.__remoteNames = {} # key: Name key; Value: [worker index, name]
+      self.__claims = {} # key: Claim ID; Value: [Client ID, name, owner]
+      self.__claimOf = {} # key: Client ID; Value: Claim ID awaiting answer
+      self.__nextClaim = 0
+      self.__lostWorkers = set()
+      self.__channels = {} # key: Channel; Value: set of member Client IDs
+      self.__memberOf = {} # key: Client ID; Value: set of joined channels
+      self.__commands = {
+         "/join": self.__joinCommand,
+         "/part": self.__partCommand,
+         "/msg": self.__msgCommand,
+         "/whois": self.__whoisCommand,
+         "/names": self.__namesCommand,
+         "/more": self.__moreCommand,
+      }
+      self.__listings = {} # key: Client ID; Value: [names, next index]
+      self.__nodeID = binascii.hexlify(os.urandom(6)) # ID on the network
+      self.__linkKey = "-"
+      self.__linkSeq = 0 # Sequence number of the last message sent
+      self.__linkSeen = {} # key: Origin server ID; Value: last sequence
+      self.__privateSeen = set() # (origin, sequence) of private lines
+      self.__privateOrder = collections.deque() # Same, oldest first
+      self.__linkPeers = {} # key: Link ID; Value: server ID once greeted
+      self.__linkNames = {} # key: Name key; Value: [owner, time, link, name]
+      self.__nameStamps = {} # key: Name key of own client; Value: time
+      self.__scrollback = None # Created on first use, in the worker
+      self.__scrollbackSettings = None # Set by setScrollback
+      self.__relayedCount = 0
+      self.__privateCount = 0
+      registry = Server.getMetrics(self)
+      registry.counter("irc_relayed_messages_total",
+         "Chat lines relayed to the room or a channel",
+         lambda: self.__relayedCount)
+      registry.counter("irc_private_messages_total",
+         "Private lines sent to one user", lambda: self.__privateCount)
+      registry.gauge("irc_clients", "Clients by registration state",
+         lambda: len(self.__nameIndex), {"state": "registered"})
+      registry.gauge("irc_clients", "Clients by registration state",
+         lambda: len(self.__clientIDs) - len(self.__nameIndex),
+         {"state": "unregistered"})
+      registry.gauge("irc_channels", "Channels with members on this worker",
+         lambda: len(self.__channels))
+      registry.gauge("irc_links", "Linked servers greeted",
+         lambda: sum(1 for peer in self.__linkPeers.values() if peer))
+      registry.gauge("irc_link_names", "Names used on linked servers",
+         lambda: len(self.__linkNames))
       
    def getPortNumber(self):
       '''
@@ -54,11 +162,14 @@ class IRCServer(Server):
       Asks for client's name.
       '''
       clientID = Server.getClientID(self)
-      addr = (Server.getClientIPAddress(self), Server.getClientPortNumber(self))
+      addr = (Server.getClientIPAddress(self),
+         Server.getClientPortNumber(self))
       self.__clientIDs[clientID] = ""
-      self.__msgBuffer[clientID] = ""
+      self.__msgBuffer[clientID] = LineFramer(IRCServer.FRAGMENT_SIZE)
+      self.__memberOf[clientID] = set()
       self.sendTo(clientID, "Hello, what's your name?")
-      logging.info("New Client: " + str(addr))
+      logging.info("New Client: %s", addr, extra=log_writer.event("connect",
+         client=clientID, ip=addr[0], port=addr[1]))
    
    def received(self):
       '''
@@ -68,66 +179,796 @@ class IRCServer(Server):
       '''
       # Gathers info about received data
       clientID = Server.getClientID(self)
-      name = self.__clientIDs[clientID]
-      data = Server.recvAmount(self, IRCServer.FRAGMENT_SIZE)
-      
-      # Get message from
-      self.__msgBuffer[clientID] += data
-      message = self.getMessage(clientID).strip()
-      
-      # While the client still has messages to send...
-      while message:
-         # If they have no name, the message should be the name
-         if not self.__clientIDs[clientID]:
-            # Take up to 8 characters for name, remaining characters discarded
-            if len(message) > 8:
-               name = message[:8]
-            else:
-               name = message
-            if not self.nameExists(name):
-               self.__clientIDs[clientID] = name.strip()
-               # Tell everyone about the new user
-               addr = Server.getClientAddress(self)
-               ip = addr[0]
-               port = addr[1]
-               msg = ':'.join([name,ip,str(port) + " Connected"])
-               logging.info("Client at " + str(addr) + " took name '" + name + "'")
-               self.sendAll(msg)
+      framer = self.__msgBuffer[clientID]
+      framer.commit(Server.recvInto(self, framer.getWritable()))
+      # Messages wait in the buffer while the client's name is being claimed
+      if clientID not in self.__claimOf:
+         self.__handleInput(clientID)
+   
+   def __handleInput(self, clientID):
+      '''
+      Handles every message or frame a client has finished.
+      Argument clientID[int]: Client ID
+      '''
+      if clientID in self.__framed:
+         self.__handleFrames(clientID)
+      else:
+         self.__handleMessages(clientID)
+   
+   def __handleMessages(self, clientID):
+      '''
+      Handles every line a client has finished.
+      Argument clientID[int]: Client ID
+      '''
+      for message in self.__msgBuffer[clientID].messages():
+         message = message.strip()
+         if message == framing.NEGOTIATE:
+            self.__startFraming(clientID)
+            return
+         if message == framing.COMPRESS:
+            self.__startCompression(clientID)
+            return
+         if not self.__handleMessage(clientID, message):
+            return
+   
+   def __handleFrames(self, clientID):
+      '''
+      Handles every frame a client has finished. A client sending a frame
+      over the max frame size is disconnected.
+      Argument clientID[int]: Client ID
+      '''
+      try:
+         for kind, payload in self.__msgBuffer[clientID].messages():
+            # Relayed as one line, to clients using lines too
+            message = payload.replace("\r", " ").replace("\n", " ").strip()
+            if kind == framing.FRAME_NAME and self.__clientIDs[clientID]:
+               self.sendTo(clientID, "You already have a name.")
+            elif kind in (framing.FRAME_NAME, framing.FRAME_CHAT):
+               if not self.__handleMessage(clientID, message):
+                  return
             else:
-               self.sendTo(clientID, "Someone is already using that name.")
-               self.sendTo(clientID, "What's your name?")
-         else: # Client has name so the message should be relayed
-            name = self.__clientIDs[clientID]
-            ip = ""
-            msg = ':'.join([name,ip,message])
-            self.sendAll(msg)
-         # Update message with data from buffer
-         message = self.getMessage(clientID).strip()
+               self.sendTo(clientID, "Unknown frame type: " + repr(kind))
+      except ValueError as e:
+         logging.warning("Client %d sent a bad frame: %s", clientID, e)
+         Server.closeClient(self, clientID)
+   
+   def __startFraming(self, clientID):
+      '''
+      Switches a client to frames once it has sent the NEGOTIATE line. The
+      server answers with the same line; everything after it is frames.
+      Argument clientID[int]: Client ID
+      '''
+      framer = BinaryFramer()
+      framer.feed(self.__msgBuffer[clientID].getPendingData())
+      self.__msgBuffer[clientID] = framer
+      Server.sendTo(self, clientID, framing.NEGOTIATE + "\n")
+      self.__framed.add(clientID)
+      self.__handleFrames(clientID)
+   
+   def __startCompression(self, clientID):
+      '''
+      Compresses a client's connection once it has sent the COMPRESS line.
+      The server answers with the same line, uncompressed; everything after
+      those lines is compressed. A client which can't be served compressed
+      is disconnected, as it is already sending compressed data.
+      Argument clientID[int]: Client ID
+      '''
+      pending = self.__msgBuffer[clientID].getPendingData()
+      self.__msgBuffer[clientID] = LineFramer(IRCServer.FRAGMENT_SIZE)
+      try:
+         pending = Server.startCompression(self, clientID, pending,
+            framing.COMPRESS + "\n")
+      except ValueError as e:
+         self.sendTo(clientID, str(e))
+         self.closeWhenFlushed(clientID)
+         return
+      self.__msgBuffer[clientID].feed(pending)
+      self.__handleMessages(clientID)
+   
+   def __handleMessage(self, clientID, message):
+      '''
+      Handles one message from a client: its name, a command, or a chat line.
+      Arguments:
+      -clientID[int]: Client ID
+      -message[string]: Stripped message
+      Returns [bool]: False if the client's next messages must wait for its
+      name to be claimed
+      '''
+      if not message or message == framing.PONG:
+         return True # A keepalive answer only has to arrive
+      # If they have no name, the message should be the name
+      if not self.__clientIDs[clientID]:
+         # Take up to 8 characters for name, remaining characters discarded
+         self.claimName(clientID, message[:8].strip())
+         # Wait for the name's owner to answer before handling the rest
+         return clientID not in self.__claimOf
+      elif message.startswith("/"): # Client has name and sent a command
+         self.__handleCommand(clientID, message)
+      else: # Client has name so the message should be relayed
+         name = self.__clientIDs[clientID]
+         ip = ""
+         msg = ':'.join([name,ip,message])
+         self.sendAll(msg)
+      return True
+   
+   def __handleCommand(self, clientID, message):
+      '''
+      Runs a command sent by a named client.
+      Arguments:
+      -clientID[int]: Client ID
+      -message[string]: "/command argument"
+      '''
+      parts = message.split(None, 1)
+      command = self.__commands.get(parts[0].lower())
+      if command is None:
+         self.sendTo(clientID, "Unknown command: " + parts[0])
+      else:
+         command(clientID, parts[1] if len(parts) > 1 else "")
+   
+   def __joinCommand(self, clientID, argument):
+      '''/join #channel'''
+      channel = self.getChannelKey(argument)
+      if channel:
+         self.joinChannel(clientID, channel)
+      else:
+         self.sendTo(clientID, "Usage: /join #channel")
+   
+   def __partCommand(self, clientID, argument):
+      '''/part #channel'''
+      channel = self.getChannelKey(argument)
+      if channel in self.__memberOf[clientID]:
+         self.partChannel(clientID, channel)
+      else:
+         self.sendTo(clientID, "You are not in " + argument.strip())
+   
+   def __msgCommand(self, clientID, argument):
+      '''/msg #channel message or /msg name message'''
+      parts = argument.split(None, 1)
+      if len(parts) == 2 and \
+            not parts[0].startswith(IRCServer.CHANNEL_PREFIX):
+         self.sendPrivate(clientID, parts[0], parts[1])
+         return
+      channel = self.getChannelKey(parts[0]) if parts else ""
+      if not channel or len(parts) < 2:
+         self.sendTo(clientID, "Usage: /msg #channel|name message")
+      elif channel not in self.__memberOf[clientID]:
+         self.sendTo(clientID, "You are not in " + channel)
+      else:
+         name = self.__clientIDs[clientID]
+         self.sendToChannel(channel, ':'.join([name,channel,parts[1]]))
+   
+   def __whoisCommand(self, clientID, argument):
+      '''/whois name'''
+      key = self.getNameKey(argument)
+      if not key:
+         self.sendTo(clientID, "Usage: /whois name")
+      elif key in self.__nameIndex:
+         target = self.__nameIndex[key]
+         channels = sorted(self.__memberOf[target])
+         where = ", in " + " ".join(channels) if channels else ""
+         self.sendTo(clientID, self.__clientIDs[target] +
+            " is on this server" + where)
+      elif key in self.__remoteNames:
+         self.sendTo(clientID, self.__remoteNames[key][1] +
+            " is on this server")
+      elif key in self.__linkNames:
+         owner, stamp, link, name = self.__linkNames[key]
+         self.sendTo(clientID, name + " is on server " + owner)
+      else:
+         self.sendTo(clientID, "No such name: " + argument.strip())
+   
+   def __namesCommand(self, clientID, argument):
+      '''/names [#channel]'''
+      if argument.strip():
+         channel = self.getChannelKey(argument)
+         if not channel:
+            self.sendTo(clientID, "Usage: /names [#channel]")
+            return
+         members = self.__channels.get(channel, ())
+         names = map(self.__clientIDs.__getitem__, members)
+      else:
+         names = self.getNames()
+      # The snapshot is paged out, so a huge listing is one short reply each
+      self.__listings[clientID] = [names, 0]
+      self.__moreCommand(clientID, "")
+   
+   def __moreCommand(self, clientID, argument):
+      '''/more'''
+      listing = self.__listings.get(clientID)
+      if listing is None:
+         self.sendTo(clientID, "Nothing more to list")
+         return
+      names, start = listing
+      end = start + IRCServer.NAMES_PAGE
+      if end < len(names):
+         listing[1] = end
+         more = " (/more for the next names)"
+      else:
+         del self.__listings[clientID]
+         more = ""
+      if not names:
+         self.sendTo(clientID, "Nobody to list")
+      else:
+         self.sendTo(clientID, "Names %d-%d of %d: %s%s" % (start + 1,
+            min(end, len(names)), len(names), " ".join(names[start:end]),
+            more))
+   
+   def getChannelKey(self, channel):
+      '''
+      Returns the key of a channel name (lowercase); empty if the name is not
+      a valid channel name.
+      Argument channel[string]: Channel name, such as "#topic"
+      '''
+      channel = channel.strip().lower()
+      if not channel.startswith(IRCServer.CHANNEL_PREFIX) or \
+            len(channel) < 2 or len(channel) > IRCServer.CHANNEL_LENGTH or \
+            len(channel.split()) != 1:
+         return ""
+      return channel
+   
+   def joinChannel(self, clientID, channel):
+      '''
+      Adds a client to a channel and tells the channel's members.
+      Arguments:
+      -clientID[int]: Client ID
+      -channel[string]: Channel key
+      '''
+      if channel in self.__memberOf[clientID]:
+         return
+      self.__channels.setdefault(channel, set()).add(clientID)
+      self.__memberOf[clientID].add(channel)
+      self.sendToChannel(channel,
+         self.__clientIDs[clientID] + ":" + channel + " joined")
+   
+   def partChannel(self, clientID, channel):
+      '''
+      Removes a client from a channel and tells the channel's members.
+      Arguments:
+      -clientID[int]: Client ID
+      -channel[string]: Channel key
+      '''
+      self.sendToChannel(channel,
+         self.__clientIDs[clientID] + ":" + channel + " left")
+      self.__leaveChannel(clientID, channel)
+   
+   def __leaveChannel(self, clientID, channel):
+      '''Removes a client from a channel's members, dropping empty channels.'''
+      members = self.__channels[channel]
+      members.discard(clientID)
+      if not members:
+         del self.__channels[channel]
+      self.__memberOf[clientID].discard(channel)
+   
+   def getChannelMembers(self, channel):
+      '''
+      Returns the IDs of this worker's clients in a channel.
+      Argument channel[string]: Channel key
+      '''
+      return self.__channels.get(channel, ())
+   
+   def sendToChannel(self, channel, message):
+      '''
+      Sends a message to the members of a channel, including members on other
+      workers. Appends newline character to message.
+      Arguments:
+      -channel[string]: Channel key
+      -message[string]: Message to be sent
+      '''
+      message = message.strip()
+      if message:
+         self.__relayedCount += 1
+         self.__sendLocalChannel(channel, message)
+         Server.sendToWorkers(self,
+            " ".join([IRCServer.BUS_CHANNEL, channel, message]))
+         self.__sendToLinks(IRCServer.BUS_CHANNEL, channel + " " + message)
+   
+   def __sendLocalChannel(self, channel, message):
+      '''Sends a stripped message to this worker's members of a channel.'''
+      members = self.__channels.get(channel)
+      if members:
+         self.__broadcast(members, message)
+   
+   def sendPrivate(self, clientID, name, message):
+      '''
+      Sends a message from a client to the user of a name, who may be on
+      another worker or linked server, and a copy to the sender. The user is
+      found through the name indexes; no other client is written to.
+      Arguments:
+      -clientID[int]: ID of the sending client
+      -name[string]: Name of the receiving user
+      -message[string]: Message to be sent
+      '''
+      name = name.strip()
+      line = ':'.join([self.__clientIDs[clientID], "@" + name,
+         message.strip()])
+      if not self.__sendPrivateLine(self.getNameKey(name), line):
+         self.sendTo(clientID, "No such name: " + name)
+         return
+      self.__privateCount += 1
+      if self.getClientIDByName(name) != clientID:
+         self.__broadcast((clientID,), line)
+   
+   def __sendPrivateLine(self, key, line, origin=None, seq=0):
+      '''
+      Delivers a private line to the client using a name, or passes it on to
+      the worker owning the name or the link the name was learned over.
+      Arguments:
+      -key[string]: Name key of the receiving user
+      -line[string]: Stripped line
+      -origin[string](optional): Server the line came from over a link;
+      default is this server
+      -seq[int](optional): Sequence number given by the origin
+      Returns [bool]: False if nobody is known to use the name
+      '''
+      clientID = self.__nameIndex.get(key)
+      if clientID is not None:
+         self.__broadcast((clientID,), line)
+      elif key in self.__remoteNames:
+         Server.sendToWorker(self, self.__remoteNames[key][0],
+            " ".join([IRCServer.BUS_PRIVATE, key, line]))
+      elif key in self.__linkNames:
+         if origin is None:
+            self.__linkSeq += 1
+            origin, seq = self.__nodeID, self.__linkSeq
+         Server.sendToLink(self, self.__linkNames[key][2], " ".join([
+            IRCServer.BUS_PRIVATE, origin, str(seq), key, line]))
+      else:
+         return False
+      return True
+   
+   def claimName(self, clientID, name):
+      '''
+      Gives a client a name if nobody uses it. The worker owning the name
+      decides; if that is another worker, the client waits for its answer.
+      Arguments:
+      -clientID[int]: Client ID
+      -name[string]: Name wanted by the client
+      '''
+      owner = self.getNameOwner(name)
+      if owner == Server.getWorkerIndex(self):
+         if not self.nameExists(name):
+            self.__nameAccepted(clientID, name)
+         else:
+            self.__nameRejected(clientID)
+      else:
+         claim = self.__nextClaim
+         self.__nextClaim += 1
+         self.__claims[claim] = [clientID, name, owner]
+         self.__claimOf[clientID] = claim
+         Server.sendToWorker(self, owner,
+            " ".join([IRCServer.BUS_CLAIM, str(claim), name]))
+   
+   def getNameOwner(self, name):
+      '''
+      Returns the index of the worker deciding who may use a name. Names are
+      spread over the workers by hash; a lost worker's names move on to the
+      next worker still running.
+      Argument name[string]: Client name
+      '''
+      workers = Server.getWorkerCount(self)
+      owner = (zlib.crc32(self.getNameKey(name)) & 0xffffffff) % workers
+      while owner in self.__lostWorkers:
+         owner = (owner + 1) % workers
+      return owner
+   
+   def __nameAccepted(self, clientID, name):
+      '''
+      Gives a client its name and tells everyone about the new user.
+      Arguments:
+      -clientID[int]: Client ID
+      -name[string]: Client's name
+      '''
+      self.setClientName(clientID, name)
+      Server.sendToWorkers(self, " ".join([IRCServer.BUS_NAME, name]))
+      stamp = time.time()
+      self.__nameStamps[self.getNameKey(name)] = stamp
+      self.__sendToLinks(IRCServer.BUS_NAME,
+         " ".join([self.__nodeID, repr(stamp), name]))
+      addr = Server.getClientAddress(self, clientID)
+      ip = addr[0]
+      port = addr[1]
+      msg = ':'.join([name,ip,str(port) + " Connected"])
+      logging.info("Client at %s took name '%s'", addr, name,
+         extra=log_writer.event("name", client=clientID, name=name))
+      framed = clientID in self.__framed
+      if framed:
+         Server.sendTo(self, clientID,
+            framing.encodeFrame(framing.FRAME_NAME, name))
+      history = self.getScrollback()
+      if history is not None and len(history):
+         # Replayed as one buffer, ahead of the announcement below
+         data = history.getWireData()
+         if framed:
+            data = "".join(framing.encodeFrame(framing.FRAME_CHAT, line)
+               for line in data.split("\n")[:-1])
+         Server.sendTo(self, clientID, data)
+      self.sendAll(msg)
+   
+   def __nameRejected(self, clientID):
+      '''
+      Asks a client for another name.
+      Argument clientID[int]: Client ID
+      '''
+      self.sendTo(clientID, "Someone is already using that name.")
+      self.sendTo(clientID, "What's your name?")
+   
+   def workerReceived(self, index, message):
+      '''
+      Server.workerReceived(self, index, message) override; Called when
+      another worker sends a message over the bus.
+      '''
+      kind, _, argument = message.partition(" ")
+      if kind == IRCServer.BUS_RELAY:
+         self.__sendLocal(argument)
+      elif kind == IRCServer.BUS_CHANNEL:
+         channel, _, line = argument.partition(" ")
+         self.__sendLocalChannel(channel, line)
+      elif kind == IRCServer.BUS_CLAIM:
+         claim, _, name = argument.partition(" ")
+         if self.nameExists(name):
+            Server.sendToWorker(self, index,
+               " ".join([IRCServer.BUS_REJECT, claim]))
+         else:
+            # Held for the claimant from now on, before it announces it
+            self.__remoteNames[self.getNameKey(name)] = [index, name]
+            Server.sendToWorker(self, index,
+               " ".join([IRCServer.BUS_ACCEPT, claim]))
+      elif kind in (IRCServer.BUS_ACCEPT, IRCServer.BUS_REJECT):
+         self.__claimAnswered(int(argument), kind == IRCServer.BUS_ACCEPT)
+      elif kind == IRCServer.BUS_NAME:
+         self.__remoteNames[self.getNameKey(argument)] = [index, argument]
+      elif kind == IRCServer.BUS_QUIT:
+         entry = self.__remoteNames.get(self.getNameKey(argument))
+         if entry and entry[0] == index:
+            del self.__remoteNames[self.getNameKey(argument)]
+      elif kind == IRCServer.BUS_PRIVATE:
+         key, _, line = argument.partition(" ")
+         clientID = self.__nameIndex.get(key)
+         if clientID is not None: # The user may have left meanwhile
+            self.__broadcast((clientID,), line)
+      else:
+         logging.warning("Unknown bus message from worker %d: %s", index,
+            message)
+   
+   def __claimAnswered(self, claim, accepted):
+      '''
+      Finishes a name claim once the name's owner has answered.
+      Arguments:
+      -claim[int]: Claim ID
+      -accepted[bool]: True if the client may use the name
+      '''
+      if claim not in self.__claims:
+         return
+      clientID, name, owner = self.__claims.pop(claim)
+      if clientID is None:
+         # Client left while waiting; give the name back
+         if accepted:
+            Server.sendToWorkers(self, " ".join([IRCServer.BUS_QUIT, name]))
+         return
+      del self.__claimOf[clientID]
+      if accepted:
+         self.__nameAccepted(clientID, name)
+      else:
+         self.__nameRejected(clientID)
+      self.__handleInput(clientID)
+   
+   def workerLost(self, index):
+      '''
+      Server.workerLost(self, index) override; Called when another worker
+      exits. Frees its clients' names and claims names it owned elsewhere.
+      '''
+      Server.workerLost(self, index)
+      self.__lostWorkers.add(index)
+      for key, (worker, name) in self.__remoteNames.items():
+         if worker == index:
+            del self.__remoteNames[key]
+      for claim, (clientID, name, owner) in self.__claims.items():
+         if owner == index:
+            del self.__claims[claim]
+            if clientID is not None:
+               del self.__claimOf[clientID]
+               self.claimName(clientID, name)
+               if clientID not in self.__claimOf:
+                  self.__handleInput(clientID)
+   
+   def linkUp(self, linkID):
+      '''
+      Server.linkUp(self, linkID) override; Called when a link to another
+      server is up. Greets the other server.
+      '''
+      self.__linkPeers[linkID] = None
+      Server.sendToLink(self, linkID, " ".join([IRCServer.LINK_HELLO,
+         self.__nodeID, self.__linkKey]))
+   
+   def linkReceived(self, linkID, message):
+      '''
+      Server.linkReceived(self, linkID, message) override; Called when a
+      linked server sends a message. New messages are passed on to the other
+      links before being handled.
+      '''
+      kind, _, rest = message.partition(" ")
+      if kind == IRCServer.LINK_HELLO:
+         node, _, key = rest.partition(" ")
+         if key != self.__linkKey or node == self.__nodeID or \
+               self.__linkPeers.get(linkID):
+            logging.warning("Link %d refused (server %s)", linkID, node)
+            Server.closeClient(self, linkID)
+            return
+         self.__linkPeers[linkID] = node
+         logging.info("Link %d is server %s", linkID, node)
+         self.__sendNames(linkID)
+         return
+      try:
+         origin, seq, argument = rest.split(" ", 2)
+         seq = int(seq)
+      except ValueError:
+         origin = None
+      if origin is None or not self.__linkPeers.get(linkID):
+         logging.warning("Bad message on link %d: %s", linkID, message)
+         Server.closeClient(self, linkID)
+         return
+      if kind == IRCServer.BUS_PRIVATE:
+         # Routed, not flooded: a later line may overtake an earlier one, so
+         # lines are remembered one by one instead of by last sequence
+         if origin != self.__nodeID and \
+               (origin, seq) not in self.__privateSeen:
+            self.__privateSeen.add((origin, seq))
+            self.__privateOrder.append((origin, seq))
+            if len(self.__privateOrder) > IRCServer.PRIVATE_SEEN:
+               self.__privateSeen.discard(self.__privateOrder.popleft())
+            key, _, line = argument.partition(" ")
+            self.__sendPrivateLine(key, line, origin, seq)
+         return
+      if origin == self.__nodeID or seq <= self.__linkSeen.get(origin, 0):
+         return # Seen already, over another link
+      self.__linkSeen[origin] = seq
+      for other, peer in self.__linkPeers.items():
+         if peer and other != linkID:
+            Server.sendToLink(self, other, message)
+      if kind == IRCServer.BUS_RELAY:
+         self.__sendLocal(argument)
+      elif kind == IRCServer.BUS_CHANNEL:
+         channel, _, line = argument.partition(" ")
+         self.__sendLocalChannel(channel, line)
+      elif kind == IRCServer.BUS_NAME:
+         owner, stamp, name = argument.split(" ", 2)
+         self.__linkNameTaken(linkID, owner, float(stamp), name)
+      elif kind == IRCServer.BUS_QUIT:
+         owner, _, name = argument.partition(" ")
+         entry = self.__linkNames.get(self.getNameKey(name))
+         if entry and entry[0] == owner:
+            del self.__linkNames[self.getNameKey(name)]
+      else:
+         logging.warning("Unknown message on link %d: %s", linkID, message)
+   
+   def linkLost(self, linkID):
+      '''
+      Server.linkLost(self, linkID) override; Called when a link closes.
+      Frees the names learned over it, on this server and the ones behind
+      its other links.
+      '''
+      Server.linkLost(self, linkID)
+      self.__linkPeers.pop(linkID, None)
+      for key, (owner, stamp, link, name) in list(self.__linkNames.items()):
+         if link == linkID:
+            del self.__linkNames[key]
+            self.__sendToLinks(IRCServer.BUS_QUIT, owner + " " + name)
+   
+   def saveState(self):
+      '''
+      Server.saveState(self) override; Called when the server restarts.
+      Returns every client's name, unfinished input and channels, the times
+      names were taken, and the scrollback.
+      '''
+      clients = {}
+      for clientID, name in self.__clientIDs.items():
+         clients[clientID] = (name,
+            self.__msgBuffer[clientID].getPendingData(),
+            sorted(self.__memberOf[clientID]), clientID in self.__framed)
+      history = self.getScrollback()
+      return {
+         "clients": clients,
+         "stamps": self.__nameStamps,
+         "scrollback": history.getWireData() if history is not None else "",
+      }
+   
+   def restoreState(self, state, clientIDs):
+      '''
+      Server.restoreState(self, state, clientIDs) override; Called in a
+      restarted server. Clients keep their names, unfinished input and
+      channels. Names known from workers and links are learned again.
+      '''
+      for oldID, (name, pending, channels, framed) in \
+            state["clients"].items():
+         if oldID not in clientIDs:
+            continue # Compressed clients are not handed over
+         clientID = clientIDs[oldID]
+         self.__clientIDs[clientID] = ""
+         if framed:
+            self.__msgBuffer[clientID] = BinaryFramer()
+            self.__framed.add(clientID)
+         else:
+            self.__msgBuffer[clientID] = LineFramer(IRCServer.FRAGMENT_SIZE)
+         self.__msgBuffer[clientID].feed(pending)
+         self.__memberOf[clientID] = set(channels)
+         for channel in channels:
+            self.__channels.setdefault(channel, set()).add(clientID)
+         if name:
+            self.setClientName(clientID, name)
+      self.__nameStamps.update(state["stamps"])
+      history = self.getScrollback()
+      # History kept in a segment file has been loaded from it already
+      if history is not None and not len(history):
+         for line in state["scrollback"].splitlines(True):
+            history.append(line)
+      # Finished messages which were not handled yet
+      for clientID in clientIDs.values():
+         self.__handleInput(clientID)
+   
+   def __sendToLinks(self, kind, argument):
+      '''
+      Floods a message from this server to every linked server.
+      Arguments:
+      -kind[string]: Message type
+      -argument[string]: Message arguments
+      '''
+      if not self.__linkPeers:
+         return
+      self.__linkSeq += 1
+      message = " ".join([kind, self.__nodeID, str(self.__linkSeq), argument])
+      for linkID, peer in self.__linkPeers.items():
+         if peer:
+            Server.sendToLink(self, linkID, message)
+   
+   def __sendNames(self, linkID):
+      '''
+      Tells a newly linked server every name used on this side of the link,
+      except the ones it has told us about: its own and those learned over
+      this link.
+      Argument linkID[int]: Link ID
+      '''
+      peer = self.__linkPeers[linkID]
+      names = [(self.__nodeID, self.__nameStamps[key], self.__clientIDs[
+         clientID]) for key, clientID in self.__nameIndex.items()]
+      names.extend((owner, stamp, name) for owner, stamp, link, name in
+         self.__linkNames.values() if owner != peer and link != linkID)
+      for owner, stamp, name in names:
+         self.__linkSeq += 1
+         Server.sendToLink(self, linkID, " ".join([IRCServer.BUS_NAME,
+            self.__nodeID, str(self.__linkSeq), owner, repr(stamp), name]))
+   
+   def __linkNameTaken(self, linkID, owner, stamp, name):
+      '''
+      Records a name taken on a linked server. When two servers gave out the
+      same name, the older claim (then the lower server ID) keeps it, and a
+      client of this server losing its name is disconnected.
+      Arguments:
+      -linkID[int]: Link the name was learned over
+      -owner[string]: ID of the server whose client took the name
+      -stamp[float]: Time the name was taken
+      -name[string]: Name
+      '''
+      if owner == self.__nodeID:
+         return # Our own claim, back over a redundant link
+      key = self.getNameKey(name)
+      clientID = self.__nameIndex.get(key)
+      if clientID is not None:
+         if (self.__nameStamps[key], self.__nodeID) < (stamp, owner):
+            return # Our client keeps the name
+         logging.warning("Name '%s' was taken first on server %s", name,
+            owner)
+         self.sendTo(clientID, "Your name is in use on another server.")
+         Server.closeClient(self, clientID)
+      entry = self.__linkNames.get(key)
+      if entry and entry[0] == owner and entry[1] >= stamp:
+         return # Known already; keeps the link it was first learned over
+      if entry and entry[0] != owner and (entry[1], entry[0]) < (stamp, owner):
+         return # The known claim is older
+      self.__linkNames[key] = [owner, stamp, linkID, name]
+   
+   def setLinkKey(self, key):
+      '''
+      Sets the key linked servers must greet each other with.
+      Argument key[string]: Shared key, without spaces
+      '''
+      self.__linkKey = key or "-"
    
    def nameExists(self, name):
       '''
-      Returns whether a name has been taken already (case insensitive).
+      Returns whether a name has been taken already (case insensitive), by a
+      client of this worker or one known from other workers or linked
+      servers.
          True if name has been taken
          False otherwise
       '''
-      for clientName in self.__clientIDs.values():
-         if clientName.lower() == name.lower():
-            return True
-      return False
+      key = self.getNameKey(name)
+      return key in self.__nameIndex or key in self.__remoteNames or \
+         key in self.__linkNames
+   
+   def getNameKey(self, name):
+      '''
+      Returns the key under which a name is indexed. Names differing only in
+      case share a key.
+      '''
+      return name.strip().lower()
+   
+   def setClientName(self, clientID, name):
+      '''
+      Gives a client a name, keeping the name index up to date. An empty name
+      removes the client's name.
+      Arguments:
+      -clientID[int]: Client ID
+      -name[string]: Client's new name
+      '''
+      oldName = self.__clientIDs.get(clientID)
+      if oldName:
+         del self.__nameIndex[self.getNameKey(oldName)]
+      self.__clientIDs[clientID] = name
+      if name:
+         self.__nameIndex[self.getNameKey(name)] = clientID
+         Server.setRegistered(self, clientID)
+   
+   def getClientName(self, clientID):
+      '''
+      Returns a client's name; empty if the client has no name yet.
+      Argument clientID[int]: Client ID
+      '''
+      return self.__clientIDs.get(clientID, "")
+   
+   def getClientIDByName(self, name):
+      '''
+      Returns the ID of the client using a name (case insensitive); -1 if no
+      client uses the name.
+      Argument name[string]: Client name
+      '''
+      return self.__nameIndex.get(self.getNameKey(name), -1)
+   
+   def getNamedClientIDs(self):
+      '''Returns the IDs of all clients which have a name.'''
+      return self.__nameIndex.values()
+   
+   def getNames(self):
+      '''
+      Returns [list]: Names in use by clients of this worker, other workers
+      and linked servers, in no particular order
+      '''
+      return map(self.__clientIDs.__getitem__, self.__nameIndex.values()) + \
+         map(itemgetter(1), self.__remoteNames.values()) + \
+         map(itemgetter(3), self.__linkNames.values())
+   
+   def setScrollback(self, maxLines, maxBytes=65536, path=None):
+      '''
+      Keeps history to replay to joining clients; none is kept by default.
+      The history holds every relayed line, join and leave notices
+      included. Call before start(). With several workers, each worker
+      keeps its own copy of the history in path.<index>.
+      Arguments:
+      -maxLines[int]: Max number of lines kept; 0 keeps no history
+      -maxBytes[int](optional): Max number of bytes kept
+      -path[string](optional): Memory-mapped segment file to keep history in
+      across restarts; default keeps it in memory only
+      '''
+      self.__scrollbackSettings = (maxLines, maxBytes, path)
+   
+   def getScrollback(self):
+      '''Returns [Scrollback]: Room history; None if history is disabled'''
+      if self.__scrollback is None and self.__scrollbackSettings:
+         maxLines, maxBytes, path = self.__scrollbackSettings
+         self.__scrollbackSettings = None
+         if maxLines > 0:
+            if path and Server.getWorkerCount(self) > 1:
+               path += "." + str(Server.getWorkerIndex(self))
+            self.__scrollback = Scrollback(maxLines, maxBytes, path)
+      return self.__scrollback
    
    def getMessage(self, clientID):
       '''Pops message from buffer and returns popped message.'''
-      message = ""
-      # If client has finished a message, extract the message
-      buf = self.__msgBuffer[clientID]
-      if '\n' in buf:
-         index = buf.find('\n')
-         message = buf[:index + 1]
-         self.__msgBuffer[clientID] = buf[index + 1:]
-      # If client's message is too big, send a portion of it
-      elif len(buf) >= IRCServer.FRAGMENT_SIZE:
-         message = buf[:IRCServer.FRAGMENT_SIZE].strip()
-         self.__msgBuffer[clientID] = buf[IRCServer.FRAGMENT_SIZE:]
+      message = self.__msgBuffer[clientID].nextMessage()
+      # If client hasn't finished a message, there is nothing to pop
+      if message is None:
+         return ""
+      if clientID in self.__framed:
+         message = message[1] # Payload of the frame
       return message.strip()
    
    def disconnected(self):
@@ -137,26 +978,91 @@ class IRCServer(Server):
       '''
       clientID = Server.getClientID(self)
       name = self.__clientIDs[clientID]
+      self.setClientName(clientID, "")
       del self.__clientIDs[clientID]
+      del self.__msgBuffer[clientID]
+      self.__framed.discard(clientID)
+      self.__listings.pop(clientID, None)
+      for channel in list(self.__memberOf[clientID]):
+         self.__leaveChannel(clientID, channel)
+      del self.__memberOf[clientID]
+      if clientID in self.__claimOf:
+         # Name's owner may still answer; the claim is kept to give it back
+         self.__claims[self.__claimOf.pop(clientID)][0] = None
+      if name:
+         Server.sendToWorkers(self, " ".join([IRCServer.BUS_QUIT, name]))
+         self.__nameStamps.pop(self.getNameKey(name), None)
+         self.__sendToLinks(IRCServer.BUS_QUIT, self.__nodeID + " " + name)
       
       addr = Server.getClientAddress(self)
       ip = addr[0]
       if name:
          self.sendAll(name + ":" + ip + " disconnected")
-         logging.info(name + " disconnected")
+         logging.info("%s disconnected", name, extra=log_writer.event(
+            "disconnect", client=clientID, name=name))
       else:
-         logging.info(str(addr) + " disconnected")
+         logging.info("%s disconnected", addr, extra=log_writer.event(
+            "disconnect", client=clientID))
+   
+   def clientIdle(self, clientID):
+      '''
+      Server.clientIdle(self, clientID) override; Called when a client has
+      been quiet for the idle timeout. Sends a keepalive to be answered.
+      '''
+      self.sendTo(clientID, framing.PING)
    
    def sendAll(self, message):
       '''
       Sends a message to all clients which are fully connected (must have
-         name to be connected). Appends newline character to message.
+         name to be connected), including clients of other workers. Appends
+         newline character to message.
+      Argument message[string]: Message to be sent.
+      '''
+      message = message.strip()
+      if message:
+         self.__relayedCount += 1
+         self.__sendLocal(message)
+         Server.sendToWorkers(self, IRCServer.BUS_RELAY + " " + message)
+         self.__sendToLinks(IRCServer.BUS_RELAY, message)
+   
+   def __sendLocal(self, message):
+      '''
+      Sends a stripped message to this worker's clients which have names.
       Argument message[string]: Message to be sent.
       '''
-      if message.strip():
-         for client in self.__clientIDs.keys(): # every client
-            if self.__clientIDs[client]: # if client has name
-               self.sendTo(client, message)
+      # Wire data is built once and shared by every recipient
+      data = message + "\n"
+      history = self.getScrollback()
+      if history is not None:
+         history.append(data)
+      self.__broadcast(self.__nameIndex.values(), message, data)
+   
+   def __broadcast(self, clientIDs, message, data=None):
+      '''
+      Sends a stripped chat line to clients, as a line to clients using
+      lines and as a frame to clients using frames. Each form is built once.
+      Arguments:
+      -clientIDs[iterable]: IDs of clients
+      -message[string]: Chat line
+      -data[string](optional): Chat line with its newline, if built already
+      '''
+      if data is None:
+         data = message + "\n"
+      framed = self.__framed
+      if not framed:
+         Server.broadcast(self, clientIDs, data)
+         return
+      lines = []
+      frames = []
+      for clientID in clientIDs:
+         if clientID in framed:
+            frames.append(clientID)
+         else:
+            lines.append(clientID)
+      Server.broadcast(self, lines, data)
+      if frames:
+         Server.broadcast(self, frames,
+            framing.encodeFrame(framing.FRAME_CHAT, message))
    
    def sendTo(self, clientID, message):
       '''
@@ -165,8 +1071,14 @@ class IRCServer(Server):
       -clientID[int]: Client ID to which message will be sent.
       -message[string]: Message to send.
       '''
-      if message.strip():
-         Server.sendTo(self, clientID, message.strip() + "\n")
+      message = message.strip()
+      if not message:
+         return
+      if clientID in self.__framed:
+         Server.sendTo(self, clientID,
+            framing.encodeFrame(framing.FRAME_SYSTEM, message))
+      else:
+         Server.sendTo(self, clientID, message + "\n")
 
 if __name__ == "__main__":
    myServer = IRCServer(35000)
@@ -0,0 +1,150 @@
+# Author:     Kevin Koshiol
+# Filename:   log_writer.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my LogWriter class, which takes log file writes off the
+server's event loop. Log calls only put their records on a queue; a
+background thread formats them and writes them to the log file (and the
+console), rotating the file by size or by time.
+'''
+
+import logging
+import threading
+import logging.handlers
+
+try:
+   import queue
+except ImportError:
+   import Queue as queue # Python 2
+
+LOG_FORMAT = "%(asctime)s > %(levelname)s > %(message)s"
+DATE_FORMAT = "%Y-%m-%d %I:%M:%S"
+
+def event(kind, **fields):
+   '''
+   Returns the "extra" argument of a log call describing an event, for the
+   structured format:
+      logging.info("New Client: %s", addr, extra=event("connect", client=7))
+   Arguments:
+   -kind[string]: Event name
+   -fields: Event fields
+   '''
+   return {"event": kind, "fields": fields}
+
+class StructuredFormatter(logging.Formatter):
+   '''
+   StructuredFormatter writes event records (see event) as one compact line
+   of key=value pairs, and other records in the usual format.
+   '''
+
+   def __init__(self):
+      logging.Formatter.__init__(self, LOG_FORMAT, DATE_FORMAT)
+
+   def format(self, record):
+      name = getattr(record, "event", None)
+      if name is None:
+         return logging.Formatter.format(self, record)
+      fields = record.fields
+      return " ".join(["%.3f" % record.created, "event=" + name] +
+         [key + "=" + str(fields[key]).replace(" ", "")
+            for key in sorted(fields)])
+
+class QueueHandler(logging.Handler):
+   '''
+   QueueHandler puts records on a queue without formatting them; record
+   arguments must not be changed after the log call. When the queue is full
+   (the disk has stalled for a long time), records are counted and dropped
+   rather than blocking the caller.
+   '''
+
+   def __init__(self, records):
+      '''
+      Constructor: Sets up handler.
+      Argument records[Queue]: Queue read by the writer thread
+      '''
+      logging.Handler.__init__(self)
+      self.records = records
+      self.dropped = 0
+
+   def emit(self, record):
+      try:
+         self.records.put_nowait(record)
+      except queue.Full:
+         self.dropped += 1
+
+class LogWriter:
+   '''
+   LogWriter moves the root logger's handlers behind a queue, adds a rotating
+   log file handler, and writes records from a background thread.
+   Start it after forking: threads do not survive fork().
+   '''
+
+   def __init__(self, path, maxBytes=10485760, when=None, backupCount=5,
+         structured=False, maxQueue=65536):
+      '''
+      Constructor: Opens the log file.
+      Arguments:
+      -path[string]: Log file
+      -maxBytes[int](optional): Rotate once the file reaches this size
+      -when[string](optional): Rotate by time instead, e.g. "midnight" or "H"
+      (see logging.handlers.TimedRotatingFileHandler)
+      -backupCount[int](optional): Number of rotated files kept
+      -structured[bool](optional): Write events in the structured format
+      -maxQueue[int](optional): Max number of records waiting to be written
+      '''
+      if when:
+         fileHandler = logging.handlers.TimedRotatingFileHandler(path, when,
+            backupCount=backupCount)
+      else:
+         fileHandler = logging.handlers.RotatingFileHandler(path,
+            maxBytes=maxBytes, backupCount=backupCount)
+      if structured:
+         fileHandler.setFormatter(StructuredFormatter())
+      else:
+         fileHandler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+      self.__handlers = [fileHandler]
+      self.__records = queue.Queue(maxQueue)
+      self.__queueHandler = QueueHandler(self.__records)
+      self.__thread = None
+
+   def start(self):
+      '''Routes the root logger through the queue and starts the writer.'''
+      root = logging.getLogger()
+      for handler in root.handlers[:]:
+         root.removeHandler(handler)
+         self.__handlers.append(handler)
+      root.addHandler(self.__queueHandler)
+      self.__thread = threading.Thread(target=self.__run,
+         name="log writer")
+      self.__thread.daemon = True
+      self.__thread.start()
+
+   def stop(self):
+      '''Writes the records still queued and stops the writer.'''
+      if self.__thread is None:
+         return
+      logging.getLogger().removeHandler(self.__queueHandler)
+      self.__records.put(None)
+      self.__thread.join()
+      self.__thread = None
+      for handler in self.__handlers:
+         handler.close()
+
+   def getDropped(self):
+      '''Returns number of records dropped because the queue was full'''
+      return self.__queueHandler.dropped
+
+   def __run(self):
+      '''Writer thread: handles queued records until stopped.'''
+      while True:
+         record = self.__records.get()
+         if record is None:
+            return
+         for handler in self.__handlers:
+            if record.levelno >= handler.level:
+               try:
+                  handler.handle(record)
+               except Exception:
+                  handler.handleError(record)
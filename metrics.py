@@ -0,0 +1,139 @@
+# Author:     Kevin Koshiol
+# Filename:   metrics.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my Metrics registry, which renders a server's counters,
+gauges, and histograms in the Prometheus text exposition format.
+Counters and gauges are read from functions at render time, so the hot path
+only updates plain integer attributes; histograms are observed in batches.
+'''
+
+import bisect
+
+# Bucket bounds in seconds for timing histograms (10us to ~10s)
+TIME_BUCKETS = [0.00001 * 4 ** i for i in range(11)]
+# Bucket bounds for count histograms (1 to 4096)
+COUNT_BUCKETS = [2 ** i for i in range(13)]
+
+class Histogram:
+   '''Histogram counts observations into cumulative buckets.'''
+
+   def __init__(self, buckets):
+      '''
+      Constructor: Sets up empty buckets.
+      Argument buckets[list]: Sorted upper bounds of the buckets
+      '''
+      self.buckets = list(buckets)
+      self.counts = [0] * (len(self.buckets) + 1) # Last one is +Inf
+      self.sum = 0.0
+      self.count = 0
+
+   def observe(self, value):
+      '''Adds one observation.'''
+      self.counts[bisect.bisect_left(self.buckets, value)] += 1
+      self.sum += value
+      self.count += 1
+
+   def observeMany(self, values):
+      '''Adds a batch of observations.'''
+      counts = self.counts
+      buckets = self.buckets
+      for value in values:
+         counts[bisect.bisect_left(buckets, value)] += 1
+      self.sum += sum(values)
+      self.count += len(values)
+
+class Metrics:
+   '''
+   Metrics is a registry of named metrics. Metrics sharing a name but not
+   labels (such as one histogram per callback) are rendered as one family.
+   '''
+
+   def __init__(self):
+      '''Constructor: Sets up an empty registry.'''
+      self.__families = [] # [name, type, help, [(labels, source)]]
+      self.__byName = {}
+
+   def counter(self, name, help, function, labels=None):
+      '''
+      Registers a counter read from a function at render time.
+      Arguments:
+      -name[string]: Metric name
+      -help[string]: Description
+      -function[function]: Returns the counter's current value
+      -labels[dict](optional): Label names and values
+      '''
+      self.__add(name, "counter", help, labels, function)
+
+   def gauge(self, name, help, function, labels=None):
+      '''
+      Registers a gauge read from a function at render time.
+      Arguments:
+      -name[string]: Metric name
+      -help[string]: Description
+      -function[function]: Returns the gauge's current value
+      -labels[dict](optional): Label names and values
+      '''
+      self.__add(name, "gauge", help, labels, function)
+
+   def histogram(self, name, help, buckets, labels=None):
+      '''
+      Registers and returns a new histogram.
+      Arguments:
+      -name[string]: Metric name
+      -help[string]: Description
+      -buckets[list]: Sorted upper bounds of the buckets
+      -labels[dict](optional): Label names and values
+      Returns [Histogram]: Histogram to observe values with
+      '''
+      histogram = Histogram(buckets)
+      self.__add(name, "histogram", help, labels, histogram)
+      return histogram
+
+   def render(self):
+      '''Returns every metric in the Prometheus text format.'''
+      lines = []
+      for name, kind, help, series in self.__families:
+         lines.append("# HELP " + name + " " + help)
+         lines.append("# TYPE " + name + " " + kind)
+         for labels, source in series:
+            if kind == "histogram":
+               self.__renderHistogram(lines, name, labels, source)
+            else:
+               lines.append(name + self.__labelText(labels) + " " +
+                  self.__number(source()))
+      return "\n".join(lines) + "\n"
+
+   def __add(self, name, kind, help, labels, source):
+      family = self.__byName.get(name)
+      if family is None:
+         family = [name, kind, help, []]
+         self.__byName[name] = family
+         self.__families.append(family)
+      family[3].append((labels or {}, source))
+
+   def __renderHistogram(self, lines, name, labels, histogram):
+      total = 0
+      for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+         total += count
+         bucketLabels = dict(labels)
+         bucketLabels["le"] = bound if bound == "+Inf" else repr(bound)
+         lines.append(name + "_bucket" + self.__labelText(bucketLabels) +
+            " " + str(total))
+      lines.append(name + "_sum" + self.__labelText(labels) + " " +
+         self.__number(histogram.sum))
+      lines.append(name + "_count" + self.__labelText(labels) + " " +
+         str(histogram.count))
+
+   def __labelText(self, labels):
+      if not labels:
+         return ""
+      return "{" + ",".join('%s="%s"' % (key, labels[key])
+         for key in sorted(labels)) + "}"
+
+   def __number(self, value):
+      if isinstance(value, float):
+         return repr(value)
+      return str(value)
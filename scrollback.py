@@ -0,0 +1,128 @@
+# Author:     Kevin Koshiol
+# Filename:   scrollback.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my Scrollback class, a ring buffer of recently relayed
+lines which IRCServer replays to clients as they join. It may be backed by a
+memory-mapped segment file so history survives restarts.
+'''
+
+import os
+import mmap
+import struct
+import logging
+import collections
+
+# Segment file header: number of data bytes used, after the header
+HEADER = struct.Struct("<Q")
+
+class Scrollback:
+   '''
+   Scrollback keeps the most recent lines, bounded both by number of lines
+   and by bytes. Lines are stored as the wire data sent to clients, and the
+   whole history is joined at most once per change, so a replay is one
+   buffer written with one send.
+   With a segment file, every line is also appended to a memory-mapped file.
+   When the file is full it is rewritten holding only the current history,
+   so appends stay cheap and loading at startup reads a bounded amount.
+   '''
+
+   def __init__(self, maxLines=100, maxBytes=65536, path=None):
+      '''
+      Constructor: Sets up an empty history, loading the segment file if any.
+      Arguments:
+      -maxLines[int](optional): Max number of lines kept
+      -maxBytes[int](optional): Max number of bytes kept
+      -path[string](optional): Segment file; default keeps history in memory
+      '''
+      self.__maxLines = max(1, int(maxLines))
+      self.__maxBytes = max(1, int(maxBytes))
+      self.__lines = collections.deque()
+      self.__size = 0 # Bytes in __lines
+      self.__wire = None # Joined history; None when out of date
+      self.__path = path
+      self.__map = None
+      self.__used = 0 # Data bytes used in the segment file
+      if path:
+         self.__load()
+
+   def append(self, data):
+      '''
+      Adds a line, dropping the oldest lines past either bound.
+      Argument data[string]: Line as sent to clients, newline included
+      '''
+      if len(data) > self.__maxBytes:
+         return
+      lines = self.__lines
+      lines.append(data)
+      self.__size += len(data)
+      while len(lines) > self.__maxLines or self.__size > self.__maxBytes:
+         self.__size -= len(lines.popleft())
+      self.__wire = None
+      if self.__map is not None:
+         self.__write(data)
+
+   def getWireData(self):
+      '''Returns [string]: Every line in history, joined for one write'''
+      if self.__wire is None:
+         self.__wire = "".join(self.__lines)
+      return self.__wire
+
+   def __len__(self):
+      return len(self.__lines)
+
+   def close(self):
+      '''Flushes and closes the segment file.'''
+      if self.__map is not None:
+         self.__map.flush()
+         self.__map.close()
+         self.__map = None
+
+   def __load(self):
+      '''Reads history from the segment file and maps it for appending.'''
+      if os.path.exists(self.__path):
+         with open(self.__path, "rb") as segment:
+            data = segment.read()
+         if len(data) >= HEADER.size:
+            used = HEADER.unpack_from(data)[0]
+            data = data[HEADER.size:HEADER.size + used]
+            for line in data.splitlines(True):
+               if line.endswith("\n"):
+                  self.append(line)
+         else:
+            logging.warning("Ignoring truncated scrollback file %s",
+               self.__path)
+      self.__rewrite()
+
+   def __write(self, data):
+      '''Appends a line to the segment file, rewriting it when full.'''
+      start = HEADER.size + self.__used
+      if start + len(data) > len(self.__map):
+         self.__rewrite() # History already holds the line
+         return
+      self.__map[start:start + len(data)] = data
+      self.__used += len(data)
+      HEADER.pack_into(self.__map, 0, self.__used)
+
+   def __rewrite(self):
+      '''
+      Replaces the segment file with a new one holding the current history,
+      with room for several times the max bytes of appends. The new file is
+      renamed over the old one, so a crash leaves one or the other intact.
+      '''
+      self.close()
+      data = self.getWireData()
+      size = HEADER.size + 4 * self.__maxBytes
+      temp = self.__path + ".tmp"
+      with open(temp, "wb") as segment:
+         segment.write(HEADER.pack(len(data)) + data)
+         segment.truncate(size)
+      os.rename(temp, self.__path)
+      fd = os.open(self.__path, os.O_RDWR)
+      try:
+         self.__map = mmap.mmap(fd, size)
+      finally:
+         os.close(fd)
+      self.__used = len(data)
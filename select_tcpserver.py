@@ -7,11 +7,52 @@
 
 import os
 import sys
+import math
+import time
+import zlib
+import array
+import errno
+import fcntl
+import signal
 import socket
+import struct
 import logging
 import select
+import atexit
+import resource
+import cProfile
+import collections
+
+try:
+   import cPickle as pickle
+except ImportError:
+   import pickle # Python 3
 
 import daemon
+import clock
+import compression
+import event_backends
+import asyncio_engine
+import metrics
+import log_writer
+import timer_wheel
+from framing import LineFramer
+
+# Max bytes joined into one send
+MAX_JOIN = 65536
+# Max bytes pending output to a linked server before the link is dropped
+MAX_LINK_QUEUE = 16777216
+# TCP_CORK socket option (Linux only)
+TCP_CORK = getattr(socket, "TCP_CORK", None)
+# Monotonic clock for rate arithmetic and timers
+monotonic = clock.monotonic
+# Environment variable giving a restarted server its handoff socket's fd
+RESTART_ENV = "SERVER_HANDOFF_FD"
+# Handoff header: length of the pickled state. The sockets themselves are
+# inherited across exec at the same fd numbers
+HANDOFF_HEADER = struct.Struct("!I")
+# Per-IP connection counters; addresses hashing to one counter share a limit
+IP_SLOTS = 65536
 
 class Server:
    '''
@@ -23,9 +64,44 @@ class Server:
    -disconnected(self)
    Details about overriding each method is included in the documentation of
    each method.
+   A server may also fork several worker processes which share the port
+   (setWorkers). Workers are connected to each other by a bus; subclasses
+   using it override workerReceived(self, index, message).
+   Runtime metrics (getMetrics) can be served in the Prometheus text format
+   on an admin port or Unix socket (setAdminAddress).
+   Reading from a client can be rate limited by a token bucket (setRateLimit),
+   and a client whose pending output passes the max queue size is either
+   disconnected or has messages dropped (setSlowConsumerPolicy).
+   Output produced while handling one poll wake-up is coalesced and written
+   with one write per socket at the end of the wake-up; TCP_NODELAY and
+   TCP_CORK are tunable (setNoDelay, setCork).
+   Log records are written to getLogFullName() by a background thread, so
+   log calls never wait for the disk (setLogRotation, setStructuredLog).
+   Servers can be linked to each other over a link port (setLinkPort,
+   addLink); subclasses using links override linkReceived(self, linkID,
+   message).
+   A signal can restart the server without disconnecting anyone
+   (setRestartSignal); subclasses hand their state over to the new process
+   by overriding saveState(self) and restoreState(self, state, clientIDs).
+   Connections can be compressed with streaming deflate (startCompression);
+   compressing clients sent the same output share one compressor.
+   Clients can be timed out if they don't register (setRegistrationTimeout),
+   go quiet (setIdleTimeout; subclasses send keepalives by overriding
+   clientIdle(self, clientID)) or stop taking output
+   (setWriteStallTimeout). Timers are kept in a hashed timing wheel.
+   A signal can profile the event loop for a while (setProfileSignal), and
+   iterations slower than a threshold are logged with their slowest callback
+   (setStallThreshold).
    '''
+   # Slow consumer policies
+   DISCONNECT = "disconnect"
+   DROP = "drop"
+   LINK_RETRY_DELAY = 5.0 # Seconds between attempts to dial a lost link
+   TIMER_TICK = 0.05 # Seconds per slot of the timer wheel
+   RESTART_TIMEOUT = 30.0 # Seconds a restarted process has to take over
+   RESTART_READY = "R" # Sent by a restarted process once it has taken over
    
-   def __init__(self, name, port, interface="0.0.0.0"):
+   def __init__(self, name, port, interface="0.0.0.0", backend="poll"):
       '''
       Constructor: Sets up server properties.
       Arguments:
@@ -33,75 +109,1427 @@ class Server:
       -port[int]: Bind to this port number
       -interface[string](optional): Bind to this interface address; default
       is all interfaces
+      -backend[string](optional): Event backend; one of "poll", "epoll",
+      "epoll-et" (edge-triggered), or "selectors"; default is "poll". The
+      "asyncio" and "uvloop" backends serve clients with asyncio transports
+      instead of the poll loop
       '''
       self.__MAX = 65535
       self.__serverPort = int(port)
       self.__interface = interface
       self.__name = name
-      self.__passiveSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.__passiveSocket = self.__createPassiveSocket()
       self.__daemonize = False
-      self.__backlog = 5
+      self.__backlog = socket.SOMAXCONN
+      self.__acceptBatch = 64 # Max connections accepted per wake-up
+      self.__maxClients = 0 # Connection limits; 0 is unlimited
+      self.__maxPerIP = 0
+      self.__maxUnregistered = 0
+      self.__unregistered = set() # Client IDs not yet marked registered
+      self.__ipCounts = array.array("I", [0]) * IP_SLOTS # Clients per slot
+      self.__refusing = False # Refusals are logged once until one is admitted
+      self.__refused = set() # Client IDs refused by the asyncio engine
       self.__loggingLevel = logging.INFO
+      self.__logWriter = None
+      self.__logRotation = (10485760, None, 5) # maxBytes, when, backupCount
+      self.__structuredLog = False
       self.__reuseAddr = True
+      self.__workers = 1 # Number of worker processes
+      self.__workerIndex = 0 # This process' worker index
+      self.__workerFds = {} # key: Worker index; Value: bus socket fd
+      self.__workerIndexes = {} # key: Bus socket fd; Value: Worker index
+      self.__busFramers = {} # key: Bus socket fd; Value: LineFramer
       self.__clientID = -1 # Current client ID (ID=Socket File Descriptor)
       self.__clientAddr = {}
       self.__sockets = {}
-      self.__responses = {}
-      logging.basicConfig(level=logging.INFO,
-         format="%(asctime)s > %(levelname)s > %(message)s",
-         datefmt='%Y-%m-%d %I:%M:%S')
-      self.__passiveSocket.setblocking(False)
+      self.__responses = {} # key: Client ID; Value: deque of pending output
+      self.__queuedBytes = {} # key: Client ID; Value: bytes pending output
+      self.__maxQueueSize = 262144
+      self.__slowConsumerPolicy = Server.DISCONNECT
+      self.__dropping = set() # Client IDs dropping messages (DROP policy)
+      self.__rate = 0 # Bytes per second read from a client; 0 is unlimited
+      self.__burst = 0 # Bucket size in bytes
+      self.__buckets = {} # key: Client ID; Value: [tokens, time of refill]
+      self.__throttled = {} # key: Client ID; Value: time to resume reading
+      self.__held = {} # key: Client ID; Value: data over its bucket (asyncio)
+      # Timers are keyed by (kind, client ID or link address)
+      self.__wheel = timer_wheel.TimerWheel(monotonic(), Server.TIMER_TICK)
+      self.__now = monotonic() # Time of the event loop's last wake-up
+      self.__registrationTimeout = 0 # Seconds; 0 disables a timeout
+      self.__idleTimeout = 0
+      self.__answerTimeout = 0
+      self.__stallTimeout = 0
+      self.__lastRead = {} # key: Client ID; Value: time it last sent data
+      self.__pinged = {} # key: Client ID; Value: time clientIdle was called
+      self.__closing = [] # Client IDs to be disconnected by the event loop
+      self.__writing = set() # Client IDs registered for write events
+      self.__dirty = set() # Client IDs to flush at the end of the iteration
+      self.__noDelay = True # Set TCP_NODELAY on client sockets
+      self.__cork = False # Cork client sockets while flushing
+      self.__backendName = backend
+      self.__backend = None
+      self.__moreToRead = False # Last read filled the requested size
+      self.__engine = None # AsyncioEngine, for the asyncio backends
+      self.__pushed = None # Data delivered by the engine, not yet read
+      self.__pushedOffset = 0
+      self.__lingering = set() # Client IDs to be closed once flushed
+      self.__linkPort = None
+      self.__linkListener = None
+      self.__peers = [] # (host, port) of servers to keep links to
+      self.__links = {} # key: Link socket fd; Value: LineFramer
+      self.__linkTargets = {} # key: Link socket fd; Value: dialed address
+      self.__connecting = set() # Link fds whose connect is in progress
+      self.__adminAddress = None # Admin port number or Unix socket path
+      self.__adminListener = None
+      # key: Admin connection fd; Value: request, None once answered
+      self.__adminRequests = {}
+      self.__restartSignal = None
+      self.__restartCommand = None # Program and arguments of a restart
+      self.__restartRequested = False
+      self.__profileSignal = None
+      self.__profileSeconds = 0
+      self.__profileRequested = False
+      self.__profiler = None # cProfile.Profile while profiling
+      self.__stallThreshold = 0 # Seconds; 0 disables stall tracing
+      # Slowest callback of the iteration: (seconds, callback, client ID)
+      self.__slowest = (0.0, None, -1)
+      self.__compressionLevel = 6
+      self.__groupOf = {} # key: Client ID; Value: CompressionGroup
+      self.__batches = {} # key: Client ID; Value: output to compress
+      self.__deflating = set() # CompressionGroups with batches to compress
+      self.__inflaters = {} # key: Client ID; Value: decompressor of input
+      # Plain counters; metrics read them only when rendered
+      self.__acceptedCount = 0
+      self.__refusedCount = 0
+      self.__timedOutCount = 0
+      self.__stallCount = 0
+      self.__droppedCount = 0
+      self.__droppedMessages = 0
+      self.__bytesIn = 0
+      self.__bytesOut = 0
+      self.__sendCalls = 0
+      self.__messagesOut = 0
+      self.__deflatedIn = 0 # Bytes compressed
+      self.__deflatedOut = 0 # Compressed bytes
+      self.__deflateCalls = 0
+      self.__callbackTimes = {"newClient": [], "received": [],
+         "disconnected": []} # Durations observed once per loop iteration
+      self.__metrics = metrics.Metrics()
+      self.__registerMetrics()
+      logging.basicConfig(level=self.__loggingLevel,
+         format=log_writer.LOG_FORMAT, datefmt=log_writer.DATE_FORMAT)
 
    def start(self):
       '''
       After initializing server, this is called to begin listening. This method
       blocks until the server completes execution.
+      With several workers, the calling process forks them and supervises them
+      until they have all exited; each worker then binds its own socket.
+      A process started by a restart (setRestartSignal) takes over the sockets
+      of the process it replaces instead of binding its own.
       '''
-      if self.__reuseAddr:
-         self.__passiveSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-      self.__passiveSocket.bind((self.__interface,self.__serverPort))
-      self.__passiveSocket.listen(self.__backlog)
-      self.__sockets[self.__passiveSocket.fileno()]  = self.__passiveSocket
-      poll = select.poll()
-      poll.register(self.__passiveSocket, select.POLLIN)
+      if self.__workers > 1 and (self.__linkPort or self.__peers):
+         raise ValueError("Links require a single worker")
+      if self.__workers > 1 and self.__restartSignal:
+         raise ValueError("Restarts require a single worker")
+      handoff = os.environ.pop(RESTART_ENV, None)
+      if handoff is not None:
+         channel, state, clientIDs = self.__receiveHandoff(int(handoff))
+      elif self.__workers == 1:
+         self.__listen()
+         self.__listenAdmin()
+         self.__listenLinks()
       if not os.path.exists(self.getLogDirectory()):
          os.makedirs(self.getLogDirectory())
-      if self.__daemonize:
-         daemon.daemonize([self.__passiveSocket.fileno()])
+      # A restarted server has been detached by the process it replaces
+      if self.__daemonize and handoff is None:
+         keep = [self.__passiveSocket.fileno()]
+         for listener in (self.__adminListener, self.__linkListener):
+            if listener:
+               keep.append(listener.fileno())
+         daemon.daemonize(keep)
+      if self.__workers > 1:
+         self.__forkWorkers()
+         self.__listen()
+         self.__listenAdmin()
+      self.__startLogWriter()
+      if self.__backendName in asyncio_engine.ENGINES:
+         if self.__workerFds or self.__linkListener or self.__peers or \
+               self.__restartSignal or self.__profileSignal:
+            raise ValueError("Workers, links, restarts and profiling require "
+               "a poll-style event backend")
+         if self.__adminListener:
+            logging.warning("Admin listener is not served by asyncio backends")
+         if self.__registrationTimeout or self.__idleTimeout or \
+               self.__stallTimeout:
+            logging.warning("Timeouts are not served by asyncio backends")
+         if self.__stallThreshold:
+            logging.warning("Stalls are not traced by asyncio backends")
+         self.__engine = asyncio_engine.AsyncioEngine(self.__backendName,
+            self.__engineConnected, self.__engineReceived, self.__engineLost)
+         self.__engine.run(self.__passiveSocket)
+         return
+      # Created after daemonizing, which closes unlisted descriptors (epoll)
+      self.__backend = event_backends.createBackend(self.__backendName)
+      self.__backend.register(self.__passiveSocket.fileno(),
+         self.__backend.READ)
+      for fd in self.__workerIndexes:
+         self.__backend.register(fd, self.__backend.READ)
+      for listener in (self.__adminListener, self.__linkListener):
+         if listener:
+            self.__backend.register(listener.fileno(), self.__backend.READ)
+      for peer in self.__peers:
+         self.__dial(peer)
+      if handoff is not None:
+         self.__resumeClients(channel, state, clientIDs)
+      if self.__restartSignal:
+         signal.signal(self.__restartSignal, self.__requestRestart)
+      if self.__profileSignal:
+         signal.signal(self.__profileSignal, self.__requestProfile)
+      READ = self.__backend.READ
+      WRITE = self.__backend.WRITE
+      ERROR = self.__backend.ERROR
+      edgeTriggered = self.__backend.edgeTriggered
+      receivedTimes = self.__callbackTimes["received"]
       while True:
-         for fd, event in poll.poll():
+         try:
+            events = self.__backend.poll(self.__nextTimeout())
+         except (select.error, IOError, OSError) as e:
+            if e.args[0] != errno.EINTR:
+               raise
+            events = [] # Interrupted by a signal
+         self.__now = now = monotonic()
+         if self.__wheel:
+            self.__fireTimers(now)
+         for fd, event in events:
             self.__clientID = fd # Client being served
             sock = self.__sockets[fd]
             # Removed closed sockets from our list.
-            if event & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
-               poll.unregister(fd)
-               del self.__sockets[fd]
-               self.__responses.pop(sock, None)
-               self.disconnected()
-               del self.__clientAddr[fd]
+            if event & ERROR:
+               self.closeClient(fd)
             
             # Accept connections from new sockets.
             elif sock is self.__passiveSocket:
-               newsock, sockname = sock.accept()
-               newsock.setblocking(False)
-               fd = newsock.fileno()
-               self.__clientID = fd # Client being served
-               self.__clientAddr[fd] = newsock.getpeername()
-               self.__sockets[fd] = newsock
-               poll.register(fd, select.POLLIN)
-               self.newClient()
+               # Edge-triggered: the backlog must be emptied
+               count = 1
+               while self.__accept() and (edgeTriggered or
+                     count < self.__acceptBatch):
+                  count += 1
             
-            # Collect incoming data until newline character found.
-            elif event & select.POLLIN:
-               self.received()
+            # Serve metrics to admin connections.
+            elif sock is self.__adminListener:
+               self.__acceptAdmin()
+            
+            # Accept links from other servers.
+            elif sock is self.__linkListener:
+               self.__acceptLink()
+            
+            # Finish connecting links to other servers.
+            elif fd in self.__connecting:
+               self.__linkConnected(fd)
+            
+            elif event & (READ | WRITE):
+               # Resume partially written output with this iteration's output.
+               if event & WRITE:
+                  self.__dirty.add(fd)
+               # Collect incoming data until newline character found.
+               # Edge-triggered: keep reading until the socket would block.
+               if event & READ and fd in self.__workerIndexes:
+                  self.__busReceived(fd)
+               elif event & READ and fd in self.__adminRequests:
+                  self.__adminReceived(fd)
+               elif event & READ and fd in self.__links:
+                  self.__linkReceived(fd)
+               elif event & READ:
+                  self.__lastRead[fd] = now
+                  self.__moreToRead = True
+                  while self.__moreToRead and fd not in self.__closing:
+                     self.__moreToRead = False
+                     started = time.time()
+                     before = self.__bytesIn
+                     self.received()
+                     elapsed = time.time() - started
+                     receivedTimes.append(elapsed)
+                     if elapsed > self.__slowest[0]:
+                        self.__slowest = (elapsed, "received", fd)
+                     if self.__rate and self.__charge(fd,
+                           self.__bytesIn - before):
+                        break # Out of tokens; reading resumes later
+                     if not edgeTriggered:
+                        break
             
             # Don't know how to handle it.
             else:
                logging.warning("Don't know how to handle event:")
-               logging.warning("   " + str(fd) + ": " + str(event))
+               logging.warning("   %d: %d", fd, event)
             
             self.__clientID = -1 # -1 indicates no client being served
-    
+         # Disconnected callbacks may produce output, and failed writes may
+         # close clients, so both run until neither has work left.
+         while self.__dirty or self.__closing:
+            self.__flushDirty()
+            self.__disconnectClosing()
+         self.__recordIteration(len(events))
+         if self.__stallThreshold:
+            self.__traceStall(now)
+         if self.__profileRequested:
+            self.__profileRequested = False
+            self.__toggleProfile()
+         if self.__restartRequested:
+            self.__restartRequested = False
+            self.__handOff()
+   
+   def __nextTimeout(self):
+      '''
+      Returns [float]: Seconds until the next timer may be due; None if no
+      timer is armed
+      '''
+      due = self.__wheel.nextDue()
+      if due is None:
+         return None
+      return max(0, due - monotonic())
+   
+   def __fireTimers(self, now):
+      '''
+      Handles the timers which have expired: throttled clients are read from
+      again, lost links dialed again, and clients past a timeout handled.
+      Argument now[float]: Current time
+      '''
+      for kind, target in self.__wheel.advance(now):
+         if kind == "throttle":
+            del self.__throttled[target]
+            self.__setInterest(target)
+         elif kind == "link":
+            self.__dial(target)
+         elif kind == "idle":
+            self.__idleExpired(target, now)
+         elif kind == "register":
+            self.__timeOut(target, "did not register in time")
+         elif kind == "profile":
+            self.__toggleProfile()
+         else:
+            self.__timeOut(target, "took no output for %gs" %
+               self.__stallTimeout)
+   
+   def __armClientTimers(self, clientID):
+      '''
+      Arms a new client's registration and idle timers.
+      Argument clientID[int]: ID of client
+      '''
+      now = self.__now
+      self.__lastRead[clientID] = now
+      if self.__registrationTimeout and clientID in self.__unregistered:
+         self.__wheel.arm(("register", clientID),
+            now + self.__registrationTimeout)
+      if self.__idleTimeout:
+         self.__wheel.arm(("idle", clientID), now + self.__idleTimeout)
+   
+   def __idleExpired(self, clientID, now):
+      '''
+      Checks a client whose idle timer has expired. A client which has sent
+      data since is given a new timer; a quiet one is passed to clientIdle
+      and must send something within the answer timeout.
+      Arguments:
+      -clientID[int]: ID of client
+      -now[float]: Current time
+      '''
+      last = self.__lastRead[clientID]
+      pinged = self.__pinged.pop(clientID, None)
+      if pinged is not None and last < pinged:
+         self.__timeOut(clientID, "no answer for %gs" % self.__answerTimeout)
+      elif now - last < self.__idleTimeout:
+         self.__wheel.arm(("idle", clientID), last + self.__idleTimeout)
+      else:
+         self.__pinged[clientID] = now
+         self.__wheel.arm(("idle", clientID), now + self.__answerTimeout)
+         self.clientIdle(clientID)
+   
+   def __timeOut(self, clientID, reason):
+      '''
+      Disconnects a client which has timed out.
+      Arguments:
+      -clientID[int]: ID of client
+      -reason[string]: What the client failed to do
+      '''
+      if clientID in self.__responses and clientID not in self.__closing:
+         logging.warning("Client %d timed out: %s", clientID, reason)
+         self.__timedOutCount += 1
+         self.closeClient(clientID)
+   
+   def __listenLinks(self):
+      '''Opens the link listener, if a link port was set.'''
+      if self.__linkPort is None:
+         return
+      sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+      sock.bind((self.__interface, self.__linkPort))
+      sock.listen(self.__backlog)
+      sock.setblocking(False)
+      self.__linkListener = sock
+      self.__sockets[sock.fileno()] = sock
+   
+   def __addLink(self, sock):
+      '''
+      Adds a socket linked (or being linked) to another server.
+      Argument sock[socket]: Link socket
+      Returns [int]: Link ID
+      '''
+      sock.setblocking(False)
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      fd = sock.fileno()
+      self.__sockets[fd] = sock
+      self.__responses[fd] = collections.deque()
+      self.__queuedBytes[fd] = 0
+      self.__links[fd] = LineFramer()
+      return fd
+   
+   def __acceptLink(self):
+      '''
+      Accepts every pending link from another server. All of them are
+      accepted, as an edge-triggered backend reports them once.
+      '''
+      while True:
+         try:
+            newsock, sockname = self.__linkListener.accept()
+         except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+               logging.warning("Link accept failed: %s", e)
+            return
+         fd = self.__addLink(newsock)
+         self.__backend.register(fd, self.__backend.READ)
+         logging.info("Link %d accepted from %s", fd, sockname)
+         self.linkUp(fd)
+   
+   def __dial(self, target):
+      '''
+      Starts connecting a link to another server without blocking; a failed
+      link is dialed again after LINK_RETRY_DELAY.
+      Argument target[tuple]: (host, port) of the other server's link port
+      '''
+      sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      sock.setblocking(False)
+      error = sock.connect_ex(target)
+      if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+         logging.warning("Link to %s failed: %s", target, os.strerror(error))
+         sock.close()
+         self.__wheel.arm(("link", target),
+            monotonic() + Server.LINK_RETRY_DELAY)
+         return
+      fd = self.__addLink(sock)
+      self.__linkTargets[fd] = target
+      self.__connecting.add(fd)
+      self.__backend.register(fd, self.__backend.WRITE)
+   
+   def __linkConnected(self, fd):
+      '''
+      Finishes connecting a link once its socket is writable.
+      Argument fd[int]: Link socket fd
+      '''
+      error = self.__sockets[fd].getsockopt(socket.SOL_SOCKET,
+         socket.SO_ERROR)
+      if error:
+         logging.warning("Link to %s failed: %s", self.__linkTargets[fd],
+            os.strerror(error))
+         self.closeClient(fd)
+         return
+      self.__connecting.discard(fd)
+      self.__setInterest(fd)
+      logging.info("Link %d connected to %s", fd, self.__linkTargets[fd])
+      self.linkUp(fd)
+   
+   def __linkReceived(self, fd):
+      '''
+      Reads from a link and passes every complete message on to
+      linkReceived.
+      Argument fd[int]: Link socket fd
+      '''
+      framer = self.__links[fd]
+      self.__moreToRead = True
+      while self.__moreToRead and fd not in self.__closing:
+         framer.commit(self.recvInto(framer.getWritable()))
+         for message in framer.messages():
+            self.linkReceived(fd, message)
+            if fd in self.__closing:
+               break
+   
+   def __startLogWriter(self):
+      '''
+      Starts writing log records to the log file from a background thread.
+      Called once daemonized and forked, as threads don't survive fork().
+      '''
+      maxBytes, when, backupCount = self.__logRotation
+      self.__logWriter = log_writer.LogWriter(self.getLogFullName(), maxBytes,
+         when, backupCount, self.__structuredLog)
+      self.__logWriter.start()
+      atexit.register(self.__logWriter.stop)
+      self.__metrics.counter("server_log_dropped_total",
+         "Log records dropped because the log writer fell behind",
+         self.__logWriter.getDropped)
+   
+   def __requestRestart(self, signum, frame):
+      '''Signal handler: restarts once the current iteration is done.'''
+      self.__restartRequested = True
+   
+   def __requestProfile(self, signum, frame):
+      '''Signal handler: toggles profiling once the iteration is done.'''
+      self.__profileRequested = True
+   
+   def __toggleProfile(self):
+      '''
+      Starts profiling the event loop, or stops and writes the stats to the
+      log directory, as <log file name>.<time>.prof (see pstats).
+      '''
+      if self.__profiler is None:
+         self.__profiler = cProfile.Profile()
+         self.__profiler.enable()
+         self.__wheel.arm(("profile", None), monotonic() +
+            self.__profileSeconds)
+         logging.info("Profiling for %gs", self.__profileSeconds)
+         return
+      self.__profiler.disable()
+      self.__wheel.cancel(("profile", None))
+      path = "%s.%s.prof" % (self.getLogFullName(),
+         time.strftime("%Y%m%d-%H%M%S"))
+      try:
+         self.__profiler.dump_stats(path)
+         logging.info("Profile written to %s", path)
+      except (IOError, OSError) as e:
+         logging.warning("Profile not written to %s: %s", path, e)
+      self.__profiler = None
+   
+   def __traceStall(self, started):
+      '''
+      Logs the iteration which has just finished if it took longer than the
+      stall threshold, with its slowest callback and that callback's client.
+      Argument started[float]: Time the iteration woke up
+      '''
+      elapsed = monotonic() - started
+      if elapsed > self.__stallThreshold:
+         self.__stallCount += 1
+         seconds, callback, clientID = self.__slowest
+         if callback is None:
+            logging.warning("Event loop stalled for %.3fs outside callbacks",
+               elapsed, extra=log_writer.event("stall",
+               seconds=round(elapsed, 6)))
+         else:
+            logging.warning("Event loop stalled for %.3fs; slowest callback "
+               "%s(client %d) took %.3fs", elapsed, callback, clientID,
+               seconds, extra=log_writer.event("stall",
+               seconds=round(elapsed, 6), callback=callback, client=clientID,
+               callback_seconds=round(seconds, 6)))
+      self.__slowest = (0.0, None, -1)
+   
+   def __handOff(self):
+      '''
+      Restarts the server without disconnecting anyone. A new process is
+      started with the restart command; it inherits the listening and
+      client sockets across exec and is sent, over a Unix socket pair, the
+      clients' addresses and pending output and the state from saveState.
+      Once the new process has taken over, this one exits without closing
+      any connection; if it fails to, this one keeps serving. Admin
+      connections and links are not handed over; links are dialed again by
+      either side.
+      '''
+      # Compressor and decompressor states can't be handed over
+      clients = [fd for fd in self.__clientAddr if fd not in self.__groupOf]
+      if len(clients) < len(self.__clientAddr):
+         logging.warning("Restart disconnects %d compressed clients",
+            len(self.__clientAddr) - len(clients))
+      sockets = [(self.__passiveSocket, "passive"),
+         (self.__adminListener, "admin"), (self.__linkListener, "link")]
+      sockets = [(sock, role) for sock, role in sockets if sock]
+      sockets.extend((self.__sockets[fd], "client") for fd in clients)
+      fds = [sock.fileno() for sock, role in sockets]
+      output = {}
+      for fd in clients:
+         output[fd] = (self.__clientAddr[fd], "".join(data.tobytes() if
+            isinstance(data, memoryview) else data for data in
+            self.__responses[fd]), fd in self.__lingering)
+      data = pickle.dumps({
+         "sockets": [(sock.fileno(), sock.family, role) for sock, role in
+            sockets],
+         "clients": output,
+         "state": self.saveState(),
+      }, 2)
+      channel, end = socket.socketpair()
+      pid = os.fork()
+      if pid == 0:
+         self.__execRestart(end.fileno(), fds)
+      end.close()
+      logging.info("Restarting: handing %d clients over to process %d",
+         len(clients), pid)
+      try:
+         channel.sendall(HANDOFF_HEADER.pack(len(data)))
+         channel.sendall(data)
+         channel.settimeout(Server.RESTART_TIMEOUT)
+         ready = channel.recv(1)
+      except socket.error as e:
+         logging.error("Restart handoff failed: %s", e)
+         ready = ""
+      channel.close()
+      if ready == Server.RESTART_READY:
+         logging.info("Process %d has taken over; exiting", pid)
+         sys.exit(0)
+      logging.error("Process %d did not take over; still serving", pid)
+      try:
+         os.kill(pid, signal.SIGKILL)
+         os.waitpid(pid, 0)
+      except OSError:
+         pass
+   
+   def __execRestart(self, channelFd, fds):
+      '''
+      Runs in the forked child of a restart: closes every descriptor but
+      the handoff socket and the handed sockets, and execs the restart
+      command. Never returns.
+      Arguments:
+      -channelFd[int]: Socket connected to the process being replaced
+      -fds[list]: Descriptors to leave open across exec
+      '''
+      try:
+         maxfd = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+         if maxfd == resource.RLIM_INFINITY:
+            maxfd = daemon.MAXFD
+         low = 3 # stdin, stdout and stderr stay
+         for fd in sorted(set(fds + [channelFd])):
+            os.closerange(low, fd)
+            flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+            low = fd + 1
+         os.closerange(low, maxfd)
+         command = self.__restartCommand or [sys.executable] + sys.argv
+         env = dict(os.environ)
+         env[RESTART_ENV] = str(channelFd)
+         os.execvpe(command[0], command, env)
+      except Exception as e:
+         sys.stderr.write("Restart failed: %s\n" % e)
+      os._exit(127)
+   
+   def __receiveHandoff(self, fd):
+      '''
+      Takes over the sockets of the process this one replaces (see
+      __handOff). Clients are registered later, by __resumeClients.
+      Argument fd[int]: Socket connected to the process being replaced
+      Returns [tuple]: (that socket, state from saveState, dict of old
+      client IDs to new client IDs)
+      '''
+      channel = socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM)
+      os.close(fd)
+      size, = HANDOFF_HEADER.unpack(self.__recvExactly(channel,
+         HANDOFF_HEADER.size))
+      handoff = pickle.loads(self.__recvExactly(channel, size))
+      clientIDs = {}
+      for old, family, role in handoff["sockets"]:
+         # fromfd duplicates the inherited descriptor; the original is not
+         # needed
+         sock = socket.fromfd(old, family, socket.SOCK_STREAM)
+         os.close(old)
+         sock.setblocking(False)
+         fd = sock.fileno()
+         self.__sockets[fd] = sock
+         if role == "passive":
+            self.__passiveSocket.close()
+            self.__passiveSocket = sock
+            sock.listen(self.__backlog) # The backlog may have been changed
+         elif role == "admin":
+            self.__adminListener = sock
+         elif role == "link":
+            self.__linkListener = sock
+         else:
+            addr, output, lingering = handoff["clients"][old]
+            self.__clientAddr[fd] = tuple(addr)
+            self.__responses[fd] = collections.deque([output] if output
+               else [])
+            self.__queuedBytes[fd] = len(output)
+            if lingering:
+               self.__lingering.add(fd)
+            clientIDs[old] = fd
+      logging.info("Took over %d clients from the replaced process",
+         len(clientIDs))
+      return channel, handoff["state"], clientIDs
+   
+   def __recvExactly(self, sock, size):
+      '''
+      Receives a number of bytes from a blocking socket.
+      Arguments:
+      -sock[socket]: Socket to read from
+      -size[int]: Number of bytes
+      Returns [string]: Received data
+      Raises [socket.error]: if the connection closed first
+      '''
+      chunks = []
+      while size:
+         data = sock.recv(min(size, 1048576))
+         if not data:
+            raise socket.error("Handoff ended early")
+         chunks.append(data)
+         size -= len(data)
+      return b"".join(chunks)
+   
+   def __resumeClients(self, channel, state, clientIDs):
+      '''
+      Serves the clients taken over from the replaced process: restores the
+      subclass' state, writes the pending output, and tells the replaced
+      process to exit.
+      Arguments:
+      -channel[socket]: Socket connected to the replaced process
+      -state[object]: State from saveState
+      -clientIDs[dict]: key: Old client ID; Value: New client ID
+      '''
+      for clientID in clientIDs.values():
+         self.__backend.register(clientID, self.__backend.READ)
+         self.__countClient(clientID)
+         if self.__responses[clientID]:
+            self.__dirty.add(clientID)
+      self.restoreState(state, clientIDs)
+      for clientID in clientIDs.values():
+         self.__armClientTimers(clientID)
+      try:
+         channel.sendall(Server.RESTART_READY)
+      except socket.error as e:
+         logging.warning("Replaced process is gone: %s", e)
+      channel.close()
+      while self.__dirty or self.__closing:
+         self.__flushDirty()
+         self.__disconnectClosing()
+   
+   def __charge(self, clientID, count):
+      '''
+      Takes tokens for bytes read from a client's bucket, which refills at the
+      rate limit up to the burst size. A client whose bucket runs dry is not
+      read from again until it has refilled above zero.
+      Arguments:
+      -clientID[int]: ID of client
+      -count[int]: Number of bytes read
+      Returns [bool]: True if the client is now throttled
+      '''
+      now = monotonic()
+      bucket = self.__buckets.get(clientID)
+      if bucket is None:
+         bucket = self.__buckets[clientID] = [self.__burst, now]
+      tokens = min(self.__burst,
+         bucket[0] + max(0.0, now - bucket[1]) * self.__rate)
+      bucket[0] = tokens - count
+      bucket[1] = now
+      if bucket[0] >= 0:
+         return False
+      delay = -bucket[0] / float(self.__rate)
+      self.__throttled[clientID] = now + delay
+      if self.__engine:
+         self.__engine.pauseReading(clientID)
+         self.__engine.getLoop().call_later(delay, self.__engineResume,
+            clientID)
+      else:
+         self.__wheel.arm(("throttle", clientID), now + delay)
+         self.__setInterest(clientID)
+      return True
+   
+   def __engineResume(self, clientID):
+      '''
+      Hands a client throttled on the asyncio engine the data held back from
+      it, which has been paid for by now, and reads from it again.
+      '''
+      if self.__throttled.pop(clientID, None) is not None and \
+            self.__engine.isOpen(clientID):
+         held = self.__held.pop(clientID, None)
+         if held:
+            self.__enginePush(clientID, held)
+         if self.__engine.isOpen(clientID):
+            self.__engine.resumeReading(clientID)
+   
+   def __setInterest(self, clientID):
+      '''
+      Registers for the events a client needs: reads unless it is throttled,
+      and writes while output is pending.
+      Argument clientID[int]: ID of client
+      '''
+      mask = 0
+      if clientID not in self.__throttled:
+         mask |= self.__backend.READ
+      if clientID in self.__writing:
+         mask |= self.__backend.WRITE
+      self.__backend.modify(clientID, mask)
+   
+   def __registerMetrics(self):
+      '''Registers the event loop's metrics.'''
+      self.__loopEvents = self.__metrics.histogram("server_loop_events",
+         "Events handled per event loop wake-up", metrics.COUNT_BUCKETS)
+      self.__callbackHistograms = {}
+      for callback in self.__callbackTimes:
+         self.__callbackHistograms[callback] = self.__metrics.histogram(
+            "server_callback_seconds", "Duration of server callbacks",
+            metrics.TIME_BUCKETS, {"callback": callback})
+      self.__metrics.counter("server_accepted_total",
+         "Client connections accepted", lambda: self.__acceptedCount)
+      self.__metrics.counter("server_refused_total",
+         "Client connections refused by the connection limits",
+         lambda: self.__refusedCount)
+      self.__metrics.gauge("server_unregistered_clients",
+         "Clients not registered yet", lambda: len(self.__unregistered))
+      self.__metrics.counter("server_timed_out_total",
+         "Clients disconnected by a registration, idle or write stall timeout",
+         lambda: self.__timedOutCount)
+      self.__metrics.gauge("server_timers", "Timers armed in the timer wheel",
+         lambda: len(self.__wheel))
+      self.__metrics.counter("server_stalls_total",
+         "Event loop iterations over the stall threshold",
+         lambda: self.__stallCount)
+      self.__metrics.counter("server_dropped_clients_total",
+         "Clients disconnected for exceeding the max queue size",
+         lambda: self.__droppedCount)
+      self.__metrics.counter("server_dropped_messages_total",
+         "Messages dropped for clients over the max queue size",
+         lambda: self.__droppedMessages)
+      self.__metrics.gauge("server_throttled_clients",
+         "Clients not read from until their rate limit allows",
+         lambda: len(self.__throttled))
+      self.__metrics.counter("server_received_bytes_total",
+         "Bytes received from clients", lambda: self.__bytesIn)
+      self.__metrics.counter("server_sent_bytes_total",
+         "Bytes written to clients", lambda: self.__bytesOut)
+      self.__metrics.counter("server_send_calls_total",
+         "Writes made to client sockets", lambda: self.__sendCalls)
+      self.__metrics.counter("server_sent_messages_total",
+         "Messages queued for clients", lambda: self.__messagesOut)
+      self.__metrics.gauge("server_clients", "Connected clients",
+         lambda: len(self.__clientAddr))
+      self.__metrics.gauge("server_queued_bytes",
+         "Bytes waiting in output queues",
+         lambda: sum(self.__queuedBytes.values()))
+      self.__metrics.gauge("server_queued_bytes_max",
+         "Largest output queue in bytes",
+         lambda: max(self.__queuedBytes.values()) if self.__queuedBytes
+            else 0)
+      self.__metrics.gauge("server_clients_writing",
+         "Clients waiting for their socket to become writable",
+         lambda: len(self.__writing))
+      self.__metrics.gauge("server_compressed_clients",
+         "Clients whose connection is compressed",
+         lambda: len(self.__groupOf))
+      self.__metrics.gauge("server_compression_contexts",
+         "Compressors shared by compressed clients",
+         lambda: len(set(self.__groupOf.values())))
+      self.__metrics.counter("server_deflate_in_bytes_total",
+         "Output bytes compressed", lambda: self.__deflatedIn)
+      self.__metrics.counter("server_deflate_out_bytes_total",
+         "Compressed output bytes", lambda: self.__deflatedOut)
+      self.__metrics.counter("server_deflate_calls_total",
+         "Output batches compressed", lambda: self.__deflateCalls)
+   
+   def __recordIteration(self, eventCount):
+      '''
+      Observes one event loop iteration's histograms in a single batch.
+      Argument eventCount[int]: Number of events handled
+      '''
+      self.__loopEvents.observe(eventCount)
+      for callback, times in self.__callbackTimes.items():
+         if times:
+            self.__callbackHistograms[callback].observeMany(times)
+            del times[:]
+   
+   def __listenAdmin(self):
+      '''
+      Opens the admin listener, if an admin address was set. Every worker
+      listens on its own port (port + worker index) or path (path.index).
+      '''
+      address = self.__adminAddress
+      if address is None:
+         return
+      if isinstance(address, int):
+         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+         sock.bind(("127.0.0.1", address + self.__workerIndex))
+      else:
+         if self.__workers > 1:
+            address += "." + str(self.__workerIndex)
+         if os.path.exists(address):
+            os.unlink(address)
+         sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+         sock.bind(address)
+      sock.listen(self.__backlog)
+      sock.setblocking(False)
+      self.__adminListener = sock
+      self.__sockets[sock.fileno()] = sock
+   
+   def __acceptAdmin(self):
+      '''
+      Accepts every pending admin connection, which is not a client. All of
+      them are accepted, as an edge-triggered backend reports them once.
+      '''
+      while True:
+         try:
+            newsock, sockname = self.__adminListener.accept()
+         except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+               logging.warning("Admin accept failed: %s", e)
+            return
+         newsock.setblocking(False)
+         fd = newsock.fileno()
+         self.__sockets[fd] = newsock
+         self.__responses[fd] = collections.deque()
+         self.__queuedBytes[fd] = 0
+         self.__adminRequests[fd] = ""
+         self.__backend.register(fd, self.__backend.READ)
+   
+   def __adminReceived(self, fd):
+      '''
+      Reads an admin connection's HTTP request; once it is complete, answers
+      with the rendered metrics and closes the connection. Reads until the
+      socket would block, as an edge-triggered backend reports data once.
+      Argument fd[int]: Admin connection fd
+      '''
+      request = self.__adminRequests[fd]
+      if request is None: # Answered; anything more is read and ignored
+         try:
+            if not self.__sockets[fd].recv(4096):
+               self.closeClient(fd)
+         except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+               self.closeClient(fd)
+         return
+      while "\r\n\r\n" not in request and "\n\n" not in request and \
+            len(request) < 8192:
+         try:
+            data = self.__sockets[fd].recv(4096)
+         except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+               self.__adminRequests[fd] = request
+               return # Rest of the request is still to come
+            data = ""
+         if not data:
+            self.closeClient(fd)
+            return
+         request += data
+      self.__adminRequests[fd] = None
+      body = self.__metrics.render()
+      self.sendTo(fd, "HTTP/1.0 200 OK\r\n"
+         "Content-Type: text/plain; version=0.0.4\r\n"
+         "Content-Length: " + str(len(body)) + "\r\n\r\n" + body)
+      self.closeWhenFlushed(fd)
+   
+   def __engineConnected(self, fd, addr):
+      '''
+      Called by the asyncio engine when a new client has connected.
+      Arguments:
+      -fd[int]: Client ID
+      -addr[tuple]: Client's address
+      '''
+      refusal = self.__admit(addr)
+      if refusal:
+         self.__refuse(addr, refusal)
+         self.__refused.add(fd)
+         # Closed once the transport is set up: one closed while it is being
+         # set up still has its reader added afterwards (trollius)
+         self.__engine.getLoop().call_soon(self.__engine.close, fd)
+         return
+      self.__clientID = fd # Client being served
+      self.__clientAddr[fd] = addr
+      self.__countClient(fd)
+      self.__acceptedCount += 1
+      self.newClient()
+      self.__clientID = -1
+   
+   def __engineReceived(self, fd, data):
+      '''
+      Called by the asyncio engine when data has arrived from a client. With
+      a rate limit, the data is charged as it arrives: the part over the
+      client's bucket is held back, and reading paused, until the bucket has
+      refilled.
+      Arguments:
+      -fd[int]: Client ID
+      -data[string]: Received data
+      '''
+      if fd in self.__refused:
+         return
+      self.__bytesIn += len(data)
+      if fd in self.__throttled:
+         # Arrived before the pause took effect; its cost is carried over
+         self.__buckets[fd][0] -= len(data)
+         self.__held[fd] = self.__held.get(fd, "") + data
+         return
+      if self.__rate and self.__charge(fd, len(data)):
+         excess = min(len(data), int(math.ceil(-self.__buckets[fd][0])))
+         self.__held[fd] = data[len(data) - excess:]
+         data = data[:len(data) - excess]
+      self.__enginePush(fd, data)
+   
+   def __enginePush(self, fd, data):
+      '''
+      Hands data from the asyncio engine to a client's received() callback,
+      which reads it with recvAmount/recvInto; received() is called until all
+      of it has been read.
+      Arguments:
+      -fd[int]: Client ID
+      -data[string]: Received data
+      '''
+      self.__clientID = fd # Client being served
+      self.__pushed = data
+      self.__pushedOffset = 0
+      while self.__pushedOffset < len(data) and self.__engine.isOpen(fd):
+         offset = self.__pushedOffset
+         self.received()
+         if self.__pushedOffset == offset:
+            break # Callback did not read
+      self.__pushed = None
+      self.__clientID = -1
+   
+   def __engineLost(self, fd):
+      '''
+      Called by the asyncio engine when a client has disconnected.
+      Argument fd[int]: Client ID
+      '''
+      if fd in self.__refused:
+         self.__refused.discard(fd)
+         return
+      self.__clientID = fd # Client being served
+      self.disconnected()
+      self.__uncountClient(fd)
+      del self.__clientAddr[fd]
+      self.__buckets.pop(fd, None)
+      self.__throttled.pop(fd, None)
+      self.__held.pop(fd, None)
+      self.__dropping.discard(fd)
+      self.__clientID = -1
+   
+   def __readPushed(self, size):
+      '''
+      Takes up to size bytes of the data delivered by the asyncio engine.
+      Argument size[int]: (Max) Number of bytes to take
+      Returns [memoryview]: Taken data
+      '''
+      if self.__pushed is None:
+         return memoryview(b"")
+      start = self.__pushedOffset
+      self.__pushedOffset = min(start + size, len(self.__pushed))
+      return memoryview(self.__pushed)[start:self.__pushedOffset]
+   
+   def __createPassiveSocket(self):
+      '''Returns a new non-blocking TCP socket for accepting clients.'''
+      sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      sock.setblocking(False)
+      return sock
+   
+   def __listen(self):
+      '''Binds the passive socket and starts listening.'''
+      if self.__reuseAddr:
+         self.__passiveSocket.setsockopt(socket.SOL_SOCKET,
+            socket.SO_REUSEADDR, 1)
+      if self.__workers > 1:
+         # Every worker binds the port; the kernel spreads new connections
+         self.__passiveSocket.setsockopt(socket.SOL_SOCKET,
+            socket.SO_REUSEPORT, 1)
+      self.__passiveSocket.bind((self.__interface,self.__serverPort))
+      self.__passiveSocket.listen(self.__backlog)
+      self.__sockets[self.__passiveSocket.fileno()]  = self.__passiveSocket
+   
+   def __forkWorkers(self):
+      '''
+      Forks the worker processes, connecting every pair of workers with a Unix
+      domain socket pair. Returns in each worker; the parent process stays
+      here supervising the workers and exits once they have all exited.
+      '''
+      pairs = {}
+      for i in range(self.__workers):
+         for j in range(i + 1, self.__workers):
+            pairs[(i, j)] = socket.socketpair()
+      pids = []
+      for index in range(self.__workers):
+         pid = os.fork()
+         if pid == 0:
+            self.__workerIndex = index
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            for (i, j), (first, second) in pairs.items():
+               if i == index:
+                  self.__addWorker(j, first)
+                  second.close()
+               elif j == index:
+                  self.__addWorker(i, second)
+                  first.close()
+               else:
+                  first.close()
+                  second.close()
+            # The inherited socket is shared by every worker; bind a new one
+            self.__passiveSocket.close()
+            self.__passiveSocket = self.__createPassiveSocket()
+            logging.info("Worker " + str(index) + " started (pid " +
+               str(os.getpid()) + ")")
+            return
+         pids.append(pid)
+      for first, second in pairs.values():
+         first.close()
+         second.close()
+      self.__passiveSocket.close()
+      self.__superviseWorkers(pids)
+   
+   def __addWorker(self, index, sock):
+      '''
+      Adds the bus socket connected to another worker.
+      Arguments:
+      -index[int]: Index of the other worker
+      -sock[socket]: Bus socket
+      '''
+      sock.setblocking(False)
+      fd = sock.fileno()
+      self.__sockets[fd] = sock
+      self.__responses[fd] = collections.deque()
+      self.__queuedBytes[fd] = 0
+      self.__workerFds[index] = fd
+      self.__workerIndexes[fd] = index
+      self.__busFramers[fd] = LineFramer()
+   
+   def __superviseWorkers(self, pids):
+      '''
+      Waits for all workers to exit, passing SIGTERM and SIGINT on to them.
+      Argument pids[list]: Process IDs of the workers
+      '''
+      def stop(signum, frame):
+         for pid in pids:
+            try:
+               os.kill(pid, signal.SIGTERM)
+            except OSError:
+               pass
+      def forward(signum, frame):
+         for pid in pids:
+            try:
+               os.kill(pid, signum)
+            except OSError:
+               pass
+      signal.signal(signal.SIGTERM, stop)
+      signal.signal(signal.SIGINT, stop)
+      if self.__profileSignal:
+         signal.signal(self.__profileSignal, forward)
+      while pids:
+         try:
+            pid, status = os.wait()
+         except OSError as e:
+            if e.errno == errno.EINTR:
+               continue
+            break
+         pids.remove(pid)
+         logging.info("Worker process " + str(pid) + " exited (status " +
+            str(status) + ")")
+      sys.exit(0)
+   
+   def __busReceived(self, fd):
+      '''
+      Reads from a bus socket and passes every complete message on to
+      workerReceived.
+      Argument fd[int]: Bus socket fd
+      '''
+      framer = self.__busFramers[fd]
+      index = self.__workerIndexes[fd]
+      self.__moreToRead = True
+      while self.__moreToRead and fd not in self.__closing:
+         framer.commit(self.recvInto(framer.getWritable()))
+         for message in framer.messages():
+            self.workerReceived(index, message)
+   
+   def __accept(self):
+      '''
+      Accepts one pending connection and calls newClient. A connection over
+      the connection limits is closed right away.
+      Returns [bool]: True if a connection was accepted (or refused)
+      '''
+      try:
+         newsock, sockname = self.__passiveSocket.accept()
+      except socket.error as e:
+         if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            logging.warning("Accept failed: %s", e)
+         return False
+      refusal = self.__admit(sockname)
+      if refusal:
+         self.__refuse(sockname, refusal)
+         newsock.close()
+         return True
+      newsock.setblocking(False)
+      if self.__noDelay:
+         newsock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      fd = newsock.fileno()
+      self.__clientID = fd # Client being served
+      self.__clientAddr[fd] = sockname
+      self.__sockets[fd] = newsock
+      self.__responses[fd] = collections.deque()
+      self.__queuedBytes[fd] = 0
+      self.__backend.register(fd, self.__backend.READ)
+      self.__countClient(fd)
+      self.__armClientTimers(fd)
+      self.__acceptedCount += 1
+      started = time.time()
+      self.newClient()
+      elapsed = time.time() - started
+      self.__callbackTimes["newClient"].append(elapsed)
+      if elapsed > self.__slowest[0]:
+         self.__slowest = (elapsed, "newClient", fd)
+      return True
+   
+   def __admit(self, addr):
+      '''
+      Checks a new connection against the connection limits
+      (setConnectionLimits).
+      Argument addr[tuple]: Client's address
+      Returns [string]: Why the connection is refused; None if admitted
+      '''
+      if self.__maxClients and len(self.__clientAddr) >= self.__maxClients:
+         return "too many clients"
+      if self.__maxUnregistered and \
+            len(self.__unregistered) >= self.__maxUnregistered:
+         return "too many unregistered clients"
+      if self.__maxPerIP and \
+            self.__ipCounts[hash(addr[0]) % IP_SLOTS] >= self.__maxPerIP:
+         return "too many clients from " + addr[0]
+      self.__refusing = False
+      return None
+   
+   def __refuse(self, addr, reason):
+      '''
+      Counts a refused connection. Refusals are logged once until a
+      connection is admitted again, so a storm doesn't flood the log.
+      Arguments:
+      -addr[tuple]: Client's address
+      -reason[string]: Why the connection is refused
+      '''
+      self.__refusedCount += 1
+      if not self.__refusing:
+         self.__refusing = True
+         logging.warning("Refusing connections (%s), first from %s", reason,
+            addr)
+   
+   def __countClient(self, clientID):
+      '''
+      Counts a new client against the per-IP and unregistered limits.
+      Argument clientID[int]: ID of client
+      '''
+      self.__ipCounts[hash(self.__clientAddr[clientID][0]) % IP_SLOTS] += 1
+      self.__unregistered.add(clientID)
+   
+   def __uncountClient(self, clientID):
+      '''
+      Releases a disconnected client's share of the connection limits.
+      Argument clientID[int]: ID of client
+      '''
+      self.__ipCounts[hash(self.__clientAddr[clientID][0]) % IP_SLOTS] -= 1
+      self.__unregistered.discard(clientID)
+   
+   def __disconnectClosing(self):
+      '''
+      Disconnects every client scheduled by closeClient. Disconnected callbacks
+      may schedule further clients (e.g. by overflowing their queues), so this
+      runs until no clients are left to close.
+      '''
+      while self.__closing:
+         fd = self.__closing.pop(0)
+         sock = self.__sockets.pop(fd)
+         try:
+            self.__backend.unregister(fd)
+         except (KeyError, ValueError, IOError, OSError):
+            pass
+         sock.close()
+         del self.__responses[fd]
+         del self.__queuedBytes[fd]
+         self.__writing.discard(fd)
+         self.__dirty.discard(fd)
+         self.__lingering.discard(fd)
+         self.__dropping.discard(fd)
+         self.__buckets.pop(fd, None)
+         self.__throttled.pop(fd, None)
+         for kind in ("throttle", "register", "idle", "stall"):
+            self.__wheel.cancel((kind, fd))
+         self.__lastRead.pop(fd, None)
+         self.__pinged.pop(fd, None)
+         if fd in self.__groupOf:
+            self.__groupOf.pop(fd).members.discard(fd)
+            self.__batches.pop(fd, None)
+            del self.__inflaters[fd]
+         if fd in self.__adminRequests:
+            del self.__adminRequests[fd]
+            continue
+         if fd in self.__links:
+            del self.__links[fd]
+            target = self.__linkTargets.pop(fd, None)
+            if target:
+               self.__wheel.arm(("link", target),
+                  monotonic() + Server.LINK_RETRY_DELAY)
+            if fd in self.__connecting:
+               self.__connecting.discard(fd)
+               logging.warning("Link to %s failed", target)
+            else:
+               self.linkLost(fd)
+            continue
+         if fd in self.__workerIndexes:
+            index = self.__workerIndexes.pop(fd)
+            del self.__workerFds[index]
+            del self.__busFramers[fd]
+            self.workerLost(index)
+            continue
+         self.__clientID = fd # Client being served
+         started = time.time()
+         self.disconnected()
+         elapsed = time.time() - started
+         self.__callbackTimes["disconnected"].append(elapsed)
+         if elapsed > self.__slowest[0]:
+            self.__slowest = (elapsed, "disconnected", fd)
+         self.__uncountClient(fd)
+         del self.__clientAddr[fd]
+         self.__clientID = -1
+   
+   def __flushDirty(self):
+      '''
+      Writes the output queued for clients during this iteration, one write
+      per socket. Corked sockets send full segments until uncorked.
+      '''
+      if self.__deflating:
+         self.__deflateBatches()
+      dirty = self.__dirty
+      self.__dirty = set()
+      cork = self.__cork and TCP_CORK
+      for clientID in dirty:
+         if clientID not in self.__responses:
+            continue
+         if cork and clientID in self.__clientAddr:
+            sock = self.__sockets[clientID]
+            sock.setsockopt(socket.IPPROTO_TCP, TCP_CORK, 1)
+            self.__flush(clientID)
+            sock.setsockopt(socket.IPPROTO_TCP, TCP_CORK, 0)
+         else:
+            self.__flush(clientID)
+   
+   def __deflateBatches(self):
+      '''
+      Compresses the output batched for compressed clients during this
+      iteration. Members of a group sent the same batch (the same message
+      objects, as broadcast shares them) share one compressed copy of it.
+      Members sent different batches are split into groups continuing on
+      copies of the compressor, and groups sent the same batch are merged
+      after a full flush.
+      '''
+      batches = self.__batches
+      parts = {} # key: Batch identity; Value: list of (group, members)
+      for group in self.__deflating:
+         byBatch = {}
+         for clientID in group.members:
+            key = tuple(map(id, batches.get(clientID, ())))
+            byBatch.setdefault(key, []).append(clientID)
+         # The biggest part keeps the compressor; copies are taken before
+         # anything more is compressed
+         ordered = sorted(byBatch.items(), key=lambda item: -len(item[1]))
+         for index, (key, members) in enumerate(ordered):
+            part = group
+            if index:
+               part = group.copy()
+               part.members = set(members)
+               for clientID in members:
+                  self.__groupOf[clientID] = part
+            else:
+               group.members = set(members)
+            if key:
+               parts.setdefault(key, []).append(part)
+      groupOf = self.__groupOf
+      for key, groups in parts.items():
+         batch = batches[next(iter(groups[0].members))]
+         data = "".join(batch)
+         restart = len(groups) > 1
+         for group in groups:
+            compressed = group.compress(data, restart)
+            self.__deflatedIn += len(data)
+            self.__deflatedOut += len(compressed)
+            self.__deflateCalls += 1
+            for clientID in group.members:
+               self.__responses[clientID].append(compressed)
+               self.__queuedBytes[clientID] += len(compressed)
+         if restart:
+            # Past the full flush, every member can continue on one stream
+            kept = max(groups, key=lambda group: len(group.members))
+            for group in groups:
+               if group is not kept:
+                  kept.members.update(group.members)
+                  for clientID in group.members:
+                     groupOf[clientID] = kept
+      self.__batches = {}
+      self.__deflating = set()
+   
+   def __flush(self, clientID):
+      '''
+      Writes as much of a client's pending output as its socket will take
+      without blocking. Watches for write events only while output remains
+      queued.
+      Argument clientID[int]: ID of client
+      '''
+      sock = self.__sockets[clientID]
+      queue = self.__responses[clientID]
+      progressed = False
+      try:
+         while queue:
+            if len(queue) == 1:
+               size = len(queue[0])
+               sent = sock.send(queue[0])
+            else:
+               data = self.__joinPending(queue)
+               size = len(data)
+               sent = sock.send(data)
+            self.__queuedBytes[clientID] -= sent
+            self.__bytesOut += sent
+            self.__sendCalls += 1
+            self.__consume(queue, sent)
+            progressed = progressed or sent > 0
+            if sent < size:
+               break # Socket buffer full; resume on the next writable event
+      except socket.error as e:
+         if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            logging.info("Send to client %d failed: %s", clientID, e)
+            self.closeClient(clientID)
+            return
+      if not queue:
+         self.__dropping.discard(clientID)
+         if clientID in self.__lingering:
+            self.closeClient(clientID)
+      if queue and self.__stallTimeout and clientID in self.__clientAddr and \
+            (progressed or clientID not in self.__writing):
+         # Stalled once the socket takes nothing for the whole timeout
+         self.__wheel.arm(("stall", clientID),
+            self.__now + self.__stallTimeout)
+      if queue and clientID not in self.__writing:
+         self.__writing.add(clientID)
+         self.__setInterest(clientID)
+      elif not queue and clientID in self.__writing:
+         self.__writing.discard(clientID)
+         self.__setInterest(clientID)
+         self.__wheel.cancel(("stall", clientID))
+   
+   def __joinPending(self, queue):
+      '''
+      Joins the buffers at the front of a queue, up to MAX_JOIN bytes, so they
+      can be written with one send.
+      Argument queue[deque]: Pending output
+      Returns [string]: Joined data
+      '''
+      buffers = []
+      size = 0
+      for data in queue:
+         if buffers and size + len(data) > MAX_JOIN:
+            break
+         if isinstance(data, memoryview):
+            data = data.tobytes()
+         buffers.append(data)
+         size += len(data)
+      return "".join(buffers)
+   
+   def __consume(self, queue, sent):
+      '''
+      Removes sent bytes from the front of a queue. A partly sent buffer is
+      replaced with a memoryview of its unsent tail.
+      Arguments:
+      -queue[deque]: Pending output
+      -sent[int]: Number of bytes written
+      '''
+      while sent:
+         data = queue[0]
+         if sent < len(data):
+            queue[0] = memoryview(data)[sent:]
+            return
+         sent -= len(data)
+         queue.popleft()
+   
    def disconnected(self):
       '''
       Must be overridden. Called when a connected socket has disconnected.
@@ -123,18 +1551,206 @@ class Server:
       '''
       raise NotImplementedError("Must override Server.newClient(self)")
    
+   def workerReceived(self, index, message):
+      '''
+      Must be overridden to use several workers. Called when a message has
+      been received from another worker over the bus.
+      Arguments:
+      -index[int]: Index of the sending worker
+      -message[string]: Received message without newline
+      '''
+      raise NotImplementedError("Must override Server.workerReceived(self)")
+   
+   def workerLost(self, index):
+      '''
+      Called when another worker has exited and its bus socket has closed.
+      Argument index[int]: Index of the lost worker
+      '''
+      logging.warning("Lost connection to worker " + str(index))
+   
+   def clientIdle(self, clientID):
+      '''
+      Called when a client has sent nothing for the idle timeout
+      (setIdleTimeout). Override to send a keepalive the client must answer;
+      a client which sends nothing within the answer timeout is disconnected.
+      Argument clientID[int]: ID of the idle client
+      '''
+      pass
+   
+   def linkUp(self, linkID):
+      '''
+      Called when a link to another server has been connected or accepted.
+      Argument linkID[int]: ID of the link
+      '''
+      pass
+   
+   def linkReceived(self, linkID, message):
+      '''
+      Must be overridden to use links. Called when a message has been
+      received from a linked server.
+      Arguments:
+      -linkID[int]: ID of the link
+      -message[string]: Received message without newline
+      '''
+      raise NotImplementedError("Must override Server.linkReceived(self)")
+   
+   def linkLost(self, linkID):
+      '''
+      Called when a link to another server has closed. Links added with
+      addLink are dialed again.
+      Argument linkID[int]: ID of the lost link
+      '''
+      logging.warning("Lost link %d", linkID)
+   
+   def saveState(self):
+      '''
+      Called when the server restarts (setRestartSignal), to hand state over
+      to the new process. Client sockets, addresses and pending output are
+      handed over by Server.
+      Returns [object]: Picklable state passed on to restoreState; default
+      None
+      '''
+      return None
+   
+   def restoreState(self, state, clientIDs):
+      '''
+      Called in a restarted server before it handles any event, with the
+      state saved by the process it replaced. Clients taken over have new
+      IDs, and newClient is not called for them.
+      Arguments:
+      -state[object]: State returned by saveState
+      -clientIDs[dict]: key: Client ID in the replaced process; Value:
+      Client ID in this process
+      '''
+      pass
+   
    def recvAmount(self, size):
       '''
       Receives up to a certain number of bytes from current client.
       Argument size[int]: (Max) Number of bytes to receive
       Returns [string]: Received message
       '''
-      sock = self.__sockets[self.getClientID()]
-      message = sock.recv(size)
+      clientID = self.getClientID()
+      if self.__engine:
+         return self.__readPushed(size).tobytes()
+      if clientID in self.__inflaters:
+         return self.__inflate(clientID, size)
+      sock = self.__sockets[clientID]
+      try:
+         message = sock.recv(size)
+      except socket.error as e:
+         if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return ''
+         message = ''
+      # A short read means the socket buffer has been drained
+      self.__moreToRead = len(message) == size
+      self.__bytesIn += len(message)
       if not message:
-         sock.close()
+         self.closeClient(clientID)
       return message
    
+   def recvInto(self, buffer):
+      '''
+      Receives data from current client directly into a writable buffer.
+      Argument buffer[memoryview/bytearray]: Space to receive into
+      Returns [int]: Number of bytes received; 0 if nothing could be read
+      '''
+      clientID = self.getClientID()
+      if self.__engine:
+         data = self.__readPushed(len(buffer))
+         buffer[:len(data)] = data
+         return len(data)
+      if clientID in self.__inflaters:
+         data = self.__inflate(clientID, len(buffer))
+         buffer[:len(data)] = data
+         return len(data)
+      sock = self.__sockets[clientID]
+      try:
+         count = sock.recv_into(buffer)
+      except socket.error as e:
+         if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return 0
+         count = 0
+      # A short read means the socket buffer has been drained
+      self.__moreToRead = count == len(buffer)
+      self.__bytesIn += count
+      if not count:
+         self.closeClient(clientID)
+      return count
+   
+   def __inflate(self, clientID, size):
+      '''
+      Receives and decompresses data from a compressed client. Input left
+      over from a previous call is decompressed before the socket is read.
+      A client sending corrupt data is disconnected.
+      Arguments:
+      -clientID[int]: ID of client
+      -size[int]: Max number of bytes to return
+      Returns [string]: Decompressed data; may be empty without the client
+      having disconnected
+      '''
+      inflater = self.__inflaters[clientID]
+      data = inflater.unconsumed_tail
+      if not data:
+         try:
+            data = self.__sockets[clientID].recv(size)
+         except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+               self.closeClient(clientID)
+               return ''
+         else:
+            self.__bytesIn += len(data)
+            if not data:
+               self.closeClient(clientID)
+               return ''
+         self.__moreToRead = len(data) == size
+      try:
+         message = inflater.decompress(data, size)
+      except zlib.error as e:
+         logging.warning("Client %d sent corrupt compressed data: %s",
+            clientID, e)
+         self.closeClient(clientID)
+         return ''
+      if inflater.unconsumed_tail or len(message) == size:
+         self.__moreToRead = True
+      return message
+   
+   def startCompression(self, clientID, received="", reply=""):
+      '''
+      Compresses a client's connection from here on, both ways, with raw
+      deflate streams (zlib, wbits -15). Output is sync-flushed once per
+      iteration, so the client can always inflate all it has received.
+      Output queued before this call is sent uncompressed. Not supported by
+      the asyncio engine.
+      Arguments:
+      -clientID[int]: ID of client
+      -received[string](optional): Data already received from the client
+      after it asked for compression, and so compressed
+      -reply[string](optional): Message sent uncompressed, before any
+      compressed output, to tell the client its connection is compressed
+      Returns [string]: The received data decompressed
+      Raises [ValueError]: with the asyncio engine, or if the connection is
+      already compressed
+      '''
+      if self.__engine:
+         raise ValueError("Compression needs a poll style backend")
+      if clientID in self.__groupOf:
+         raise ValueError("Client %d is already compressed" % clientID)
+      if reply:
+         Server.sendTo(self, clientID, reply)
+      group = compression.CompressionGroup(self.__compressionLevel)
+      group.members.add(clientID)
+      self.__groupOf[clientID] = group
+      inflater = zlib.decompressobj(compression.WBITS)
+      self.__inflaters[clientID] = inflater
+      try:
+         return inflater.decompress(received)
+      except zlib.error as e:
+         logging.warning("Client %d sent corrupt compressed data: %s",
+            clientID, e)
+         self.closeClient(clientID)
+         return ''
+   
    def recvUntil(self, suffix):
       '''
       Receives data from current client until a suffix is found.
@@ -152,17 +1768,152 @@ class Server:
    
    def sendTo(self, clientID, message):
       '''
-      Sends a message to a client.
+      Queues a message for a client without blocking. Output is written at
+      the end of the event loop iteration, or as the client's socket becomes
+      writable. A client whose pending output would exceed the max queue
+      size is too slow to keep up and is disconnected, or has the message
+      dropped (setSlowConsumerPolicy).
       Arguments:
       -clientID[int]: ID of client
       -message[string]: message to be sent
       '''
-      sock = self.__sockets[clientID]
-      if sock:
-         sock.sendall(message)
+      if self.__engine:
+         self.__engineWrite(clientID, message)
+      elif self.__enqueue(clientID, message):
+         self.__dirty.add(clientID)
+   
+   def broadcast(self, clientIDs, message):
+      '''
+      Queues one message for many clients. The same message object is shared
+      by every recipient's queue, so the wire data is built and stored once
+      no matter how many clients receive it.
+      Arguments:
+      -clientIDs[iterable]: IDs of clients
+      -message[string]: message to be sent
+      '''
+      if self.__engine:
+         for clientID in clientIDs:
+            self.__engineWrite(clientID, message)
+         return
+      dirty = self.__dirty
+      for clientID in clientIDs:
+         if self.__enqueue(clientID, message):
+            dirty.add(clientID)
+   
+   def __engineWrite(self, clientID, message):
+      '''
+      Writes a message to a client's asyncio transport, which buffers it. A
+      client whose buffered output would exceed the max queue size is too slow
+      to keep up (see __overflow).
+      Arguments:
+      -clientID[int]: ID of client
+      -message[string]: message to be sent
+      '''
+      if not self.__engine.isOpen(clientID):
+         return
+      queued = self.__engine.getBufferedBytes(clientID)
+      if queued + len(message) > self.__maxQueueSize:
+         self.__overflow(clientID, queued)
+         return
+      self.__dropping.discard(clientID)
+      self.__messagesOut += 1
+      self.__bytesOut += len(message)
+      self.__engine.write(clientID, message)
+   
+   def __enqueue(self, clientID, message):
+      '''
+      Appends a message to a client's pending output, unless the max queue
+      size would be exceeded (see __overflow).
+      Arguments:
+      -clientID[int]: ID of client
+      -message[string]: message to be sent
+      Returns [bool]: True if the client had no other output pending and
+      should be flushed at the end of the iteration
+      '''
+      if clientID not in self.__responses or clientID in self.__closing:
+         return False
+      queued = self.__queuedBytes[clientID]
+      # Workers can't be dropped like slow clients; the bus is not bounded
+      if queued + len(message) > self.__maxQueueSize and \
+            clientID not in self.__workerIndexes:
+         if clientID not in self.__links:
+            self.__overflow(clientID, queued)
+            return False
+         if queued + len(message) > MAX_LINK_QUEUE:
+            logging.warning("Link %d output queue full (%d bytes); "
+               "dropping link", clientID, queued)
+            self.closeClient(clientID)
+            return False
+      self.__messagesOut += 1
+      if clientID in self.__groupOf:
+         # Compressed once the iteration's output is complete
+         batch = self.__batches.setdefault(clientID, [])
+         batch.append(message)
+         self.__deflating.add(self.__groupOf[clientID])
+         return len(batch) == 1
+      queue = self.__responses[clientID]
+      queue.append(message)
+      self.__queuedBytes[clientID] = queued + len(message)
+      return len(queue) == 1
+   
+   def __overflow(self, clientID, queued):
+      '''
+      Applies the slow consumer policy to a client whose pending output is
+      full: the client is disconnected, or the new message is dropped.
+      Arguments:
+      -clientID[int]: ID of client
+      -queued[int]: Bytes pending output
+      '''
+      if self.__slowConsumerPolicy == Server.DROP:
+         self.__droppedMessages += 1
+         if clientID not in self.__dropping:
+            # Logged once until the client catches up
+            self.__dropping.add(clientID)
+            logging.warning("Client %d output queue full (%d bytes); "
+               "dropping messages", clientID, queued)
+         return
+      logging.warning("Client %d output queue full (%d bytes); disconnecting",
+         clientID, queued)
+      self.__droppedCount += 1
+      self.closeClient(clientID)
+   
+   def closeClient(self, clientID):
+      '''
+      Schedules a client to be disconnected. The socket is closed and
+      disconnected() is called by the event loop once the current event has
+      been handled.
+      Argument clientID[int]: ID of client
+      '''
+      if self.__engine:
+         self.__engine.close(clientID)
+      elif clientID in self.__responses and clientID not in self.__closing:
+         self.__closing.append(clientID)
+   
+   def closeWhenFlushed(self, clientID):
+      '''
+      Schedules a client to be disconnected once its pending output has been
+      written.
+      Argument clientID[int]: ID of client
+      '''
+      if self.__engine or not (self.__queuedBytes.get(clientID) or
+            clientID in self.__batches):
+         self.closeClient(clientID)
+      else:
+         self.__lingering.add(clientID)
+   
+   def getQueuedBytes(self, clientID):
+      '''
+      Returns number of bytes waiting to be sent to a client
+      Argument clientID[int]: ID of client
+      '''
+      if self.__engine:
+         return self.__engine.getBufferedBytes(clientID)
+      return self.__queuedBytes.get(clientID, 0)
     
    def getLogFileName(self):
-      '''Returns the server's log file name'''
+      '''Returns the server's log file name; one per worker with workers'''
+      if self.__workers > 1:
+         return self.__name + "." + str(self.__workerIndex) + ".log"
       return self.__name + ".log"
    
    def getLogDirectory(self):
@@ -184,6 +1935,297 @@ class Server:
       '''
       self.__daemonize = daemonize
    
+   def setMaxQueueSize(self, size):
+      '''
+      Sets the max number of bytes which may wait to be sent to one client.
+      Argument size[int]: max pending output in bytes
+      '''
+      self.__maxQueueSize = int(size)
+   
+   def setCompressionLevel(self, level):
+      '''
+      Sets the deflate level of connections compressed from here on.
+      Argument level[int]: 1 (fastest) to 9 (smallest); default 6
+      '''
+      if not 0 <= level <= 9:
+         raise ValueError("Compression level must be 0 to 9")
+      self.__compressionLevel = int(level)
+   
+   def setNoDelay(self, noDelay):
+      '''
+      Sets whether TCP_NODELAY is set on client sockets (default True). As
+      output is already coalesced per iteration, Nagle's algorithm would
+      only delay it further.
+      Argument noDelay[bool]: True to disable Nagle's algorithm
+      '''
+      self.__noDelay = noDelay
+   
+   def setCork(self, cork):
+      '''
+      Sets whether client sockets are corked (TCP_CORK, Linux) while their
+      output is flushed, so output written in several sends (over MAX_JOIN
+      bytes) leaves in full segments. Costs two extra system calls per
+      flushed socket; ignored where unsupported.
+      Argument cork[bool]: True to cork sockets while flushing
+      '''
+      self.__cork = cork
+   
+   def setSlowConsumerPolicy(self, policy):
+      '''
+      Sets what happens to a client whose pending output has reached the max
+      queue size.
+      Argument policy[string]: Server.DISCONNECT (default) to disconnect the
+      client, or Server.DROP to drop messages until it catches up
+      '''
+      if policy not in (Server.DISCONNECT, Server.DROP):
+         raise ValueError("Unknown slow consumer policy: " + str(policy))
+      self.__slowConsumerPolicy = policy
+   
+   def setRegistrationTimeout(self, seconds):
+      '''
+      Disconnects clients which have not registered (setRegistered) within
+      a time of connecting. Call before start().
+      Argument seconds[float]: Time allowed; 0 (default) for no limit
+      '''
+      self.__registrationTimeout = max(0, seconds)
+   
+   def setIdleTimeout(self, seconds, answer=30):
+      '''
+      Calls clientIdle for clients which have sent nothing for a time, and
+      disconnects those which then send nothing within the answer time, so
+      dead peers don't linger. Call before start().
+      Arguments:
+      -seconds[float]: Quiet time before clientIdle; 0 (default) disables
+      -answer[float](optional): Time allowed to answer
+      '''
+      self.__idleTimeout = max(0, seconds)
+      self.__answerTimeout = max(Server.TIMER_TICK, answer)
+   
+   def setWriteStallTimeout(self, seconds):
+      '''
+      Disconnects clients whose sockets take none of their pending output
+      for a time, however small their queue is.
+      Argument seconds[float]: Time allowed; 0 (default) for no limit
+      '''
+      self.__stallTimeout = max(0, seconds)
+   
+   def setRateLimit(self, rate, burst=0):
+      '''
+      Limits how fast data is read from each client with a token bucket.
+      Reading from a client which has used up its bucket is delayed until the
+      bucket has refilled; no data is dropped.
+      Arguments:
+      -rate[int]: Bytes per second; 0 for no limit
+      -burst[int](optional): Bucket size in bytes; default is one second's
+      worth of data
+      '''
+      self.__rate = max(0, int(rate))
+      self.__burst = int(burst) or self.__rate
+   
+   def setLogRotation(self, maxBytes=10485760, when=None, backupCount=5):
+      '''
+      Sets when the log file is rotated. Call before start().
+      Arguments:
+      -maxBytes[int](optional): Rotate once the file reaches this size
+      -when[string](optional): Rotate by time instead, e.g. "midnight" or "H"
+      (see logging.handlers.TimedRotatingFileHandler)
+      -backupCount[int](optional): Number of rotated files kept
+      '''
+      self.__logRotation = (maxBytes, when, backupCount)
+   
+   def setStructuredLog(self, structured):
+      '''
+      Sets whether connection events are written to the log file as compact
+      key=value lines (see log_writer.event). Call before start().
+      Argument structured[bool]: True for the structured format
+      '''
+      self.__structuredLog = structured
+   
+   def setBacklog(self, backlog):
+      '''
+      Sets the listen backlog of the server's listening sockets: connections
+      the kernel has completed which wait to be accepted. A backlog too small
+      for a reconnect storm makes clients retry their SYNs for seconds. The
+      kernel caps it at net.core.somaxconn. Call before start().
+      Argument backlog[int]: Max pending connections; default SOMAXCONN
+      '''
+      self.__backlog = max(1, int(backlog))
+   
+   def setAcceptBatch(self, count):
+      '''
+      Sets the max number of connections accepted per event loop wake-up.
+      Bigger batches empty a reconnect storm's backlog faster; smaller ones
+      serve connected clients more often in between. Edge-triggered backends
+      always accept every pending connection.
+      Argument count[int]: Max connections per wake-up; default 64
+      '''
+      self.__acceptBatch = max(1, int(count))
+   
+   def setConnectionLimits(self, maxClients=0, perIP=0, unregistered=0):
+      '''
+      Sets admission limits for new clients. A connection over a limit is
+      closed as soon as it is accepted, before newClient. With several
+      workers, every worker applies the limits to its own clients.
+      Arguments:
+      -maxClients[int](optional): Max connected clients; 0 is unlimited
+      -perIP[int](optional): Max clients per IP address; 0 is unlimited.
+      Addresses are counted in IP_SLOTS hashed counters, so the rare
+      addresses sharing a counter share the limit
+      -unregistered[int](optional): Max clients not yet registered
+      (setRegistered); 0 is unlimited
+      '''
+      self.__maxClients = max(0, int(maxClients))
+      self.__maxPerIP = max(0, int(perIP))
+      self.__maxUnregistered = max(0, int(unregistered))
+   
+   def setRegistered(self, clientID):
+      '''
+      Marks a client as registered, so it no longer counts against the limit
+      of unregistered clients (setConnectionLimits). Subclasses call it once
+      a client has identified itself.
+      Argument clientID[int]: ID of client
+      '''
+      self.__unregistered.discard(clientID)
+      self.__wheel.cancel(("register", clientID))
+   
+   def setWorkers(self, workers):
+      '''
+      Sets the number of worker processes. With more than one, start() forks
+      the workers, which accept clients on the same port (SO_REUSEPORT).
+      Argument workers[int]: number of worker processes
+      '''
+      self.__workers = max(1, int(workers))
+   
+   def getWorkerCount(self):
+      '''Returns the number of worker processes'''
+      return self.__workers
+   
+   def getWorkerIndex(self):
+      '''Returns this worker's index (0 when not forking workers)'''
+      return self.__workerIndex
+   
+   def getWorkerIndexes(self):
+      '''Returns the indexes of the other workers still connected'''
+      return self.__workerFds.keys()
+   
+   def sendToWorker(self, index, message):
+      '''
+      Sends a message to another worker over the bus. Appends newline
+      character to message.
+      Arguments:
+      -index[int]: Worker index
+      -message[string]: message to be sent; must not contain newlines
+      '''
+      if index in self.__workerFds:
+         self.sendTo(self.__workerFds[index], message + "\n")
+   
+   def sendToWorkers(self, message):
+      '''
+      Sends a message to every other worker over the bus. Appends newline
+      character to message.
+      Argument message[string]: message to be sent; must not contain newlines
+      '''
+      if self.__workerFds:
+         self.broadcast(self.__workerFds.values(), message + "\n")
+   
+   def setLinkPort(self, port):
+      '''
+      Sets the port on which links from other servers are accepted. Links
+      are not authenticated by Server; bind to a trusted interface.
+      Argument port[int]: Link port number
+      '''
+      self.__linkPort = int(port)
+   
+   def addLink(self, host, port):
+      '''
+      Adds a server to link to once started; the link is dialed again
+      whenever it is lost.
+      Arguments:
+      -host[string]: Other server's address
+      -port[int]: Other server's link port
+      '''
+      self.__peers.append((host, int(port)))
+   
+   def getLinkIDs(self):
+      '''Returns the IDs of all connected links.'''
+      return [fd for fd in self.__links if fd not in self.__connecting and
+         fd not in self.__closing]
+   
+   def sendToLink(self, linkID, message):
+      '''
+      Sends a message to a linked server. Appends newline character to
+      message.
+      Arguments:
+      -linkID[int]: ID of the link
+      -message[string]: Message without newline
+      '''
+      if linkID in self.__links and linkID not in self.__connecting:
+         self.sendTo(linkID, message + "\n")
+   
+   def setRestartSignal(self, signum=signal.SIGHUP, command=None):
+      '''
+      Lets a signal restart the server without disconnecting anyone, e.g. to
+      deploy a new version. The restart command starts a new process, which
+      must set up and start the server as this one did; it takes over the
+      listening sockets, the clients with their pending output, and the
+      state from saveState, and this process exits. If the new process fails
+      to take over, this one keeps serving. Needs a single worker and a
+      poll-style event backend. Call before start().
+      Arguments:
+      -signum[int](optional): Signal; default is SIGHUP
+      -command[list](optional): Program and arguments of the new process;
+      default runs this program again with the same arguments
+      '''
+      self.__restartSignal = signum
+      self.__restartCommand = command
+   
+   def setProfileSignal(self, signum=signal.SIGUSR1, seconds=30):
+      '''
+      Lets a signal profile the event loop, callbacks included, with cProfile.
+      Profiling stops after the given time or on the next signal, and the
+      stats are written to the log directory as <log file name>.<time>.prof,
+      to be read with pstats; with workers, every worker writes its own.
+      Profiling costs nothing until the signal arrives. Needs a poll-style
+      event backend. Call before start().
+      Arguments:
+      -signum[int](optional): Signal; default is SIGUSR1
+      -seconds[float](optional): Max time profiled; default is 30
+      '''
+      self.__profileSignal = signum
+      self.__profileSeconds = seconds
+   
+   def setStallThreshold(self, seconds):
+      '''
+      Logs a warning for every event loop iteration which takes longer than
+      a threshold, naming its slowest newClient, received or disconnected
+      callback and the client it served.
+      Argument seconds[float]: Threshold; 0 disables stall tracing
+      '''
+      self.__stallThreshold = seconds
+   
+   def setAdminAddress(self, address):
+      '''
+      Sets where runtime metrics are served, over HTTP in the Prometheus text
+      format. With several workers, each worker adds its index to the port
+      number or appends ".<index>" to the path.
+      Argument address[int/string]: Port number on 127.0.0.1, or Unix socket
+      path
+      '''
+      self.__adminAddress = address
+   
+   def getMetrics(self):
+      '''Returns the server's Metrics registry, to register more metrics'''
+      return self.__metrics
+   
+   def getEventLoop(self):
+      '''
+      Returns the asyncio event loop serving clients with the asyncio
+      backends; None otherwise. Timers and tasks may be scheduled on it.
+      '''
+      if self.__engine:
+         return self.__engine.getLoop()
+      return None
+   
    def getClientID(self):
       '''Returns current client's ID while handling an event'''
       return self.__clientID
@@ -197,9 +2239,7 @@ class Server:
       if clientID == -1:
          return self.__clientAddr[self.getClientID()]
       else:
-         sock = self.__sockets[clientID]
-         addr = sock.getpeername()
-         return addr
+         return self.__clientAddr[clientID]
    
    def getClientIPAddress(self, clientID=-1):
       '''
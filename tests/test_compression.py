@@ -0,0 +1,122 @@
+# Author:     Kevin Koshiol
+# Filename:   test_compression.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+Tests of CompressionGroup streams, and of Server splitting and merging the
+groups of compressed clients sent different and identical output.
+'''
+
+import os
+import sys
+import zlib
+import unittest
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+   __file__))))
+
+import compression
+from compression import CompressionGroup
+from select_tcpserver import Server
+
+class CompressionGroupTest(unittest.TestCase):
+
+   def testCopyContinuesTheStream(self):
+      group = CompressionGroup(6)
+      first = group.compress(b"shared start\n")
+      copy = group.copy()
+      left = zlib.decompressobj(compression.WBITS)
+      right = zlib.decompressobj(compression.WBITS)
+      self.assertEqual(left.decompress(first), b"shared start\n")
+      self.assertEqual(right.decompress(first), b"shared start\n")
+      self.assertEqual(left.decompress(group.compress(b"left\n")), b"left\n")
+      self.assertEqual(right.decompress(copy.compress(b"right\n")),
+         b"right\n")
+
+   def testFullFlushLetsMembersSwitchStreams(self):
+      one = CompressionGroup(6)
+      two = CompressionGroup(6)
+      inflater = zlib.decompressobj(compression.WBITS)
+      self.assertEqual(inflater.decompress(two.compress(b"two\n")), b"two\n")
+      self.assertEqual(inflater.decompress(two.compress(b"both\n", True)),
+         b"both\n")
+      one.compress(b"both\n", True)
+      # Past the full flush, a member of two can continue on one's stream
+      self.assertEqual(inflater.decompress(one.compress(b"after\n")),
+         b"after\n")
+
+class GroupSplitMergeTest(unittest.TestCase):
+   '''Server's grouping of compressed clients, without sockets'''
+
+   CLIENTS = (5, 6, 7)
+
+   def setUp(self):
+      self.server = Server("compressiontest", 0)
+      self.inflaters = {}
+      for clientID in GroupSplitMergeTest.CLIENTS:
+         self.server._Server__responses[clientID] = collections.deque()
+         self.server._Server__queuedBytes[clientID] = 0
+         self.server.startCompression(clientID)
+         self.inflaters[clientID] = zlib.decompressobj(compression.WBITS)
+
+   def deflate(self):
+      '''
+      Compresses the batched output.
+      Returns [dict]: key: Client ID; Value: the client's new output,
+      decompressed
+      '''
+      self.server._Server__deflateBatches()
+      output = {}
+      for clientID, queue in self.server._Server__responses.items():
+         data = b"".join(queue)
+         queue.clear()
+         output[clientID] = self.inflaters[clientID].decompress(data)
+      return output
+
+   def groupOf(self, clientID):
+      return self.server._Server__groupOf[clientID]
+
+   def testBroadcastMergesGroups(self):
+      self.server.broadcast([5, 6, 7], b"hello\n")
+      self.assertEqual(self.deflate(), {5: b"hello\n", 6: b"hello\n",
+         7: b"hello\n"})
+      self.assertTrue(self.groupOf(5) is self.groupOf(6) is self.groupOf(7))
+      self.assertEqual(self.groupOf(5).members, set([5, 6, 7]))
+      calls = self.server._Server__deflateCalls
+      self.server.broadcast([5, 6, 7], b"again\n")
+      self.assertEqual(self.deflate()[7], b"again\n")
+      # One group, one compression of the batch
+      self.assertEqual(self.server._Server__deflateCalls, calls + 1)
+
+   def testDifferentOutputSplitsAndMergesAgain(self):
+      self.server.broadcast([5, 6, 7], b"hello\n")
+      self.deflate()
+      self.server.sendTo(5, b"only five\n")
+      self.server.broadcast([6, 7], b"six and seven\n")
+      self.assertEqual(self.deflate(), {5: b"only five\n",
+         6: b"six and seven\n", 7: b"six and seven\n"})
+      self.assertFalse(self.groupOf(5) is self.groupOf(6))
+      self.assertTrue(self.groupOf(6) is self.groupOf(7))
+      self.assertEqual(self.groupOf(5).members, set([5]))
+      self.server.broadcast([5, 6, 7], b"everyone\n")
+      self.assertEqual(self.deflate(), {5: b"everyone\n", 6: b"everyone\n",
+         7: b"everyone\n"})
+      self.assertTrue(self.groupOf(5) is self.groupOf(6) is self.groupOf(7))
+      # The merged stream still decompresses for every member
+      self.server.broadcast([5, 6, 7], b"merged\n")
+      self.assertEqual(self.deflate(), {5: b"merged\n", 6: b"merged\n",
+         7: b"merged\n"})
+
+   def testIdleMembersStayInTheirGroup(self):
+      self.server.broadcast([5, 6, 7], b"hello\n")
+      self.deflate()
+      self.server.broadcast([5, 6], b"not seven\n")
+      self.assertEqual(self.deflate(), {5: b"not seven\n",
+         6: b"not seven\n", 7: b""})
+      self.server.sendTo(7, b"seven\n")
+      self.assertEqual(self.deflate()[7], b"seven\n")
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,130 @@
+# Author:     Kevin Koshiol
+# Filename:   test_framing.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+Tests of LineFramer and BinaryFramer: data arriving in pieces, messages
+over the limits, and the offset bookkeeping around compaction.
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+   __file__))))
+
+import framing
+from framing import LineFramer, BinaryFramer
+
+def receive(framer, data):
+   '''
+   Writes data into a framer the way a socket read does.
+   Arguments:
+   -framer[LineFramer or BinaryFramer]: Framer to receive into
+   -data[string]: Received data
+   '''
+   view = framer.getWritable(len(data))
+   view[:len(data)] = data
+   framer.commit(len(data))
+
+class LineFramerTest(unittest.TestCase):
+
+   def testPartialLines(self):
+      framer = LineFramer()
+      receive(framer, b"hel")
+      self.assertEqual(list(framer.messages()), [])
+      receive(framer, b"lo\nwor")
+      self.assertEqual(list(framer.messages()), [b"hello"])
+      self.assertEqual(framer.getPendingData(), b"wor")
+      receive(framer, b"ld\n\n")
+      self.assertEqual(list(framer.messages()), [b"world", b""])
+      self.assertEqual(framer.pending(), 0)
+
+   def testCompleteLongLineIsWhole(self):
+      framer = LineFramer(256)
+      line = b"x" * 1000
+      framer.feed(line + b"\nnext\n")
+      self.assertEqual(list(framer.messages()), [line, b"next"])
+
+   def testUnfinishedLongLineIsFragmented(self):
+      framer = LineFramer(256)
+      framer.feed(b"y" * 600)
+      self.assertEqual(list(framer.messages()), [b"y" * 256, b"y" * 256])
+      self.assertEqual(framer.pending(), 88)
+      framer.feed(b"y" * 12 + b"\n")
+      self.assertEqual(list(framer.messages()), [b"y" * 100])
+
+   def testWithoutFragmentSizeWaitsForNewline(self):
+      framer = LineFramer()
+      framer.feed(b"z" * 10000)
+      self.assertEqual(list(framer.messages()), [])
+      framer.feed(b"\n")
+      self.assertEqual(list(framer.messages()), [b"z" * 10000])
+
+   def testCompactionKeepsOffsets(self):
+      framer = LineFramer(bufferSize=16)
+      framer.feed(b"abcdefghij\nklm")
+      self.assertEqual(list(framer.messages()), [b"abcdefghij"])
+      # Less than half the buffer is free: the tail moves to the front
+      receive(framer, b"nop")
+      receive(framer, b"qrstuvwxyz\n")
+      self.assertEqual(list(framer.messages()), [b"klmnopqrstuvwxyz"])
+      self.assertEqual(framer.pending(), 0)
+
+   def testGrowsPastTheInitialSize(self):
+      framer = LineFramer(bufferSize=8)
+      for index in range(100):
+         receive(framer, b"%02d," % (index % 100))
+      receive(framer, b"\n")
+      message, = list(framer.messages())
+      self.assertEqual(len(message), 300)
+
+class BinaryFramerTest(unittest.TestCase):
+
+   def testPartialFrames(self):
+      framer = BinaryFramer()
+      data = framing.encodeFrame(framing.FRAME_CHAT, b"hello") + \
+         framing.encodeFrame(framing.FRAME_NAME, b"bob")
+      for index in range(len(data)):
+         receive(framer, data[index:index + 1])
+         messages = list(framer.messages())
+         if index == 9:
+            self.assertEqual(messages, [(framing.FRAME_CHAT, b"hello")])
+         elif index == len(data) - 1:
+            self.assertEqual(messages, [(framing.FRAME_NAME, b"bob")])
+         else:
+            self.assertEqual(messages, [])
+      self.assertEqual(framer.pending(), 0)
+
+   def testFrameLongerThanMaxRaises(self):
+      framer = BinaryFramer(maxFrame=16)
+      framer.feed(framing.encodeFrame(framing.FRAME_CHAT, b"x" * 17))
+      self.assertRaises(ValueError, framer.nextMessage)
+
+   def testWritableFitsTheRestOfTheFrame(self):
+      framer = BinaryFramer(bufferSize=8)
+      payload = b"p" * 5000
+      data = framing.encodeFrame(framing.FRAME_CHAT, payload)
+      receive(framer, data[:100])
+      self.assertEqual(list(framer.messages()), [])
+      self.assertTrue(len(framer.getWritable()) >= len(data) - 100)
+      receive(framer, data[100:])
+      self.assertEqual(list(framer.messages()),
+         [(framing.FRAME_CHAT, payload)])
+
+   def testCompactionKeepsOffsets(self):
+      framer = BinaryFramer(bufferSize=32)
+      first = framing.encodeFrame(framing.FRAME_CHAT, b"a" * 20)
+      second = framing.encodeFrame(framing.FRAME_CHAT, b"b" * 20)
+      receive(framer, first + second[:5])
+      self.assertEqual(list(framer.messages()),
+         [(framing.FRAME_CHAT, b"a" * 20)])
+      receive(framer, second[5:])
+      self.assertEqual(list(framer.messages()),
+         [(framing.FRAME_CHAT, b"b" * 20)])
+      self.assertEqual(framer.getPendingData(), b"")
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,220 @@
+# Author:     Kevin Koshiol
+# Filename:   test_rate_limit.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+Tests of Server's per-client token bucket: the bucket arithmetic against a
+fake clock, and the throttle path end to end on every event backend.
+'''
+
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+   __file__))))
+
+import event_backends
+import asyncio_engine
+import select_tcpserver
+from select_tcpserver import Server
+
+class EchoServer(Server):
+   '''Server sending every client its own data back'''
+
+   def newClient(self):
+      pass
+
+   def disconnected(self):
+      pass
+
+   def received(self):
+      data = self.recvAmount(4096)
+      if data:
+         self.sendTo(self.getClientID(), data)
+
+class FakeBackend:
+   '''Backend recording the masks Server asks for'''
+   READ = 1
+   WRITE = 4
+   ERROR = 8
+
+   def __init__(self):
+      self.masks = {} # key: fd; Value: last mask
+
+   def modify(self, fd, events):
+      self.masks[fd] = events
+
+def serve(backend, port, home):
+   '''Runs an echo server limited to 8000 bytes a second'''
+   os.environ["HOME"] = home
+   server = EchoServer("ratetest", port, "127.0.0.1", backend)
+   server.setRateLimit(8000, 2000)
+   server.start()
+
+def freePort():
+   '''Returns [int]: A TCP port nothing is listening on'''
+   sock = socket.socket()
+   sock.bind(("127.0.0.1", 0))
+   port = sock.getsockname()[1]
+   sock.close()
+   return port
+
+class TokenBucketTest(unittest.TestCase):
+   '''Bucket arithmetic, driven by a fake monotonic clock'''
+
+   def setUp(self):
+      self.now = 1000.0
+      self.monotonic = select_tcpserver.monotonic
+      select_tcpserver.monotonic = lambda: self.now
+      self.server = Server("buckettest", 0)
+      self.server.setRateLimit(100, 200)
+      self.backend = FakeBackend()
+      self.server._Server__backend = self.backend
+
+   def tearDown(self):
+      select_tcpserver.monotonic = self.monotonic
+
+   def charge(self, count, clientID=5):
+      return self.server._Server__charge(clientID, count)
+
+   def testBurstIsNotThrottled(self):
+      self.assertFalse(self.charge(200))
+      self.assertEqual(self.backend.masks, {})
+
+   def testOverdrawThrottlesUntilPaidBack(self):
+      self.assertFalse(self.charge(150))
+      self.assertTrue(self.charge(100))
+      # 50 bytes owed at 100 bytes a second
+      self.assertAlmostEqual(self.server._Server__throttled[5], 1000.5)
+      self.assertEqual(self.backend.masks[5], 0)
+
+   def testRefillsAtRateUpToBurst(self):
+      self.charge(200)
+      self.now += 1.0
+      self.assertFalse(self.charge(100))
+      self.assertTrue(self.charge(1))
+      self.now += 60.0
+      self.assertFalse(self.charge(200))
+      self.assertTrue(self.charge(1))
+
+   def testClockSteppingBackDoesNotDrain(self):
+      self.charge(100)
+      self.now -= 30.0
+      self.assertFalse(self.charge(100))
+
+   def testClientsHaveSeparateBuckets(self):
+      self.charge(200, 5)
+      self.assertFalse(self.charge(200, 6))
+
+class SelectorsEmptyMaskTest(unittest.TestCase):
+   '''A throttled client's fd is given an empty mask'''
+
+   def setUp(self):
+      try:
+         self.backend = event_backends.createBackend("selectors")
+      except ImportError:
+         self.skipTest("no selectors module")
+      self.left, self.right = socket.socketpair()
+
+   def tearDown(self):
+      self.backend.close()
+      self.left.close()
+      self.right.close()
+
+   def testEmptyMaskStopsAndResumesEvents(self):
+      fd = self.left.fileno()
+      self.backend.register(fd, self.backend.READ)
+      self.right.send(b"x")
+      self.backend.modify(fd, 0)
+      self.assertEqual(self.backend.poll(0), [])
+      self.backend.modify(fd, self.backend.READ)
+      self.assertEqual(self.backend.poll(0), [(fd, self.backend.READ)])
+      self.backend.modify(fd, 0)
+      self.backend.unregister(fd)
+
+class ThrottlePathTest(unittest.TestCase):
+   '''A client sending faster than its limit is slowed, not dropped'''
+
+   def setUp(self):
+      self.home = tempfile.mkdtemp()
+
+   def tearDown(self):
+      shutil.rmtree(self.home, ignore_errors=True)
+
+   def echo(self, backend):
+      '''
+      Sends an echo server 10000 bytes at once.
+      Argument backend[string]: Event backend of the server
+      Returns [tuple]: Bytes echoed back, seconds it took
+      '''
+      port = freePort()
+      process = multiprocessing.Process(target=serve,
+         args=(backend, port, self.home))
+      process.start()
+      try:
+         deadline = time.time() + 5
+         while True:
+            try:
+               sock = socket.create_connection(("127.0.0.1", port), 1)
+               break
+            except socket.error:
+               if time.time() > deadline or not process.is_alive():
+                  raise
+               time.sleep(0.05)
+         sock.settimeout(0.5)
+         started = time.time()
+         sock.sendall(b"x" * 10000)
+         received = 0
+         while received < 10000 and time.time() - started < 10:
+            try:
+               data = sock.recv(65536)
+            except socket.timeout:
+               continue
+            if not data:
+               break
+            received += len(data)
+         elapsed = time.time() - started
+         sock.close()
+         return received, elapsed
+      finally:
+         process.terminate()
+         process.join()
+
+   def checkBackend(self, backend):
+      try:
+         if backend == "asyncio":
+            if asyncio_engine.asyncio is None:
+               raise ImportError("no asyncio module")
+         else:
+            event_backends.createBackend(backend).close()
+      except (ImportError, AttributeError, IOError, OSError):
+         self.skipTest(backend + " backend unavailable")
+      received, elapsed = self.echo(backend)
+      self.assertEqual(received, 10000)
+      # 8000 bytes over the burst at 8000 bytes a second
+      self.assertGreater(elapsed, 0.6)
+
+   def testPoll(self):
+      self.checkBackend("poll")
+
+   def testEpoll(self):
+      self.checkBackend("epoll")
+
+   def testEpollEdgeTriggered(self):
+      self.checkBackend("epoll-et")
+
+   def testSelectors(self):
+      self.checkBackend("selectors")
+
+   def testAsyncio(self):
+      self.checkBackend("asyncio")
+
+if __name__ == "__main__":
+   unittest.main()
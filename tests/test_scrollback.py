@@ -0,0 +1,111 @@
+# Author:     Kevin Koshiol
+# Filename:   test_scrollback.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+Tests of Scrollback's line and byte limits, its segment file, and
+IRCServer keeping no history until setScrollback is called.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+   __file__))))
+
+from scrollback import Scrollback
+from irc_server import IRCServer
+
+class ScrollbackLimitTest(unittest.TestCase):
+
+   def testLineLimitDropsOldest(self):
+      history = Scrollback(maxLines=3)
+      for index in range(5):
+         history.append("line %d\n" % index)
+      self.assertEqual(len(history), 3)
+      self.assertEqual(history.getWireData(), "line 2\nline 3\nline 4\n")
+
+   def testByteLimitDropsOldest(self):
+      history = Scrollback(maxLines=100, maxBytes=20)
+      for index in range(5):
+         history.append("abcdefg%d\n" % index) # 9 bytes each
+      self.assertEqual(history.getWireData(), "abcdefg3\nabcdefg4\n")
+
+   def testLineOverByteLimitIsSkipped(self):
+      history = Scrollback(maxBytes=10)
+      history.append("short\n")
+      history.append("x" * 20 + "\n")
+      self.assertEqual(history.getWireData(), "short\n")
+
+   def testWireDataFollowsAppends(self):
+      history = Scrollback()
+      self.assertEqual(history.getWireData(), "")
+      history.append("one\n")
+      self.assertEqual(history.getWireData(), "one\n")
+      history.append("two\n")
+      self.assertEqual(history.getWireData(), "one\ntwo\n")
+
+class ScrollbackFileTest(unittest.TestCase):
+
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.path = os.path.join(self.directory, "history")
+
+   def tearDown(self):
+      shutil.rmtree(self.directory, ignore_errors=True)
+
+   def testHistorySurvivesReopening(self):
+      history = Scrollback(maxLines=2, path=self.path)
+      for index in range(3):
+         history.append("line %d\n" % index)
+      history.close()
+      history = Scrollback(maxLines=2, path=self.path)
+      self.assertEqual(history.getWireData(), "line 1\nline 2\n")
+      history.close()
+
+   def testFullFileIsRewrittenWithinLimits(self):
+      # The file has room for 4 * maxBytes of appends before a rewrite
+      history = Scrollback(maxLines=1000, maxBytes=64, path=self.path)
+      for index in range(200):
+         history.append("%03d\n" % index)
+      history.close()
+      self.assertTrue(os.path.getsize(self.path) <= 8 + 4 * 64)
+      history = Scrollback(maxLines=1000, maxBytes=64, path=self.path)
+      self.assertEqual(history.getWireData(),
+         "".join("%03d\n" % index for index in range(184, 200)))
+      history.close()
+
+   def testLimitsApplyWhenLoading(self):
+      history = Scrollback(maxLines=10, path=self.path)
+      for index in range(10):
+         history.append("line %d\n" % index)
+      history.close()
+      history = Scrollback(maxLines=4, path=self.path)
+      self.assertEqual(len(history), 4)
+      self.assertEqual(history.getWireData().split("\n")[0], "line 6")
+      history.close()
+
+class ServerScrollbackTest(unittest.TestCase):
+
+   def testOffByDefault(self):
+      server = IRCServer(30000, "127.0.0.1")
+      self.assertTrue(server.getScrollback() is None)
+
+   def testEnabledBySetScrollback(self):
+      server = IRCServer(30000, "127.0.0.1")
+      server.setScrollback(5, 1024)
+      history = server.getScrollback()
+      self.assertFalse(history is None)
+      self.assertTrue(server.getScrollback() is history)
+
+   def testZeroLinesKeepsNoHistory(self):
+      server = IRCServer(30000, "127.0.0.1")
+      server.setScrollback(0)
+      self.assertTrue(server.getScrollback() is None)
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,135 @@
+# Author:     Kevin Koshiol
+# Filename:   test_timer_wheel.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+Tests of TimerWheel, and of the monotonic clock Server drives it with.
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+   __file__))))
+
+import clock
+from timer_wheel import TimerWheel
+
+class TimerWheelTest(unittest.TestCase):
+
+   def setUp(self):
+      self.wheel = TimerWheel(0.0, tick=0.05, slots=1024)
+
+   def expireUntil(self, end, step=0.05):
+      '''
+      Advances the wheel a tick at a time.
+      Arguments:
+      -end[float]: Time to stop at
+      -step[float](optional): Seconds between advances
+      Returns [dict]: key: Expired key; Value: time it expired at
+      '''
+      expired = {}
+      ticks = int(round(end / step))
+      for index in range(1, ticks + 1):
+         now = index * step
+         for key in self.wheel.advance(now):
+            expired[key] = now
+      return expired
+
+   def testFiresOnTimeNotEarly(self):
+      self.wheel.arm("a", 1.0)
+      self.assertEqual(self.wheel.advance(0.95), [])
+      self.assertEqual(self.wheel.advance(1.0), ["a"])
+      self.assertEqual(len(self.wheel), 0)
+
+   def testWrapsAroundTheSlots(self):
+      # 1024 slots of 0.05 s are one revolution of 51.2 s
+      self.wheel.arm("first", 10.0)
+      self.wheel.arm("second", 61.2) # Same slot, next revolution
+      self.wheel.arm("third", 112.4) # Same slot, the one after
+      expired = self.expireUntil(120.0)
+      self.assertAlmostEqual(expired["first"], 10.0)
+      self.assertAlmostEqual(expired["second"], 61.2)
+      self.assertAlmostEqual(expired["third"], 112.4)
+
+   def testLongGapVisitsEverySlotOnce(self):
+      for index in range(2048):
+         self.wheel.arm(index, index * 0.05 + 0.01)
+      self.assertEqual(sorted(self.wheel.advance(51.0)), list(range(1020)))
+      self.assertEqual(len(self.wheel), 1028)
+      self.assertEqual(len(self.wheel.advance(500.0)), 1028)
+
+   def testCancel(self):
+      self.wheel.arm("a", 1.0)
+      self.wheel.arm("b", 1.0)
+      self.wheel.cancel("a")
+      self.wheel.cancel("missing")
+      self.assertFalse(self.wheel.isArmed("a"))
+      self.assertEqual(self.expireUntil(2.0), {"b": 1.0})
+
+   def testCancelAcrossRevolutions(self):
+      self.wheel.arm("later", 61.2)
+      self.expireUntil(60.0)
+      self.wheel.cancel("later")
+      self.assertEqual(self.wheel.advance(100.0), [])
+
+   def testArmingAgainMovesTheTimer(self):
+      self.wheel.arm("a", 1.0)
+      self.wheel.arm("a", 3.0)
+      self.assertEqual(len(self.wheel), 1)
+      self.assertEqual(self.wheel.advance(2.0), [])
+      self.assertEqual(self.wheel.advance(3.0), ["a"])
+
+   def testPastDueFiresOnNextTick(self):
+      self.wheel.advance(5.0)
+      self.wheel.arm("late", 1.0)
+      self.assertEqual(self.wheel.advance(5.0), [])
+      self.assertEqual(self.wheel.advance(5.1), ["late"])
+
+   def testNextDue(self):
+      self.assertEqual(self.wheel.nextDue(), None)
+      self.wheel.arm("a", 2.0)
+      self.wheel.arm("b", 0.5)
+      self.assertAlmostEqual(self.wheel.nextDue(), 0.5)
+      self.wheel.cancel("b")
+      self.assertAlmostEqual(self.wheel.nextDue(), 2.0)
+
+   def testTimeGoingBackFiresNothing(self):
+      self.wheel.arm("a", 10.0)
+      self.wheel.advance(5.0)
+      self.assertEqual(self.wheel.advance(1.0), [])
+      self.assertTrue(self.wheel.isArmed("a"))
+
+class ClockTest(unittest.TestCase):
+
+   def testNeverGoesBack(self):
+      last = clock.monotonic()
+      for index in range(1000):
+         now = clock.monotonic()
+         self.assertTrue(now >= last)
+         last = now
+
+   def testWallFallbackIgnoresStepsBack(self):
+      wall = [100.0]
+      class FakeTime:
+         def time(self):
+            return wall[0]
+      real = clock.time
+      state = list(clock.wallState)
+      clock.time = FakeTime()
+      try:
+         clock.wallState[:] = [100.0, 0.0]
+         wall[0] = 101.0
+         self.assertEqual(clock.wallMonotonic(), 1.0)
+         wall[0] = 50.0 # Clock set back
+         self.assertEqual(clock.wallMonotonic(), 1.0)
+         wall[0] = 52.5
+         self.assertEqual(clock.wallMonotonic(), 3.5)
+      finally:
+         clock.time = real
+         clock.wallState[:] = state
+
+if __name__ == "__main__":
+   unittest.main()
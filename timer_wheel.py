@@ -0,0 +1,114 @@
+# Author:     Kevin Koshiol
+# Filename:   timer_wheel.py
+# Date:       10/17/2026
+# Class:      440
+
+'''
+This file contains my TimerWheel class, the hashed timing wheel which keeps
+Server's timers: registration deadlines, idle keepalives, write stalls,
+throttled reads and link retries.
+'''
+
+import math
+
+class TimerWheel:
+   '''
+   TimerWheel is a ring of slots, one per tick; a timer is kept in the slot
+   of the tick it is due, whichever revolution that is in. Arming and
+   cancelling a timer cost a couple of dict operations however many timers
+   are armed, and advancing the wheel only visits the slots of the ticks
+   which have passed. Timers fire up to one tick late, never early.
+   Timers are identified by keys; arming a key again moves its timer.
+   Typical use:
+      wheel.arm(("idle", clientID), now + 60)
+      events = poll(wheel.nextDue() - now)
+      for key in wheel.advance(now):
+         ...
+   '''
+
+   def __init__(self, now, tick=0.05, slots=1024):
+      '''
+      Constructor: Sets up an empty wheel.
+      Arguments:
+      -now[float]: Current time, on the clock timers will be armed with
+      -tick[float](optional): Seconds per slot; the timers' resolution
+      -slots[int](optional): Number of slots; timers due within one
+      revolution (tick * slots seconds) are never looked at early
+      '''
+      self.__tick = float(tick)
+      # Every slot maps its timers' keys to the ticks they are due
+      self.__slots = [{} for index in range(slots)]
+      self.__slotOf = {} # key: Timer key; Value: index of its slot
+      self.__current = int(now / self.__tick) # Last tick advanced past
+
+   def __len__(self):
+      '''Returns number of armed timers'''
+      return len(self.__slotOf)
+
+   def arm(self, key, due):
+      '''
+      Arms a timer, or moves it if its key is armed already.
+      Arguments:
+      -key[object]: Hashable key identifying the timer
+      -due[float]: Time the timer is due
+      '''
+      tick = max(int(math.ceil(due / self.__tick)), self.__current + 1)
+      index = tick % len(self.__slots)
+      old = self.__slotOf.get(key)
+      if old is not None:
+         del self.__slots[old][key]
+      self.__slots[index][key] = tick
+      self.__slotOf[key] = index
+
+   def cancel(self, key):
+      '''
+      Cancels a timer; nothing happens if it is not armed.
+      Argument key[object]: Key of the timer
+      '''
+      index = self.__slotOf.pop(key, None)
+      if index is not None:
+         del self.__slots[index][key]
+
+   def isArmed(self, key):
+      '''Returns whether a timer is armed'''
+      return key in self.__slotOf
+
+   def advance(self, now):
+      '''
+      Moves the wheel on to the current time, disarming expired timers.
+      Every slot is visited at most once, however long it has been.
+      Argument now[float]: Current time
+      Returns [list]: Keys of the expired timers
+      '''
+      target = int(now / self.__tick)
+      if target <= self.__current:
+         return []
+      slots = self.__slots
+      count = len(slots)
+      expired = []
+      for tick in range(max(self.__current + 1, target - count + 1),
+            target + 1):
+         slot = slots[tick % count]
+         if slot:
+            due = [key for key, when in slot.items() if when <= target]
+            for key in due:
+               del slot[key]
+               del self.__slotOf[key]
+            expired.extend(due)
+      self.__current = target
+      return expired
+
+   def nextDue(self):
+      '''
+      Returns [float]: Time the next slot holding timers is due, which is no
+      later than the earliest timer (a slot may hold timers of a later
+      revolution); None if no timer is armed
+      '''
+      if not self.__slotOf:
+         return None
+      slots = self.__slots
+      count = len(slots)
+      tick = self.__current + 1
+      while not slots[tick % count]:
+         tick += 1
+      return tick * self.__tick